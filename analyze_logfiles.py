@@ -0,0 +1,144 @@
+'''
+    Offline analysis of archived logfiles. The end of run analysis of dut_monitor (statistics, crash detection and
+    value-change checks) is run on each logfile, in a pool of processes, using a profile-like spec of the items:
+
+    python analyze_logfiles.py logfiles/ 'archive/logfile_15.1.1.*.log' --profile spec.json --utility snmp_monitor
+
+    spec.json: {"statistics": ["hm2DiagCpuUtilization.0"], "detect_crashes": "sysUpTime.0", "check_values_change": ["ifMauType.4.1"]}
+
+    A report is written for each logfile, plus a combined report of all the logfiles. The logfiles are not modified,
+    unless --in-place is used, in which case the results are appended to them like at the end of a live run.
+    If the sample store of a run (<logfile>.samples.db) exists, the values are loaded from it instead of parsing the logfile.
+'''
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from glob import glob
+from json import loads as json_loads
+from os import cpu_count, makedirs
+from os.path import dirname, realpath, isdir, isfile, basename, getsize
+from time import perf_counter
+import sys
+sys.path.append(f"{dirname(realpath(__file__))}/submodules")
+from monitor_utils import monitor_utils
+
+
+def find_logfiles(paths: list, utility: str) -> list:
+    '''Returns the logfiles matched by the paths: directories (their logfiles of the utility) or glob patterns.'''
+
+    prefix = monitor_utils.UTILITY_SETTINGS[utility]['logfile_prefix']
+    logfiles = []
+    for path in paths:
+        if isdir(path):
+            matches = [match for match in glob(f"{path}/{prefix}*.log")
+                       if not basename(match).startswith('logfile_dut_monitor_') and
+                          (prefix == 'logfile_cli_' or not basename(match).startswith('logfile_cli_'))]
+        else:
+            matches = glob(path)
+        logfiles.extend(match for match in sorted(matches) if isfile(match) and not match.endswith('.report.log'))
+    return list(dict.fromkeys(logfiles))
+
+
+def analyze(logfile_path: str, profile: dict, output_dir: str, backend: str = None) -> dict:
+    '''
+    Runs the analysis of a single logfile, in a process of the pool. The results are written to the report of the logfile
+    (or appended to the logfile if output_dir is None). Returns a summary of the results.
+    '''
+    report_path = f"{output_dir}/{basename(logfile_path)[:-len('.log')]}.report.log" if output_dir else logfile_path
+    store_path = logfile_path[:-len('.log')] + '.samples.db'
+    summary = {'logfile': logfile_path, 'report': report_path, 'error': None}
+    start = perf_counter()
+    try:
+        if output_dir:
+            with open(report_path, 'w', encoding='utf-8') as report:
+                report.write(f"Analysis of {logfile_path}, generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            utils = monitor_utils(report_path=report_path, backend=backend)
+        else:
+            utils = monitor_utils(backend=backend)
+        offset = getsize(report_path)
+        utils.analyze_logfile(logfile_path=logfile_path, profile=profile, store_path=store_path if isfile(store_path) else None)
+        with open(report_path, 'r', encoding='utf-8') as report:
+            report.seek(offset)
+            results = report.read()
+    except Exception as e:
+        summary['error'] = str(e)
+        return summary
+    summary['samples'] = sum(len(series) for series in utils.parsed_items_dict.values())
+    summary['crashes'] = results.count('CRASH detected')
+    summary['value_changes'] = results.count('A change in value')
+    summary['errors'] = results.count('ERROR :')
+    summary['seconds'] = perf_counter() - start
+    return summary
+
+
+def write_combined_report(path: str, summaries: list, profile: dict) -> None:
+
+    summaries = sorted(summaries, key=lambda summary: summary['logfile'])
+    failed = [summary for summary in summaries if summary['error']]
+    analyzed = [summary for summary in summaries if not summary['error']]
+    logs = f"Combined analysis report, generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+    logs += f"Profile: {profile}\n"
+    logs += f"Logfiles analyzed: {len(analyzed)}, failed: {len(failed)}\n"
+    logs += f"Logfiles with crashes: {sum(1 for summary in analyzed if summary['crashes'])}, " \
+            f"with value changes: {sum(1 for summary in analyzed if summary['value_changes'])}\n\n"
+    for summary in analyzed:
+        logs += f"{summary['logfile']}: {summary['crashes']} crash(es) detected, {summary['value_changes']} value change(s), " \
+                f"{summary['errors']} error message(s), {summary['samples']} samples. Report: {summary['report']}\n"
+    for summary in failed:
+        logs += f"{summary['logfile']}: ERROR: analysis failed: {summary['error']}\n"
+    with open(path, 'w', encoding='utf-8') as report:
+        report.write(logs)
+
+
+def main(arguments: list = None) -> int:
+
+    parser = ArgumentParser(description='Runs the end of run analysis of dut_monitor on archived logfiles.')
+    parser.add_argument('paths', nargs='+', help='directories containing logfiles, or glob patterns of logfiles')
+    parser.add_argument('--profile', required=True,
+                        help="profile-like spec of the items, as JSON or the path to a JSON file: "
+                             "{'statistics': [...], 'detect_crashes': '...', 'check_values_change': [...]}")
+    parser.add_argument('--utility', choices=list(monitor_utils.UTILITY_SETTINGS), default=None,
+                        help="the utility (worker type) that wrote the logfiles. Default: the 'utility' of the profile, or snmp_monitor")
+    parser.add_argument('--output', default=f"{dirname(realpath(__file__))}/logfiles/reports",
+                        help='the directory of the reports. Default: logfiles/reports')
+    parser.add_argument('--in-place', action='store_true', help='append the results to the logfiles instead of writing a report per logfile')
+    parser.add_argument('--backend', choices=['numpy'], default=None,
+                        help='compute the analysis with the NumPy backend of monitor_utils (requires numpy)')
+    parser.add_argument('--processes', type=int, default=cpu_count() or 1, help='the number of processes of the pool. Default: one per CPU')
+    args = parser.parse_args(arguments)
+
+    if isfile(args.profile):
+        with open(args.profile, 'r', encoding='utf-8') as file:
+            profile = json_loads(file.read())
+    else:
+        profile = json_loads(args.profile)
+    profile['utility'] = args.utility or profile.get('utility', 'snmp_monitor')
+    if profile['utility'] not in monitor_utils.UTILITY_SETTINGS:
+        print(f"ERROR: unknown utility {profile['utility']}")
+        return 1
+
+    logfiles = find_logfiles(args.paths, profile['utility'])
+    if not logfiles:
+        print('ERROR: no logfiles found')
+        return 1
+    makedirs(args.output, exist_ok=True)
+    output_dir = None if args.in_place else args.output
+
+    start = perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=max(args.processes, 1)) as executor:
+        futures = [executor.submit(analyze, logfile, profile, output_dir, args.backend) for logfile in logfiles]
+        for number, future in enumerate(as_completed(futures), start=1):
+            summary = future.result()
+            summaries.append(summary)
+            status = f"ERROR: {summary['error']}" if summary['error'] else f"{summary['crashes']} crash(es), {summary['value_changes']} value change(s)"
+            print(f"[{number}/{len(logfiles)}] {summary['logfile']}: {status}")
+
+    combined_report_path = f"{args.output}/combined_report_{datetime.now().strftime('%d_%b_%Y_%H_%M_%S')}.log"
+    write_combined_report(combined_report_path, summaries, profile)
+    print(f"{len(logfiles)} logfiles analyzed in {perf_counter() - start:.1f} seconds. Combined report: {combined_report_path}")
+    return 1 if any(summary['error'] for summary in summaries) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
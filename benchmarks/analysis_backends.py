@@ -0,0 +1,74 @@
+'''
+    Benchmark of the analysis methods of monitor_utils: the pure Python implementation vs. the NumPy backend
+    (monitor_utils(backend='numpy')), on series of 10M samples by default. The reports of both are checked to be the same.
+    Usage: python benchmarks/analysis_backends.py [samples]
+'''
+from array import array
+from time import perf_counter
+from os.path import dirname, realpath
+import sys
+sys.path.append(f"{dirname(realpath(__file__))}/../submodules")
+import numpy as np
+from monitor_utils import monitor_utils
+from item_series import item_series
+
+
+class report_collector(monitor_utils):
+    '''monitor_utils which keeps the reports in memory instead of appending them to a logfile.'''
+
+    def _write_to_file_hlp(self, logfile_path: str, mode: str, content: str) -> None:
+        self.reports.append(content)
+
+
+def build_series(values: np.ndarray, errors: np.ndarray, start: float = 1.7e9) -> item_series:
+    '''Builds an item_series with integral values, one sample per second, directly from its columns.'''
+
+    series = item_series()
+    series.timestamps = array('d', (start + np.arange(values.size, dtype=np.float64)).tobytes())
+    series.values = array('q', values.astype(np.int64).tobytes())
+    series.errors = bytearray(np.packbits(errors, bitorder='little').tobytes())
+    series.encoded = bytearray(len(series.errors))
+    return series
+
+
+def build_items(samples: int) -> dict:
+
+    generator = np.random.default_rng(1)
+    errors = generator.random(samples) < 0.001
+    # uptime in timeticks, with a reboot every ~1M samples
+    uptime = (np.arange(samples) % 1_000_003) * 100 + 6000
+    # a CPU utilization, and a state which changes rarely
+    cpu = generator.integers(0, 100, samples)
+    state = np.cumsum(generator.random(samples) < 0.0001) % 4
+    return {'sysUpTime.0': build_series(uptime, errors), 'cpu.0': build_series(cpu, errors), 'state.0': build_series(state, errors)}
+
+
+def run(items: dict, **kwargs) -> tuple:
+    '''Returns ({analysis: seconds}, reports) of the analysis of the items.'''
+
+    utils = report_collector(**kwargs)
+    utils.reports = []
+    utils.parsed_items_dict.update(items)
+    timings = {}
+    start = perf_counter()
+    utils.generate_statistics(logfile_path='', item_list=['cpu.0', 'state.0'], worker_type='BENCHMARK', percentiles=(50, 90, 99))
+    timings['generate_statistics'] = perf_counter() - start
+    start = perf_counter()
+    utils.crash_detector(logfile_path='', uptime_item='sysUpTime.0', worker_type='BENCHMARK')
+    timings['crash_detector'] = perf_counter() - start
+    start = perf_counter()
+    utils.get_item_value_change(logfile_path='', item_list=['state.0'], worker_type='BENCHMARK')
+    timings['get_item_value_change'] = perf_counter() - start
+    return timings, utils.reports
+
+
+if __name__ == '__main__':
+    samples = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10_000_000
+    items = build_items(samples)
+    print(f'{samples} samples per item')
+    numpy_timings, numpy_reports = run(items, backend='numpy')
+    python_timings, python_reports = run(items)
+    for analysis in python_timings:
+        print(f'{analysis:22s} python: {python_timings[analysis]:8.2f} s   numpy: {numpy_timings[analysis]:8.2f} s   '
+              f'speedup: {python_timings[analysis] / numpy_timings[analysis]:6.1f}x')
+    print(f'same reports: {python_reports == numpy_reports}')
@@ -0,0 +1,151 @@
+'''
+    Console (CLI) simulator of a DUT, for console_monitor. It runs on its standard input/output, so the profile's 'dut'
+    command that console_monitor spawns (in a pty) is the simulator itself:
+
+    {'dut': 'python3 benchmarks/console_simulator.py SIM-1', 'utility': 'console_monitor', ...}
+
+    Like a ser2net connection, it prints 'Connected to ...' and waits. It then asks for the login (User:, Password:),
+    has a pre-enable (SIM-1)> and an enable (SIM-1)# prompt, and answers the 'show system info' and
+    'show system resources' commands with dotted tables, paged with '--More-- or (q)uit'. 'cli numlines <n>' sets the
+    number of lines of a page (0: no paging).
+    Latency, missing values (errors) and a crash (uptime reset) can be injected, see the options.
+'''
+from argparse import ArgumentParser
+from random import Random
+from time import monotonic, sleep
+import sys
+
+USERNAME, PASSWORD = 'admin', 'private'
+
+
+class cli_simulator():
+    '''
+        The CLI of a simulated DUT.
+        :latency: the delay of the command outputs, in seconds
+        :error_rate: the probability that a value line is missing from a command output
+        :page_lines: the number of lines of an output page
+        :crash_after: the uptime is reset after this number of seconds, like after a reboot
+    '''
+
+    def __init__(self, name: str, latency: float = 0, error_rate: float = 0, page_lines: int = 20,
+                 crash_after: float = None, seed: int = 0) -> None:
+
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.page_lines = page_lines
+        self.crash_after = crash_after
+        self.random = Random(seed)
+        self.start = monotonic()
+        self.drifting = {'Current temperature': [20, 60, 41], 'Current humidity': [10, 90, 30], 'CPU utilization': [0, 100, 20],
+                         'Free RAM': [100000, 400000, 250000], 'Network CPU interface utilization average': [0, 100, 5]}
+
+    def _drift_hlp(self, label: str) -> int:
+        '''Helper method. Returns the next value of a drifting value.'''
+
+        minimum, maximum, current = self.drifting[label]
+        self.drifting[label][2] = min(max(current + self.random.randint(-2, 2), minimum), maximum)
+        return self.drifting[label][2]
+
+    def uptime(self) -> str:
+        '''Returns the uptime timestring: <days> days, <hours>:<minutes>:<seconds>'''
+
+        now = monotonic()
+        if self.crash_after is not None and now - self.start > self.crash_after:
+            self.start, self.crash_after = now, None
+        seconds = int(now - self.start) + 3600
+        return f"{seconds // 86400} days, {seconds % 86400 // 3600}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+
+    def command_output(self, command: str):
+        '''Returns the lines of the output of a command, or None if the command is unknown.'''
+
+        if command == 'show system info':
+            values = [('System Description', f'{self.name} Simulated DUT'), ('System name', self.name),
+                      ('System location', 'Benchmark rack'), ('System contact', 'Benchmark'),
+                      ('System uptime', self.uptime()), ('System date and time (local time zone)', '2024-01-01 00:00:00'),
+                      ('Operating hours', str(1000 + int(monotonic() - self.start) // 3600))]
+            values += [(f'Power supply P{index} state', 'present') for index in range(1, 3)]
+            values += [(f'Fan {index} state', 'available') for index in range(1, 5)]
+            values += [(f'Module {index} description', 'Simulated module') for index in range(1, 9)]
+            values += [('Current temperature', str(self._drift_hlp('Current temperature'))),
+                       ('Current humidity', str(self._drift_hlp('Current humidity')))]
+        elif command == 'show system resources':
+            values = [('CPU utilization', f"{self._drift_hlp('CPU utilization')}%"), ('Free RAM', f"{self._drift_hlp('Free RAM')} kBytes"),
+                      ('Allocated RAM', '512000 kBytes'),
+                      ('Network CPU interface utilization average', f"{self._drift_hlp('Network CPU interface utilization average')}%")]
+        else:
+            return None
+        return ['', *(f"{label}{'.' * max(45 - len(label), 2)}{value}" for label, value in values
+                      if not (self.error_rate and self.random.random() < self.error_rate))]
+
+    def run(self, stdin, stdout) -> None:
+        '''Runs the CLI session on the streams until they are closed. Each input line is a command.'''
+
+        write = lambda text: (stdout.write(text), stdout.flush())
+        write(f"Connected to {self.name}.\n")
+        if stdin.readline() == '':
+            return
+        # login
+        while True:
+            write('User:')
+            username = stdin.readline()
+            write('Password:')
+            password = stdin.readline()
+            if username == '' or password == '':
+                return
+            if username.strip() == USERNAME and password.strip() == PASSWORD:
+                break
+            write('\nAccess denied\n')
+        prompt = f'\n({self.name})>'
+        write(prompt)
+        while True:
+            line = stdin.readline()
+            if line == '':
+                return
+            command = line.strip()
+            if command == 'enable':
+                prompt = f'\n({self.name})#'
+            elif command.startswith('cli numlines ') and command[13:].isdigit():
+                self.page_lines = int(command[13:])
+            elif command in ('exit', 'logout'):
+                if prompt.endswith('>'):
+                    return
+                prompt = f'\n({self.name})>'
+            elif command:
+                lines = self.command_output(command) if prompt.endswith('#') else None
+                if lines is None:
+                    write(f"\n% Invalid command '{command}'")
+                else:
+                    if self.latency:
+                        sleep(self.latency)
+                    page_lines = self.page_lines or len(lines)
+                    for start in range(0, len(lines), page_lines):
+                        write('\n'.join(lines[start:start + page_lines]))
+                        if start + page_lines >= len(lines):
+                            break
+                        write('\n--More-- or (q)uit')
+                        answer = stdin.readline()
+                        if answer == '':
+                            return
+                        if answer.strip() == 'q':
+                            break
+                        write('\n')
+            write(prompt)
+
+
+def main(arguments: list = None) -> None:
+
+    parser = ArgumentParser(description='Console (CLI) simulator of a DUT, running on the standard input/output.')
+    parser.add_argument('name', nargs='?', default='SIM-1', help='the name of the DUT, shown in its prompt. Default: SIM-1')
+    parser.add_argument('--latency', type=float, default=0, help='the delay of the command outputs, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='the probability that a value is missing from an output')
+    parser.add_argument('--page-lines', type=int, default=20, help='the number of lines of an output page. Default: 20')
+    parser.add_argument('--crash-after', type=float, default=None, help='reset the uptime after this number of seconds')
+    args = parser.parse_args(arguments)
+
+    cli_simulator(args.name, latency=args.latency, error_rate=args.error_rate, page_lines=args.page_lines,
+                  crash_after=args.crash_after).run(sys.stdin, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+'''
+    Benchmark harness driving dut_monitor with a fleet of simulated DUTs: SNMP DUTs served by snmp_simulator.py
+    (in its own process, so its CPU time is not counted) or console DUTs, each one a console_simulator.py process
+    spawned by its console_monitor worker. Reports the iterations per second, the CPU time and memory (RSS) of the
+    monitoring process (and of its worker processes, see --processes), the request latencies and errors (worker metrics)
+    and the duration of the end of run analysis.
+    Usage: python benchmarks/fleet.py [--duts 50] [--utility async_snmp_monitor] [--duration 30] [--interval 1] ...
+'''
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime, timedelta
+from os import remove, devnull, environ, pathsep, chdir, dup, dup2, close, sysconf
+from os.path import dirname, realpath, isfile
+from resource import getrusage, RUSAGE_SELF
+from subprocess import Popen, PIPE
+from time import sleep
+import sys
+sys.path.append(f"{dirname(realpath(__file__))}/..")
+sys.path.append(f"{dirname(realpath(__file__))}/../submodules")
+from dut_monitor import dut_monitor
+from snmp_simulator import DEFAULT_OIDS
+
+BENCHMARKS_DIR = dirname(realpath(__file__))
+# the monitored items of the SNMP DUTs: the numeric OIDs of the simulated items, so no MIB is needed
+SNMP_ITEMS = {name: oid for name, (oid, _, _) in DEFAULT_OIDS.items()}
+CONSOLE_ITEMS = [('show system info', 'System Description'), ('show system info', 'System uptime'),
+                 ('show system info', 'Operating hours'), ('show system info', 'Current temperature'),
+                 ('show system info', 'Current humidity'), ('show system resources', 'CPU utilization'),
+                 ('show system resources', 'Free RAM'), ('show system resources', 'Network CPU interface utilization average')]
+# the items whose value doesn't change, polled every --static-interval seconds
+STATIC_ITEMS = [SNMP_ITEMS['sysDescr.0'], SNMP_ITEMS['sysName.0'], SNMP_ITEMS['ifMauType.4.1'], 'System Description', 'Operating hours']
+
+
+def rss(pid: str = 'self') -> int:
+    '''Returns the resident set size of a process, in bytes (Linux).'''
+
+    with open(f'/proc/{pid}/statm', 'r') as statm:
+        return int(statm.read().split()[1]) * 4096
+
+
+def cpu_seconds(pid: str = 'self') -> float:
+    '''Returns the CPU time (user + system) of a process, in seconds (Linux).'''
+
+    if pid == 'self':
+        usage = getrusage(RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    with open(f'/proc/{pid}/stat', 'r') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / sysconf('SC_CLK_TCK')
+
+
+def worker_pids(monitor) -> list:
+    '''Returns the pids of the monitoring processes: the harness and the worker processes of the dut_monitor, if any.'''
+
+    return ['self'] + ([shard.process.pid for shard in monitor.supervisor.shards] if monitor.supervisor else [])
+
+
+def snmp_profiles(args) -> tuple:
+    '''Starts the SNMP simulator process. Returns (profiles, simulator process).'''
+
+    command = [sys.executable, f'{BENCHMARKS_DIR}/snmp_simulator.py', '--port', str(args.port), '--count', str(args.duts),
+               '--latency', str(args.latency), '--jitter', str(args.jitter), '--drop-rate', str(args.drop_rate),
+               '--error-rate', str(args.error_rate), '--ports', str(args.ports)]
+    if args.crash_after is not None:
+        command += ['--crash-after', str(args.crash_after)]
+    simulator = Popen(command, stdout=PIPE, text=True)
+    ready = simulator.stdout.readline()
+    if not ready.startswith('ready'):
+        simulator.kill()
+        raise RuntimeError('The SNMP simulator failed to start')
+    profiles = [{'dut': f'127.0.0.1:{args.port + index}', 'utility': args.utility, 'snmp_settings': 'v2c_settings',
+                 'items': list(SNMP_ITEMS.values()), 'interval': args.interval, 'timeout': args.duration,
+                 'statistics': [SNMP_ITEMS[name] for name in ('hm2DiagCpuUtilization.0', 'hm2DiagMemoryRamFree.0',
+                                                              'hm2PoeMgmtModuleDeliveredPower.1.1')],
+                 'check_values_change': [SNMP_ITEMS['ifMauType.4.1'], SNMP_ITEMS['sysDescr.0']],
+                 'detect_crashes': SNMP_ITEMS['sysUpTime.0']} for index in range(args.duts)]
+    if args.ports:
+        # the interface table of the DUTs is walked: a series per port and column
+        for profile in profiles:
+            profile['tables'] = ['ifHCInOctets', 'ifOperStatus']
+            profile['statistics'].append('ifHCInOctets')
+            profile['check_values_change'].append('ifOperStatus')
+    return static_intervals(profiles, args), simulator
+
+
+def console_profiles(args) -> list:
+    '''Returns the profiles of the console DUTs. Each 'dut' command is a console simulator, spawned by its worker.'''
+
+    options = f' --latency {args.latency}' if args.latency else ''
+    options += f' --error-rate {args.error_rate}' if args.error_rate else ''
+    options += f' --crash-after {args.crash_after}' if args.crash_after is not None else ''
+    # the command is relative, so the logfile names (derived from the 'dut' command) contain no directory
+    profiles = [{'dut': f'python3 console_simulator.py SIM-{index + 1}{options}', 'utility': 'console_monitor',
+                 'items': CONSOLE_ITEMS, 'interval': args.interval, 'timeout': args.duration,
+                 'statistics': ['Current temperature', 'CPU utilization', 'Free RAM'],
+                 'check_values_change': ['System Description', 'Operating hours'],
+                 'detect_crashes': 'System uptime', 'prompt_sync': args.prompt_sync} for index in range(args.duts)]
+    return static_intervals(profiles, args)
+
+
+def static_intervals(profiles: list, args) -> list:
+    '''Polls the static items of the profiles every --static-interval seconds, if it is set.'''
+
+    if args.static_interval:
+        for profile in profiles:
+            names = [item if isinstance(item, str) else item[1] for item in profile['items']]
+            profile['item_intervals'] = {name: args.static_interval for name in names if name in STATIC_ITEMS}
+    return profiles
+
+
+def main(arguments: list = None) -> int:
+
+    parser = ArgumentParser(description='Runs dut_monitor against simulated DUTs and reports its throughput and resource usage.')
+    parser.add_argument('--duts', type=int, default=50, help='the number of simulated DUTs. Default: 50')
+    parser.add_argument('--utility', choices=['async_snmp_monitor', 'snmp_monitor', 'console_monitor'], default='async_snmp_monitor')
+    parser.add_argument('--duration', type=float, default=30, help='the monitoring time, in seconds. Default: 30')
+    parser.add_argument('--interval', type=float, default=1, help='the polling interval, in seconds. Default: 1')
+    parser.add_argument('--port', type=int, default=16100, help='the port of the first SNMP DUT. Default: 16100')
+    parser.add_argument('--latency', type=float, default=0.005, help='the response latency of the DUTs, in seconds. Default: 0.005')
+    parser.add_argument('--jitter', type=float, default=0.002, help='a random delay added to the SNMP latency, in seconds')
+    parser.add_argument('--drop-rate', type=float, default=0, help='the probability that a SNMP request is not answered')
+    parser.add_argument('--error-rate', type=float, default=0, help='the probability that a value is answered with an error')
+    parser.add_argument('--crash-after', type=float, default=None, help='the DUTs crash (uptime reset) after this number of seconds')
+    parser.add_argument('--ports', type=int, default=0, help='the SNMP DUTs have an interface table of this many ports, which is walked')
+    parser.add_argument('--static-interval', type=float, default=None, help='poll the static items (sysDescr.0, ...) every this many seconds')
+    parser.add_argument('--prompt-sync', action='store_true', help='the console workers use the prompt-synchronized CLI')
+    parser.add_argument('--processes', type=int, default=None, help='spread the workers over this number of worker processes (0: one per CPU)')
+    parser.add_argument('--keep-logfiles', action='store_true', help="don't delete the logfiles and sample stores of the run")
+    args = parser.parse_args(arguments)
+
+    simulator = None
+    if args.utility == 'console_monitor':
+        profiles = console_profiles(args)
+        # the console simulators are spawned from the benchmarks directory, by the interpreter running the harness
+        environ['PATH'] = dirname(sys.executable) + pathsep + environ.get('PATH', '')
+        chdir(BENCHMARKS_DIR)
+    else:
+        profiles, simulator = snmp_profiles(args)
+
+    rss_start, cpu_start = rss(), cpu_seconds()
+    # the workers print a line per iteration: the standard output of the process and of its worker processes is discarded
+    sys.stdout.flush()
+    stdout = dup(1)
+    with open(devnull, 'w') as null:
+        dup2(null.fileno(), 1)
+    try:
+        monitor = dut_monitor(monitor_map=profiles, processes=args.processes)
+        monitor.run()
+        polling_end = monitor.start_time + timedelta(seconds=args.duration)
+        # the resources are sampled just before the end of the monitoring, when the analysis did not start yet
+        sleep(max((polling_end - datetime.now()).total_seconds() - min(args.interval, 1), 0))
+        pids = worker_pids(monitor)
+        cpu_polling = sum(cpu_seconds(pid) for pid in pids) - cpu_start
+        rss_polling = sum(rss(pid) for pid in pids)
+        metrics = monitor.get_metrics()
+        monitor.join_workers(dut='all')
+        analysis_seconds = (datetime.now() - polling_end).total_seconds()
+        polling_seconds = (polling_end - monitor.start_time).total_seconds() - min(args.interval, 1)
+    finally:
+        sys.stdout.flush()
+        dup2(stdout, 1)
+        close(stdout)
+        if simulator:
+            simulator.kill()
+
+    iterations = sum(snapshot['iterations']['count'] for snapshot in metrics.values())
+    requests = [histogram for snapshot in metrics.values() for histogram in snapshot['requests'].values()]
+    request_count = sum(histogram['count'] for histogram in requests)
+    print(f"DUTs: {args.duts} ({args.utility}), interval: {args.interval} s, monitored for {args.duration} s, "
+          f"worker processes: {len(pids) - 1}")
+    print(f"iterations/s: {iterations / polling_seconds:.1f} (expected: {args.duts / args.interval:.1f}), "
+          f"missed iterations: {sum(snapshot['missed_iterations'] for snapshot in metrics.values())}")
+    print(f"item requests: {request_count}, mean latency: "
+          f"{sum(histogram['sum'] for histogram in requests) / max(request_count, 1) * 1000:.2f} ms, "
+          f"item errors: {sum(snapshot['counters'].get('item_errors', 0) for snapshot in metrics.values())}")
+    print(f"CPU: {cpu_polling:.2f} s ({cpu_polling / polling_seconds * 100:.1f}% of a core), "
+          f"RSS: {rss_polling / 2**20:.1f} MiB (+{(rss_polling - rss_start) / 2**20:.1f} MiB while polling)")
+    print(f"DUT health: {', '.join(f'{state}: {count}' for state, count in Counter(snapshot.get('health') for snapshot in metrics.values()).items())}, "
+          f"probes: {sum(snapshot['counters'].get('probes', 0) for snapshot in metrics.values())}")
+    print(f"end of run analysis: {analysis_seconds:.2f} s, crashes detected: {len(monitor.crashes)}")
+    if monitor.report_paths:
+        summary = monitor.get_fleet_summary()
+        print(f"fleet report: {monitor.report_paths[0]} ({len(summary['items'])} statistics items, "
+              f"{len(summary['crashes']['duts'])} DUTs with crashes, {summary['value_changes']['total']} value changes)")
+
+    if not args.keep_logfiles:
+        for subscription in monitor.workers.values():
+            for path in (subscription.logfile_path, subscription.store_path):
+                for file in (path, path + '-wal', path + '-shm'):
+                    if isfile(file):
+                        remove(file)
+        for path in monitor.report_paths or ():
+            remove(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+'''
+    Benchmark of monitor_utils.parse_logfile() on a large synthetic logfile: sequential parsing vs. the parallel,
+    memory-mapped parsing, with an increasing number of processes. The parsed series are checked to be the same.
+    Usage: python benchmarks/parse_logfile.py [size_in_MB] [max_processes]
+'''
+from datetime import datetime, timedelta
+from time import perf_counter
+from tempfile import TemporaryDirectory
+from os import cpu_count
+from os.path import dirname, realpath, getsize
+import sys
+sys.path.append(f"{dirname(realpath(__file__))}/../submodules")
+from monitor_utils import monitor_utils
+
+ITEMS = ['sysUpTime.0', 'hm2DiagCpuUtilization.0', 'hm2DiagMemoryRamFree.0', 'hm2LogTempMaximum.0', 'ifMauType.4.1',
+         'hm2PoeMgmtModuleDeliveredPower.1.1']
+
+
+def generate_logfile(path: str, size: int) -> None:
+    '''Writes an snmp_monitor-like logfile of about 'size' bytes, with one iteration per second.'''
+
+    start = datetime(2024, 1, 1)
+    with open(path, 'w', encoding='utf-8') as logfile:
+        iteration = 0
+        while logfile.tell() < size:
+            timestamp = (start + timedelta(seconds=iteration)).strftime('%Y-%m-%d %H:%M:%S') + ',000 | '
+            lines = [timestamp + 50*'#' + f" Iteration number #{iteration + 1} started " + 50*'#']
+            for index, item in enumerate(ITEMS):
+                if (iteration + index) % 97 == 0:
+                    lines.append(timestamp + f'ITEM: {item} query result: ERROR: Timeout')
+                elif item == 'ifMauType.4.1':
+                    lines.append(timestamp + f'ITEM: {item} query result:  .1.3.6.1.2.1.26.4.{30 + iteration // 1000 % 3}')
+                else:
+                    lines.append(timestamp + f'ITEM: {item} query result:  {100 * iteration + index if item == "sysUpTime.0" else (iteration * 7 + index) % 100}')
+            lines.append(timestamp + 129*'#' + 3*'\n')
+            logfile.write('\n'.join(lines) + '\n')
+            iteration += 1
+
+
+def parse(path: str, processes: int = None) -> tuple:
+    '''Returns (seconds, parsed_items_dict) of parsing the logfile.'''
+
+    settings = monitor_utils.UTILITY_SETTINGS['snmp_monitor']
+    item_dict = {item: settings['check_values_change'] if item == 'ifMauType.4.1' else settings['statistics'] for item in ITEMS}
+    utils = monitor_utils()
+    # the log messages appended by parse_logfile() don't contain query results, so the next runs parse the same samples
+    start = perf_counter()
+    utils.parse_logfile(logfile_path=path, item_dict=item_dict, processes=processes)
+    return perf_counter() - start, utils.parsed_items_dict
+
+
+if __name__ == '__main__':
+    size = int(float(sys.argv[1]) * 2**20) if len(sys.argv) > 1 else 200 * 2**20
+    max_processes = int(sys.argv[2]) if len(sys.argv) > 2 else cpu_count() or 1
+    with TemporaryDirectory() as directory:
+        path = f'{directory}/logfile_benchmark.log'
+        generate_logfile(path, size)
+        print(f'logfile: {getsize(path) / 2**20:.1f} MB, CPUs: {cpu_count()}')
+        seconds, reference = parse(path)
+        samples = sum(len(series) for series in reference.values())
+        print(f'sequential:   {seconds:8.2f} s  ({samples / seconds / 1e6:.2f} M samples/s)')
+        processes = 1
+        while processes <= max_processes:
+            seconds, parsed = parse(path, processes=processes)
+            same = parsed.keys() == reference.keys() and all(list(parsed[item]) == list(reference[item]) for item in reference)
+            print(f'{processes:3d} processes: {seconds:8.2f} s  ({samples / seconds / 1e6:.2f} M samples/s)  same result: {same}')
+            processes *= 2
@@ -0,0 +1,278 @@
+'''
+    Local SNMP (v1/v2c) responder simulating a fleet of DUTs: one UDP port per DUT, all served by a single thread.
+    Each DUT serves the OIDs of DEFAULT_OIDS (or of a JSON file, see load_oids()), with an uptime counting from the start
+    of the simulator and values drifting between iterations. Latency, timeouts (dropped requests), errors and crashes
+    (uptime resets) can be injected. With --ports, each DUT also has an interface table (ifDescr, ifOperStatus, ifHCInOctets ...
+    of IF-MIB) for the table walks (GETNEXT and GETBULK requests), whose last port can disappear (--flap-after).
+    Usage: python benchmarks/snmp_simulator.py [--port 16100] [--count 10] [--latency 0.005] [--error-rate 0.01] ...
+    The DUTs are then 127.0.0.1:16100 ... 127.0.0.1:16109 (profile 'snmp_settings': 'v2c_settings').
+'''
+from argparse import ArgumentParser
+from bisect import bisect_right
+from heapq import heappush, heappop
+from json import load as json_load
+from random import Random
+from selectors import DefaultSelector, EVENT_READ
+from socket import socket, AF_INET, SOCK_DGRAM
+from threading import Thread, Event
+from time import monotonic
+from os.path import dirname, realpath
+import sys
+sys.path.append(f"{dirname(realpath(__file__))}/../submodules")
+import snmp_ber
+from snmp_tables import oid_key
+
+# name: (numeric OID, type, value | (minimum, maximum) of the drifting integer values | None for the uptime).
+# The hm2* OIDs are placeholders under the Hirschmann enterprise arc, the items are polled by their numeric OID
+DEFAULT_OIDS = {'sysDescr.0': ('.1.3.6.1.2.1.1.1.0', 'string', 'Simulated DUT'),
+                'sysUpTime.0': ('.1.3.6.1.2.1.1.3.0', 'timeticks', None),
+                'sysName.0': ('.1.3.6.1.2.1.1.5.0', 'string', 'SIM'),
+                'hm2DiagCpuUtilization.0': ('.1.3.6.1.4.1.248.11.22.1.8.10.1.0', 'integer', (0, 100)),
+                'hm2DiagMemoryRamFree.0': ('.1.3.6.1.4.1.248.11.22.1.8.11.2.0', 'integer', (100000, 400000)),
+                'hm2LogTempMaximum.0': ('.1.3.6.1.4.1.248.11.23.1.1.1.1.0', 'integer', (60, 70)),
+                'hm2LogTempMinimum.0': ('.1.3.6.1.4.1.248.11.23.1.1.1.2.0', 'integer', (-10, 0)),
+                'hm2PoeMgmtModuleDeliveredPower.1.1': ('.1.3.6.1.4.1.248.11.15.1.1.1.1.1.1', 'gauge', (0, 240)),
+                'ifMauType.4.1': ('.1.3.6.1.2.1.26.2.1.1.3.4.1', 'oid', '.1.3.6.1.2.1.26.4.30')}
+
+TYPES = {'integer': snmp_ber.INTEGER, 'gauge': snmp_ber.GAUGE32, 'timeticks': snmp_ber.TIMETICKS,
+         'string': snmp_ber.OCTET_STRING, 'oid': snmp_ber.OBJECT_IDENTIFIER, 'counter64': snmp_ber.COUNTER64}
+
+# the columns of the simulated interface table: name: (numeric OID of the column, type, value | (minimum, maximum))
+# the counters grow by a random increment between minimum and maximum at each request
+INTERFACE_COLUMNS = {'ifDescr': ('.1.3.6.1.2.1.2.2.1.2', 'string', None), 'ifOperStatus': ('.1.3.6.1.2.1.2.2.1.8', 'integer', 1),
+                     'ifInErrors': ('.1.3.6.1.2.1.2.2.1.14', 'integer', (0, 1)),
+                     'ifHCInOctets': ('.1.3.6.1.2.1.31.1.1.1.6', 'counter64', (0, 125000000)),
+                     'ifHCOutOctets': ('.1.3.6.1.2.1.31.1.1.1.10', 'counter64', (0, 125000000))}
+
+
+def interface_oids(ports: int) -> dict:
+    '''Returns the OIDs of an interface table of 'ports' rows (ifIndex 1 ... ports), in the format of DEFAULT_OIDS.'''
+
+    return {f'{name}.{port}': (f'{oid}.{port}', kind, f'Port {port}' if value is None else value)
+            for name, (oid, kind, value) in INTERFACE_COLUMNS.items() for port in range(1, ports + 1)}
+
+
+def load_oids(path: str) -> dict:
+    '''Loads the OIDs served by the DUTs from a JSON file: {name: [numeric_oid, type, value | [minimum, maximum] | null]}.'''
+
+    with open(path, 'r') as file:
+        return {name: (oid, kind, tuple(value) if isinstance(value, list) else value) for name, (oid, kind, value) in json_load(file).items()}
+
+
+class simulated_dut():
+    '''The values served by one simulated DUT.'''
+
+    def __init__(self, name: str, oids: dict, seed: int, crash_after: float = None, ports: int = 0, flap_after: float = None) -> None:
+
+        self.name = name
+        self.random = Random(seed)
+        self.start = monotonic()
+        self.crash_after = crash_after # seconds after which the uptime is reset once, like after a reboot
+        self.values = {}               # {numeric OID: (tag, value | [minimum, maximum, current])}
+        for item, (oid, kind, value) in (oids | interface_oids(ports)).items():
+            if isinstance(value, tuple):
+                value = [value[0], value[1], self.random.randint(*value)]
+            elif item == 'sysName.0':
+                value = name
+            self.values[oid] = (TYPES[kind], value)
+        # the OIDs in the lexicographic order of the agents, for the GETNEXT and GETBULK requests
+        self.order = sorted(self.values, key=oid_key)
+        self.keys = [oid_key(oid) for oid in self.order]
+        # the rows of the last port disappear after flap_after seconds, like a removed module
+        self.flap_after = flap_after
+        self.flapping = {oid for oid in self.values if ports and oid_key(oid)[-1] == ports and oid_key(oid)[:-1] in
+                         {oid_key(column) for column, _, _ in INTERFACE_COLUMNS.values()}}
+
+    def get(self, oid: str) -> tuple:
+        '''Returns the (tag, value) of an OID, or (NO_SUCH_OBJECT, None) if the DUT doesn't serve it.'''
+
+        if oid not in self.values or not self._visible_hlp(oid):
+            return snmp_ber.NO_SUCH_OBJECT, None
+        tag, value = self.values[oid]
+        if value is None: # the uptime, in timeticks
+            now = monotonic()
+            if self.crash_after is not None and now - self.start > self.crash_after:
+                self.start, self.crash_after = now, None
+            return tag, int((now - self.start) * 100) + 100000
+        if isinstance(value, list) and tag == snmp_ber.COUNTER64:
+            value[2] = (value[2] + self.random.randint(value[0], value[1])) % 2**64
+            return tag, value[2]
+        if isinstance(value, list):
+            minimum, maximum, current = value
+            value[2] = min(max(current + self.random.randint(-2, 2), minimum), maximum)
+            return tag, value[2]
+        return tag, value
+
+    def next(self, oid: str) -> tuple:
+        '''Returns the (OID, tag, value) following an OID (GETNEXT), or (oid, END_OF_MIB_VIEW, None) at the end of the MIB.'''
+
+        index = bisect_right(self.keys, oid_key(oid))
+        while index < len(self.order) and not self._visible_hlp(self.order[index]):
+            index += 1
+        if index == len(self.order):
+            return oid, snmp_ber.END_OF_MIB_VIEW, None
+        return (self.order[index], *self.get(self.order[index]))
+
+    def _visible_hlp(self, oid: str) -> bool:
+        '''Helper method. Returns False for the OIDs of the port that disappeared.'''
+
+        return self.flap_after is None or oid not in self.flapping or monotonic() - self.start <= self.flap_after
+
+
+class snmp_simulator():
+    '''
+        Serves 'count' simulated DUTs on the UDP ports port ... port + count - 1 of the host, in a daemon thread.
+        :latency, jitter: the delay of the responses, in seconds: latency + uniform(0, jitter)
+        :drop_rate: the probability that a request is not answered (the poller times out)
+        :error_rate: the probability that a varbind is answered with noSuchInstance (SNMPv2c),
+                     or that the request is answered with the noSuchName error status (SNMPv1)
+        :crash_after: the DUTs' uptime is reset after this number of seconds (crash detection)
+        :ports: the number of rows of the interface table of the DUTs
+        :flap_after: the rows of the last port disappear after this number of seconds
+    '''
+
+    def __init__(self, port: int = 16100, count: int = 1, host: str = '127.0.0.1', oids: dict = None, latency: float = 0,
+                 jitter: float = 0, drop_rate: float = 0, error_rate: float = 0, crash_after: float = None, seed: int = 0,
+                 ports: int = 0, flap_after: float = None) -> None:
+
+        self.latency, self.jitter, self.drop_rate, self.error_rate = latency, jitter, drop_rate, error_rate
+        self.random = Random(seed)
+        self.selector = DefaultSelector()
+        self.duts = {}
+        for index in range(count):
+            sock = socket(AF_INET, SOCK_DGRAM)
+            sock.bind((host, port + index))
+            sock.setblocking(False)
+            self.duts[sock] = simulated_dut(f'SIM-{index + 1}', oids or DEFAULT_OIDS, seed + index, crash_after, ports, flap_after)
+            self.selector.register(sock, EVENT_READ)
+        self.addresses = [f'{host}:{port + index}' for index in range(count)]
+        self.pending = [] # [(send_time, sequence_number, socket, response, address)], the delayed responses
+        self.sequence = 0
+        self.requests = 0
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, name='snmp_simulator', daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+
+        while not self.stopped.is_set():
+            timeout = max(self.pending[0][0] - monotonic(), 0) if self.pending else 0.1
+            for key, _ in self.selector.select(timeout=timeout):
+                try:
+                    data, address = key.fileobj.recvfrom(65535)
+                except OSError:
+                    continue
+                response = self._respond_hlp(self.duts[key.fileobj], data)
+                if response is None:
+                    continue
+                delay = self.latency + self.random.uniform(0, self.jitter) if self.latency or self.jitter else 0
+                self.sequence += 1
+                heappush(self.pending, (monotonic() + delay, self.sequence, key.fileobj, response, address))
+            now = monotonic()
+            while self.pending and self.pending[0][0] <= now:
+                _, _, sock, response, address = heappop(self.pending)
+                try:
+                    sock.sendto(response, address)
+                except OSError:
+                    pass
+
+    def _respond_hlp(self, dut: simulated_dut, data: bytes):
+        '''Helper method. Returns the encoded response to a request, or None if the request is dropped or invalid.'''
+
+        try:
+            request = snmp_ber.decode_message(data)
+        except (snmp_ber.snmp_decode_error, IndexError, ValueError):
+            return None
+        self.requests += 1
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            return None
+        if request['pdu_type'] in (snmp_ber.GET_NEXT_REQUEST, snmp_ber.GET_BULK_REQUEST):
+            return self._walk_hlp(dut, request)
+        varbinds, error_status, error_index = [], 0, 0
+        if request['pdu_type'] != snmp_ber.GET_REQUEST:
+            error_status = 5 # genErr: only GET, GETNEXT and GETBULK requests are simulated
+        for index, (oid, _, _) in enumerate(request['varbinds'], start=1):
+            tag, value = dut.get(oid)
+            if error_status:
+                tag, value = snmp_ber.NULL, None
+            elif self.error_rate and self.random.random() < self.error_rate:
+                if request['version'] == 1:
+                    error_status, error_index = 2, index # noSuchName
+                else:
+                    tag, value = snmp_ber.NO_SUCH_INSTANCE, None
+            elif tag == snmp_ber.NO_SUCH_OBJECT and request['version'] == 1:
+                error_status, error_index = 2, index
+            varbinds.append((oid, tag, value))
+        if error_status:
+            # the error responses carry the varbinds of the request
+            varbinds = [(oid, snmp_ber.NULL, None) for oid, _, _ in request['varbinds']]
+        return snmp_ber.encode_message(request['version'], request['community'], snmp_ber.RESPONSE, request['request_id'],
+                                       varbinds, error_status, error_index)
+
+    def _walk_hlp(self, dut: simulated_dut, request: dict) -> bytes:
+        '''Helper method. Returns the encoded response to a GETNEXT or GETBULK request. The non-repeaters and
+        max-repetitions of a GETBULK request are the error status and error index fields of its PDU.'''
+
+        oids = [oid for oid, _, _ in request['varbinds']]
+        varbinds, error_status, error_index = [], 0, 0
+        if request['pdu_type'] == snmp_ber.GET_BULK_REQUEST and request['version'] != 1:
+            non_repeaters = min(max(request['error_status'], 0), len(oids))
+            varbinds = [dut.next(oid) for oid in oids[:non_repeaters]]
+            repeaters = oids[non_repeaters:]
+            for _ in range(max(request['error_index'], 0) if repeaters else 0):
+                row = [dut.next(oid) for oid in repeaters]
+                varbinds.extend(row)
+                if all(tag == snmp_ber.END_OF_MIB_VIEW for _, tag, _ in row):
+                    break
+                repeaters = [oid for oid, _, _ in row]
+        elif request['pdu_type'] == snmp_ber.GET_BULK_REQUEST:
+            error_status = 5 # GETBULK doesn't exist in SNMPv1
+        else:
+            varbinds = [dut.next(oid) for oid in oids]
+            if request['version'] == 1:
+                for index, (_, tag, _) in enumerate(varbinds, start=1):
+                    if tag == snmp_ber.END_OF_MIB_VIEW:
+                        error_status, error_index = 2, index # noSuchName
+                        break
+        if error_status:
+            varbinds = [(oid, snmp_ber.NULL, None) for oid in oids]
+        return snmp_ber.encode_message(request['version'], request['community'], snmp_ber.RESPONSE, request['request_id'],
+                                       varbinds, error_status, error_index)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        for sock in self.duts:
+            self.selector.unregister(sock)
+            sock.close()
+
+
+def main(arguments: list = None) -> None:
+
+    parser = ArgumentParser(description='Local SNMP responder simulating a fleet of DUTs.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=16100, help='the port of the first DUT. Default: 16100')
+    parser.add_argument('--count', type=int, default=1, help='the number of DUTs, on consecutive ports. Default: 1')
+    parser.add_argument('--oids', help='JSON file of the served OIDs: {name: [numeric_oid, type, value | [min, max] | null]}')
+    parser.add_argument('--latency', type=float, default=0, help='the delay of the responses, in seconds')
+    parser.add_argument('--jitter', type=float, default=0, help='a random delay added to the latency, in seconds')
+    parser.add_argument('--drop-rate', type=float, default=0, help='the probability that a request is not answered')
+    parser.add_argument('--error-rate', type=float, default=0, help='the probability that a varbind is answered with an error')
+    parser.add_argument('--crash-after', type=float, default=None, help='reset the uptime of the DUTs after this number of seconds')
+    parser.add_argument('--ports', type=int, default=0, help='the number of rows of the interface table of the DUTs. Default: 0')
+    parser.add_argument('--flap-after', type=float, default=None, help='the rows of the last port disappear after this number of seconds')
+    args = parser.parse_args(arguments)
+
+    simulator = snmp_simulator(port=args.port, count=args.count, host=args.host, oids=load_oids(args.oids) if args.oids else None,
+                               latency=args.latency, jitter=args.jitter, drop_rate=args.drop_rate, error_rate=args.error_rate,
+                               crash_after=args.crash_after, ports=args.ports, flap_after=args.flap_after)
+    # the line read by the benchmark harness to know that the DUTs are served
+    print(f"ready: {args.count} DUT(s) on {simulator.addresses[0]} ... {simulator.addresses[-1]}", flush=True)
+    try:
+        simulator.stopped.wait()
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
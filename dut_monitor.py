@@ -1,21 +1,34 @@
 from datetime import datetime
 import logging
-from time import sleep
+from threading import Event, Lock
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, perf_counter
 from importlib import import_module
 from random import choices
 from string import ascii_uppercase
+from os import cpu_count
 from os.path import dirname, realpath
 import sys
 sys.path.append(f"{dirname(realpath(__file__))}/submodules")
 from monitor_utils import monitor_utils
+from poll_registry import registry
+from worker_metrics import metrics_server
+from process_shards import shard_supervisor
+import fleet_report
 
 class dut_monitor():
     """
         The main DUT monitor class.
         It's purpose is to create and manage worker thread objects.
+        The workers are subscriptions to the process-wide poll registry: dut_monitor objects of the same process
+        monitoring the same DUT with the same utility share a single polling worker (see poll_registry).
+        With processes set, the workers are spread over that many worker processes (0: one per CPU), each one running
+        a dut_monitor with its part of the profiles (see process_shards). The API stays the same.
+        The results of the end of run analysis of the workers are collected as they finish, and the fleet report
+        (see fleet_report) is written once all of them finished, listing the report_top DUTs of each item (None: no report).
     """
 
-    def __init__(self, monitor_map: list) -> None:
+    def __init__(self, monitor_map: list, processes: int = None, report_top: int = 5) -> None:
 
         # generate a start time for sync purposes and configure the logger
         self.start_time = datetime.now()
@@ -45,6 +58,21 @@ class dut_monitor():
 
         self.monitor_map = monitor_map 
         self.workers = {} # the dictionary of workers
+        # crashes detected while monitoring, reported as soon as they are detected (profile key 'detect_crashes')
+        self.crashes = []              # the crash dictionaries, in the order they were detected
+        self.crash_event = Event()     # set when the first crash is detected
+        self.crash_callbacks = []      # callables registered with add_crash_callback()
+        self.crash_lock = Lock()
+        self.metrics_server = None     # the OpenMetrics endpoint, see start_metrics_server()
+        self.processes = processes     # None: the workers run in this process
+        self.supervisor = None         # the shard_supervisor of the worker processes
+        # the results of the end of run analysis of the workers, collected as they finish (see analysis_handler())
+        self.analyses = {}             # {dut: analysis dictionary}
+        self.analysis_lock = Lock()
+        self.report_top = report_top   # the number of DUTs listed per item in the fleet report. None: no automatic report
+        self.report_paths = None       # (text, json) paths of the last fleet report written
+        self.reported = False          # set when the fleet report of all the workers is written
+        self.started = False           # set at the end of run(), once all the workers are created
 
     def profile_check(self, profile: dict) -> bool:
         """ 
@@ -86,21 +114,155 @@ class dut_monitor():
             self.dut_monitor_logger.info(f"DUT {dut} {self.workers[dut].utility} worker terminated execution.",
                                           extra={'entity': "DUT-MONITOR : stop_workers()"})
 
-    def init_worker(self, profile: dict) -> None:
+    def get_statistics(self, dut: str) -> dict:
+        '''
+            Returns the statistics accumulated so far by a worker, without waiting for it to end: {item: stats_dict}.
+            :dut: the ip | cli of an worker
+        '''
+
+        if dut not in self.workers:
+            self.dut_monitor_logger.error(f"There is no worker for '{dut}'", extra={'entity': "DUT-MONITOR : get_statistics()"})
+            return {}
+        return self.workers[dut].get_statistics()
+
+    def get_metrics(self, dut: str = 'all') -> dict:
+        '''
+            Returns a snapshot of the self-instrumentation metrics of one or all workers: {dut: metrics_dict}.
+            metrics_dict has the keys dut, utility, uptime, health (healthy, degraded or down, see dut_health), missed_iterations,
+            counters ({name: count}: item_errors, request_splits, connection_spawns, spawn_retries, cli_buffer_flushes, probes,
+            skipped_iterations, ...), iterations (the histogram of
+            the iteration durations) and requests ({item: histogram of the request latencies}).
+            :dut: the ip | cli of an worker, or 'all'
+        '''
+
+        if dut != 'all' and dut not in self.workers:
+            self.dut_monitor_logger.error(f"There is no worker for '{dut}'", extra={'entity': "DUT-MONITOR : get_metrics()"})
+            return {}
+        duts = list(self.workers.keys()) if dut == 'all' else [dut]
+        return {dut: metrics for dut in duts if (metrics := self.workers[dut].get_metrics())}
+
+    def start_metrics_server(self, port: int = 9464, host: str = '127.0.0.1') -> bool:
+        '''
+            Exposes the metrics of the workers in the OpenMetrics text format at http://host:port/metrics.
+            The endpoint is local by default. It is stopped by stop_metrics_server().
+        '''
+        if self.metrics_server:
+            self.dut_monitor_logger.warning(f"The metrics endpoint is already running on {self.metrics_server.address}",
+                                            extra={'entity': "DUT-MONITOR : start_metrics_server()"})
+            return False
+        try:
+            self.metrics_server = metrics_server(lambda: list(self.get_metrics().values()), host=host, port=port)
+        except OSError as e:
+            self.dut_monitor_logger.error(f"Error: {e} occurred while starting the metrics endpoint on {host}:{port}",
+                                          extra={'entity': "DUT-MONITOR : start_metrics_server()"})
+            return False
+        self.dut_monitor_logger.info(f"Metrics endpoint started: http://{host}:{self.metrics_server.address[1]}/metrics",
+                                     extra={'entity': "DUT-MONITOR : start_metrics_server()"})
+        return True
+
+    def stop_metrics_server(self) -> None:
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+            self.dut_monitor_logger.info(f"Metrics endpoint stopped", extra={'entity': "DUT-MONITOR : stop_metrics_server()"})
+
+    def add_crash_callback(self, callback) -> None:
+        '''
+            Registers a callable that is called as soon as a worker detects a crash of its DUT, e.g. to collect diagnostics.
+            The callback receives a dictionary with the keys: dut, utility, iteration, timestamp, expected_uptime, uptime,
+            last_successful_iteration and logfile. It is executed in its own thread, not in the polling worker.
+        '''
+        with self.crash_lock:
+            self.crash_callbacks.append(callback)
+
+    def crash_handler(self, crash: dict) -> None:
+        '''Called by the workers when a crash is detected. Records the crash, sets crash_event and calls the registered callbacks.'''
+
+        self.dut_monitor_logger.critical(f"CRASH of DUT {crash['dut']} detected by the {crash['utility']} worker in iteration "
+                                         f"{crash['iteration']}: expected uptime {crash['expected_uptime']:.2f} seconds, "
+                                         f"retrieved uptime {crash['uptime']} seconds.", extra={'entity': "DUT-MONITOR : crash_handler()"})
+        with self.crash_lock:
+            self.crashes.append(crash)
+            callbacks = list(self.crash_callbacks)
+        self.crash_event.set()
+        for callback in callbacks:
+            try:
+                callback(crash)
+            except Exception as e:
+                self.dut_monitor_logger.error(f"Error: {e} occurred in the crash callback {callback}",
+                                              extra={'entity': "DUT-MONITOR : crash_handler()"})
+
+    def analysis_handler(self, analysis: dict) -> None:
+        '''
+            Called by the workers with the results of their end of run analysis (see monitor_utils.analyze_logfile()).
+            Records them and writes the fleet report once all the workers finished their analysis.
+        '''
+        if analysis['error']:
+            self.dut_monitor_logger.error(f"The end of run analysis of DUT {analysis['dut']} failed: {analysis['error']}",
+                                          extra={'entity': "DUT-MONITOR : analysis_handler()"})
+        with self.analysis_lock:
+            self.analyses[analysis['dut']] = analysis
+        self._fleet_report_hlp()
+
+    def get_fleet_summary(self, top: int = 5) -> dict:
+        '''
+            Returns the fleet summary of the analysis results collected so far (see fleet_report.summarize()): the distribution
+            of each statistics item across the DUTs, the top DUTs by maximum, the crashes and the value changes per DUT.
+            :top: the number of DUTs listed per item
+        '''
+        with self.analysis_lock:
+            analyses = list(self.analyses.values())
+            pending = [dut for dut in self.workers if dut not in self.analyses]
+        return fleet_report.summarize(analyses, top=top, pending=pending)
+
+    def write_fleet_report(self, top: int = 5) -> tuple:
+        '''
+            Writes the fleet summary to logfiles/fleet_report_<start time>_<id>.log and .json. It is called once all the workers
+            finished their analysis (if report_top isn't None), and can be called before, e.g. after join_workers() with a timeout:
+            the DUTs whose workers didn't finish are listed as such. Returns the (text, json) paths, or None if the report failed.
+        '''
+        summary = self.get_fleet_summary(top=top)
+        path = f"{dirname(realpath(__file__))}/logfiles/fleet_report_{self.start_time.strftime('%d_%b_%Y_%H_%M_%S')}_" \
+               f"{self.dut_monitor_logger.name}.log"
+        try:
+            self.report_paths = fleet_report.write(summary, path)
+        except Exception as e:
+            self.dut_monitor_logger.error(f"Error: {e} occurred while writing the fleet report",
+                                          extra={'entity': "DUT-MONITOR : write_fleet_report()"})
+            return None
+        self.dut_monitor_logger.info(f"Fleet report of {summary['duts']} DUT(s) written to {self.report_paths[0]} and {self.report_paths[1]}",
+                                     extra={'entity': "DUT-MONITOR : write_fleet_report()"})
+        return self.report_paths
+
+    def _fleet_report_hlp(self) -> None:
+        '''Helper method. Writes the fleet report if all the workers finished their analysis and it isn't written yet.'''
+
+        with self.analysis_lock:
+            if self.report_top is None or not self.started or self.reported or any(dut not in self.analyses for dut in self.workers):
+                return
+            self.reported = True
+        self.write_fleet_report(top=self.report_top)
+
+    def init_worker(self, profile: dict) -> str:
+        '''Creates and starts the worker of a profile. Returns None, or the reason why the worker could not be started.'''
         try:
             self.dut_monitor_logger.info(f"Trying to create {profile['utility']} type worker for DUT {profile['dut']}",
                                          extra={'entity': "DUT-MONITOR : init_worker()"})
             if profile['dut'] in self.workers:
                 self.dut_monitor_logger.warning(f"A worker for DUT {profile['dut']} already exists. Skip the initialization process.",
                                                  extra={'entity': "DUT-MONITOR : init_worker()"})
-                return None
-            self.workers[profile['dut']] = getattr(self.imported_modules[profile['utility']], profile['utility'])(profile)
-            self.workers[profile['dut']].start()
+                return 'a worker for the DUT already exists'
+            worker_class = getattr(self.imported_modules[profile['utility']], profile['utility'])
+            subscription = registry.subscribe(worker_class, profile, on_crash=self.crash_handler, on_analysis=self.analysis_handler)
+            subscription.start()
+            self.workers[profile['dut']] = subscription
             self.dut_monitor_logger.info(f"{profile['utility']} worker for DUT {profile['dut']} created and started",
                                          extra={'entity': "DUT-MONITOR : init_worker()"})
+            return None
         except Exception as e:
             self.dut_monitor_logger.critical(f"Error: {e} occurred while trying to initialize {profile['utility']} worker for DUT {profile['dut']}",
                                              extra={'entity': "DUT-MONITOR : init_worker()"})
+            return f"{type(e).__name__}: {e}"
 
     def logger_configurator(self) -> None:
         try:
@@ -145,39 +307,111 @@ class dut_monitor():
                                          extra={'entity': "DUT-MONITOR : join_workers()"})
         return True
 
-    def run(self) -> None:
+    def validate_profiles(self, profiles: list) -> tuple:
+        '''
+            Checks all the profiles before any worker is started. Returns (valid_profiles, failures), failures being a list
+            of (profile, reason) tuples: missing mandatory parameters, unknown utility, invalid interval, tables of a console profile,
+            invalid item intervals or DUT already monitored.
+        '''
+        valid, failures, duts = [], [], set(self.workers)
+        for profile in profiles:
+            if not isinstance(profile, dict) or not self.profile_check(profile):
+                failures.append((profile, 'mandatory parameters are missing'))
+            elif profile['utility'] not in self.imported_modules:
+                failures.append((profile, f"unknown utility {profile['utility']}"))
+            elif not isinstance(profile['interval'], (int, float)) or profile['interval'] <= 0:
+                failures.append((profile, f"invalid interval {profile['interval']}"))
+            elif profile.get('tables') and profile['utility'] == 'console_monitor':
+                failures.append((profile, 'tables can only be walked by the SNMP utilities'))
+            elif profile.get('item_intervals') and (reason := self._item_intervals_check_hlp(profile)):
+                failures.append((profile, reason))
+            elif profile['dut'] in duts:
+                failures.append((profile, 'a worker for the DUT already exists'))
+            else:
+                duts.add(profile['dut'])
+                valid.append(profile)
+        return valid, failures
+
+    @staticmethod
+    def _item_intervals_check_hlp(profile: dict) -> str:
+        '''Helper method. Returns the reason why the 'item_intervals' of a profile are invalid, or None if they are valid.'''
+
+        names = {item if isinstance(item, str) else item[1] for item in profile['items']} | set(profile.get('tables', []))
+        for name, interval in profile['item_intervals'].items():
+            if name not in names:
+                return f"item interval of {name}, which is not polled"
+            if not isinstance(interval, (int, float)) or interval <= 0:
+                return f"invalid interval {interval} of item {name}"
+            if name == profile.get('detect_crashes'):
+                return f"the uptime item {name} is polled in every iteration for the crash detection"
+        return None
+
+    def run(self, max_workers: int = 16, start_rate: float = None) -> dict:
         '''
         Method called to start the all the workers configured in monitor_map.
         Basically, this is the method that starts the monitor app.
+        All the profiles are validated first, then the workers are created concurrently by max_workers threads, at most
+        start_rate workers per second if it is set. The startup failures are reported together, once all the workers are started.
+        Returns {'started': [dut, ...], 'failed': {dut: reason}}.
         '''
         self.dut_monitor_logger.info(f"Operation started", extra={'entity': "DUT-MONITOR : run()"})
-        for profile in self.monitor_map:
-            if not self.profile_check(profile):
-                self.dut_monitor_logger.error(f"Profile {profile} failed the check, thus it is skipped.", 
-                                              extra={'entity': "DUT-MONITOR : run()"})
-                continue
+        start = perf_counter()
+        profiles, failures = self.validate_profiles(self.monitor_map)
+        for profile in profiles:
             # pass the start time to all types of workers for synchronization purposes
             profile['start_time'] = self.start_time
-            self.init_worker(profile=profile)
-            sleep(1)
-
 
-
-e = dut_monitor(monitor_map=[{'dut':'15.1.1.10',
-                              'utility':'snmp_monitor',
-                              'items':['hm2LogTempMaximum.0','hm2PoeMgmtModuleDeliveredPower.1.1','hm2DiagCpuUtilization.0',
-                                       'sysUpTime.0','hm2DiagMemoryRamFree.0','hm2LogTempMinimum.0'],
-                              'interval':2,
-                              'timeout':30,
-                              'statistics':['hm2LogTempMaximum.0','hm2PoeMgmtModuleDeliveredPower.1.1',
-                                            'hm2DiagCpuUtilization.0','hm2DiagMemoryRamFree.0','hm2LogTempMinimum.0'],
-                              'check_values_change':['hm2LogTempMaximum.0','hm2PoeMgmtModuleDeliveredPower.1.1',
-                                                     'hm2DiagCpuUtilization.0','hm2DiagMemoryRamFree.0','hm2LogTempMinimum.0',
-                                                     'pethPsePortPowerClassifications.1.8',
-                                                     'ifMauType.4.1'],
-                              'detect_crashes':'sysUpTime.0'}])
-e.run()
-e.join_workers(dut='all')
+        if self.processes is not None and profiles:
+            # each worker process starts its part of the profiles, at its part of the start rate
+            self.supervisor = shard_supervisor(self, self.processes or cpu_count() or 1)
+            failures += self.supervisor.start(profiles, {'max_workers': max_workers,
+                                                         'start_rate': start_rate / self.supervisor.processes if start_rate else None})
+        else:
+            # the first iterations of the workers are spread over their interval by the scheduler
+            with ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix='dut_monitor_start') as executor:
+                futures = []
+                for index, profile in enumerate(profiles):
+                    if start_rate:
+                        sleep(max(start + index / start_rate - perf_counter(), 0))
+                    futures.append((profile, executor.submit(self.init_worker, profile)))
+                failures += [(profile, future.result()) for profile, future in futures if future.result()]
+
+        started = [profile['dut'] for profile in profiles if profile['dut'] in self.workers]
+        failed = {str(profile.get('dut') if isinstance(profile, dict) else profile): reason for profile, reason in failures}
+        self.dut_monitor_logger.info(f"{len(started)} worker(s) started in {perf_counter() - start:.2f} seconds",
+                                     extra={'entity': "DUT-MONITOR : run()"})
+        if failed:
+            # the failures are grouped by reason
+            reasons = {}
+            for dut, reason in failed.items():
+                reasons.setdefault(reason, []).append(dut)
+            self.dut_monitor_logger.error(f"{len(failed)} profile(s) failed to start:\n" +
+                                          '\n'.join(f"  {reason}: {len(duts)} profile(s): {', '.join(duts)}" for reason, duts in reasons.items()),
+                                          extra={'entity': "DUT-MONITOR : run()"})
+        # the workers that already finished didn't write the fleet report, the workers were not all created
+        self.started = True
+        if started:
+            self._fleet_report_hlp()
+        return {'started': started, 'failed': failed}
+
+
+
+if __name__ == '__main__':
+    e = dut_monitor(monitor_map=[{'dut':'15.1.1.10',
+                                  'utility':'snmp_monitor',
+                                  'items':['hm2LogTempMaximum.0','hm2PoeMgmtModuleDeliveredPower.1.1','hm2DiagCpuUtilization.0',
+                                           'sysUpTime.0','hm2DiagMemoryRamFree.0','hm2LogTempMinimum.0'],
+                                  'interval':2,
+                                  'timeout':30,
+                                  'statistics':['hm2LogTempMaximum.0','hm2PoeMgmtModuleDeliveredPower.1.1',
+                                                'hm2DiagCpuUtilization.0','hm2DiagMemoryRamFree.0','hm2LogTempMinimum.0'],
+                                  'check_values_change':['hm2LogTempMaximum.0','hm2PoeMgmtModuleDeliveredPower.1.1',
+                                                         'hm2DiagCpuUtilization.0','hm2DiagMemoryRamFree.0','hm2LogTempMinimum.0',
+                                                         'pethPsePortPowerClassifications.1.8',
+                                                         'ifMauType.4.1'],
+                                  'detect_crashes':'sysUpTime.0'}])
+    e.run()
+    e.join_workers(dut='all')
 '''
 f = dut_monitor(monitor_map=[{'dut':'telnet localhost 20000',
                               'utility':'console_monitor',
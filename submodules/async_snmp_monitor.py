@@ -0,0 +1,374 @@
+from datetime import datetime, timedelta
+from threading import Thread, Event, Lock
+import asyncio
+from socket import AF_INET, SOCK_DGRAM
+from itertools import count
+from time import time, perf_counter, monotonic
+from poll_registry import polling_worker, worker_logger
+from scheduler import start_offset, next_deadline
+import snmp_ber
+from snmp_tables import OID_NAMES, MAX_REPETITIONS, resolve_oid, oid_key, row_item, table_rows
+from monitor_utils import monitor_utils
+from dut_health import DOWN, PROBE_OID
+
+
+class snmp_protocol(asyncio.DatagramProtocol):
+    '''UDP endpoint shared by all the DUTs polled by the engine. The responses are matched to the requests by request-id.'''
+
+    def __init__(self, engine) -> None:
+        self.engine = engine
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        try:
+            message = snmp_ber.decode_message(data)
+        except (snmp_ber.snmp_decode_error, IndexError, ValueError):
+            return
+        request = self.engine.pending.get(message['request_id'])
+        if request and request[0] == addr[:2] and not request[1].done():
+            request[1].set_result(message)
+
+
+class async_snmp_engine():
+    '''
+        A single asyncio event loop, running in its own thread, which polls the DUTs of all async_snmp_monitor workers
+        of the process using non-blocking UDP SNMP (v1/v2c). The number of requests in flight is limited by a semaphore.
+    '''
+
+    _instance = None
+    _instance_lock = Lock()
+
+    def __init__(self, max_concurrency: int = 256) -> None:
+
+        self.max_concurrency = max_concurrency
+        self.request_ids = count(int(time()) & 0xFFFFFF)
+        self.pending = {} # request_id: ((host, port), future)
+        self.ready = Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self._run_loop, name='async_snmp_engine', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    @classmethod
+    def get_engine(cls, max_concurrency: int = 256):
+        '''Returns the engine of the process, creating it on the first call.'''
+
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(max_concurrency=max_concurrency)
+            return cls._instance
+
+    def _run_loop(self) -> None:
+
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.transport, _ = self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: snmp_protocol(self), local_addr=('0.0.0.0', 0)))
+        self.ready.set()
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        '''Schedules a coroutine on the engine loop from any thread. Returns a concurrent.futures.Future.'''
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def request(self, address: tuple, version: int, community: str, pdu_type: int, oids: list,
+                      timeout: float, retries: int, non_repeaters: int = 0, max_repetitions: int = 0) -> dict:
+        '''
+        Sends a request and waits for its response, retransmitting it 'retries' times.
+        Returns the decoded response. Raises TimeoutError if no response is received.
+        '''
+
+        request_id = next(self.request_ids) & 0x7FFFFFFF
+        message = snmp_ber.encode_request(version, community, pdu_type, request_id, oids, non_repeaters, max_repetitions)
+        async with self.semaphore:
+            response = self.loop.create_future()
+            self.pending[request_id] = (address, response)
+            try:
+                for _ in range(retries + 1):
+                    self.transport.sendto(message, address)
+                    try:
+                        return await asyncio.wait_for(asyncio.shield(response), timeout)
+                    except asyncio.TimeoutError:
+                        continue
+                raise TimeoutError('Timeout')
+            finally:
+                self.pending.pop(request_id, None)
+
+
+class async_snmp_monitor(polling_worker):
+    '''
+        Each worker polls a single DUT for a set of OIDs, like snmp_monitor, but instead of a thread blocked in netsnmp calls,
+        it is a coroutine of the shared async_snmp_engine. It publishes the same results to its subscriptions (see poll_registry)
+        and keeps the thread interface of the other workers: start(), stop(), stopped, is_alive() and join().
+        The 'tables' of the profile are walked with GETBULK requests (GETNEXT with SNMPv1) and each row is published as an item.
+        Only SNMPv1 and SNMPv2c settings are supported. A DUT that is down is only probed (see dut_health).
+    '''
+
+    def __init__(self, profile: dict) -> None:
+
+        self.profile = profile
+
+        # set the endtime of the whole monitoring process
+        self.endtime = profile['start_time'] + timedelta(seconds=profile['timeout']) if profile['timeout'] else None
+        # logger configuration. The file handlers of the subscriptions are added to it
+        self.logger = worker_logger(f"{profile['dut']}_async")
+        self.init_subscriptions()
+        self.init_metrics()
+        self.init_health()
+        self.answered = False # whether a request of the current iteration was answered
+        # import snmp settings. The configuration file is parsed once per process
+        json_data = monitor_utils.load_config('snmp_monitor')
+        snmp_settings = json_data[profile['snmp_settings']] if 'snmp_settings' in profile else json_data['default_settings']
+        if snmp_settings.get('Version') not in snmp_ber.VERSIONS:
+            raise ValueError(f"async_snmp_monitor supports SNMP versions 1 and 2c, not {snmp_settings.get('Version')}")
+        self.version = snmp_settings['Version']
+        self.community = snmp_settings.get('Community', 'public')
+        self.max_varbinds = max(int(snmp_settings.get('MaxVarbinds', 1)), 1)
+        self.max_repetitions = max(int(snmp_settings.get('MaxRepetitions', MAX_REPETITIONS)), 1)
+        self.request_timeout = snmp_settings.get('Timeout', 500000) / 1000000 # netsnmp settings are in microseconds
+        self.retries = snmp_settings.get('Retries', 3)
+        host, _, port = profile['dut'].partition(':')
+        self.address = (host, int(port) if port else 161)
+        # other settings
+        self.oid_names = OID_NAMES | json_data.get('oid_names', {})
+        self.oids = {}
+        self.set_items(profile['items'])
+        self.table_oids = {}
+        self.set_tables(profile.get('tables', []))
+        self.table_rows = table_rows()
+        self.iteration_number = 1 # the index of the iteration
+        self.utility = profile['utility']
+        self.missed_iterations = 0 # the iterations skipped because the previous one overran the interval
+        # stop mechanism
+        self.stopped = Event()
+        self.stop_thread = False
+        self.started = False
+        self.rescheduled = False # set when the interval was shortened, the loop then moves its next deadline
+        self.engine = async_snmp_engine.get_engine(max_concurrency=json_data.get('async_engine_settings', {}).get('MaxConcurrency', 256))
+
+    def set_items(self, items: list) -> None:
+        for item in items:
+            if item not in self.oids:
+                try:
+                    self.oids[item] = resolve_oid(item, self.oid_names)
+                except ValueError as e:
+                    self.oids[item] = e # logged as the query result of the item in every iteration
+        self.item_list = list(set(items)) # can contain either OIDs or MIBs. The conversion is done to remove duplicate items
+
+    def set_tables(self, tables: list) -> None:
+        for table in tables:
+            if table not in self.table_oids:
+                try:
+                    self.table_oids[table] = resolve_oid(table, self.oid_names)
+                except ValueError as e:
+                    self.table_oids[table] = e
+        self.table_list = list(dict.fromkeys(tables))
+
+    def start(self) -> None:
+        self.started = True
+        self.engine.submit(self.run())
+
+    def is_alive(self) -> bool:
+        return self.started and not self.stopped.is_set()
+
+    def join(self, timeout: float = None) -> None:
+        self.stopped.wait(timeout=timeout)
+
+    async def snmp_querier(self):
+        '''
+        This method snmp queries the DUT, and publishes the retrieved data to the subscriptions.
+        The GET requests and the table walks of an iteration are sent concurrently, so an unreachable DUT delays the iteration
+        by a single request timeout. Only the due items are polled.
+        '''
+        item_list, table_list = self.due_items(self.item_list), self.due_items(self.table_list)
+        if self.health.state == DOWN:
+            # a single probe stands in for the iteration of a DUT which is down
+            if not self.health.polling_due(monotonic()) or not await self.probe():
+                self.skip_iteration(item_list + table_list)
+                return
+        self.answered = False
+        chunks = [item_list[chunk_start:chunk_start + self.max_varbinds] for chunk_start in range(0, len(item_list), self.max_varbinds)]
+        requests = [self.get_items(chunk) for chunk in chunks] + [self.walk_table(table) for table in table_list]
+        results = [result for results in await asyncio.gather(*requests) for result in results]
+        self._health_hlp(self.answered)
+        self.publish(results)
+
+    async def probe(self) -> bool:
+        '''Probes a DUT which is down with a single GET. Returns True, and the DUT is healthy again, if it answered.'''
+
+        try:
+            await self.engine.request(self.address, self.version, self.community, snmp_ber.GET_REQUEST, [PROBE_OID],
+                                      self.request_timeout, self.retries)
+            answered = True
+        except Exception:
+            answered = False
+        self._health_hlp(answered)
+        return answered
+
+    def _health_hlp(self, answered: bool) -> None:
+        '''Helper method. Records whether the DUT answered and logs the changes of its health.'''
+
+        change = self.record_health(answered)
+        if change:
+            self.logger.info(f"{'INFO' if answered else 'ERROR'} : ASYNC-SNMP-MONITOR : snmp_querier() - {change}")
+
+    async def get_items(self, items: list) -> list:
+        '''
+        Queries a list of items using a single GET request. If the request fails as a whole (e.g. tooBig or noSuchName
+        in SNMPv1 PDUs), the items are split in two halves which are queried separately, down to one item per request.
+        Returns a list of (item, logfile_message) tuples, one for each item, in the order of the items.
+        '''
+        unresolved = [(item, f'ITEM: {item} query result: ERROR: {self.oids[item]}') for item in items if isinstance(self.oids[item], Exception)]
+        items = [item for item in items if not isinstance(self.oids[item], Exception)]
+        if not items:
+            return unresolved
+
+        start = perf_counter()
+        try:
+            response = await self.engine.request(self.address, self.version, self.community, snmp_ber.GET_REQUEST,
+                                                 [self.oids[item] for item in items], self.request_timeout, self.retries)
+            self.answered = True
+            error = snmp_ber.ERROR_STATUS.get(response['error_status'], response['error_status']) if response['error_status'] else None
+        except Exception as e:
+            response, error = None, str(e) or type(e).__name__
+        self.metrics.observe_request(items, perf_counter() - start)
+
+        if len(items) > 1 and response and error:
+            self.metrics.count('request_splits')
+            half = len(items) // 2
+            return unresolved + await self.get_items(items[:half]) + await self.get_items(items[half:])
+
+        messages = []
+        for index, item in enumerate(items):
+            try:
+                if error:
+                    raise Exception(error)
+                _, tag, value = response['varbinds'][index]
+                result = snmp_ber.format_value(tag, value)
+                messages.append((item, f'ITEM: {item} query result:  {result.rstrip()}'))
+            except Exception as e:
+                messages.append((item, f'ITEM: {item} query result: ERROR: {str(e).rstrip()}'))
+        return unresolved + messages
+
+    async def walk_table(self, table: str) -> list:
+        '''
+        Walks a table (or subtree) with GETBULK requests of max_repetitions rows (GETNEXT with SNMPv1), from its root
+        to the first OID outside of it. Returns a list of (row_item, logfile_message) tuples, one for each row, or
+        [(table, error_message)] if the walk failed. The rows that appeared or disappeared since the previous walk are logged.
+        '''
+        table_oid = self.table_oids[table]
+        if isinstance(table_oid, Exception):
+            return [(table, f'ITEM: {table} query result: ERROR: {table_oid}')]
+        bulk = self.version != 1
+        pdu_type = snmp_ber.GET_BULK_REQUEST if bulk else snmp_ber.GET_NEXT_REQUEST
+        messages, oid, last_key, done = [], table_oid, oid_key(table_oid), False
+        while not done:
+            start = perf_counter()
+            try:
+                response = await self.engine.request(self.address, self.version, self.community, pdu_type, [oid], self.request_timeout,
+                                                     self.retries, 0, self.max_repetitions if bulk else 0)
+            except Exception as e:
+                response, error = None, str(e) or type(e).__name__
+            else:
+                self.answered = True
+                # noSuchName is the end of the MIB view of a SNMPv1 agent
+                error = None if response['error_status'] in (0, 2) else snmp_ber.ERROR_STATUS.get(response['error_status'], response['error_status'])
+            self.metrics.observe_request([table], perf_counter() - start)
+            if error:
+                self.logger.info(f"ERROR : ASYNC-SNMP-MONITOR : walk_table() - The walk of table {table} failed after {len(messages)} row(s): {error}")
+                return [(table, f'ITEM: {table} query result: ERROR: {error}')]
+            varbinds = response['varbinds'] if not response['error_status'] else []
+            done = not varbinds
+            for row_oid, tag, value in varbinds:
+                key = oid_key(row_oid)
+                # the walk ends at the first OID outside of the table, and at an agent returning OIDs out of order
+                if tag == snmp_ber.END_OF_MIB_VIEW or not row_oid.startswith(table_oid + '.') or key <= last_key:
+                    done = True
+                    break
+                item = row_item(table, table_oid, row_oid)
+                try:
+                    messages.append((item, f'ITEM: {item} query result:  {snmp_ber.format_value(tag, value).rstrip()}'))
+                except Exception as e:
+                    messages.append((item, f'ITEM: {item} query result: ERROR: {str(e).rstrip()}'))
+                oid, last_key = row_oid, key
+        changes = self.table_rows.update(table, [item for item, _ in messages])
+        if changes:
+            self.logger.info(f"WARNING : ASYNC-SNMP-MONITOR : walk_table() - {changes}")
+        return messages
+
+    async def run(self):
+        self.wake = asyncio.Event()
+        self.rescheduled = False
+        if self.stop_thread:
+            self.wake.set()
+        loop = asyncio.get_running_loop()
+        self.logger.info(f"INFO : ASYNC-SNMP-MONITOR : run() - Worker operation started.\n\n\n")
+        try:
+            # the DUT address is resolved once, so the requests are not blocked by name resolution
+            address_info = await loop.getaddrinfo(*self.address, family=AF_INET, type=SOCK_DGRAM)
+            self.address = address_info[0][4][:2]
+            # the start of the DUTs is spread over the interval, so their requests are not sent in bursts.
+            # afterwards, the iterations start at fixed-rate deadlines
+            interval = self.profile['interval']
+            deadline = loop.time() + start_offset(self.profile['dut'], interval)
+            while True:
+                await self._sleep_until(deadline)
+                if self.rescheduled and not self.stop_thread:
+                    # the interval was shortened: the next deadline follows the previous one at the new interval
+                    self.rescheduled = False
+                    self.wake.clear()
+                    deadline = min(deadline, max(deadline - interval + self.profile['interval'], loop.time()))
+                    interval = self.profile['interval']
+                    if deadline > loop.time():
+                        continue
+                if self.endtime:
+                    if not self.endtime > datetime.now():
+                        self.logger.info(f"INFO : ASYNC-SNMP-MONITOR : run() - Worker finished execution. Time limit reached.")
+                        break
+                if self.stop_thread:
+                    self.logger.info(f"WARNING : ASYNC-SNMP-MONITOR : run() - Worker stopped ahead of time due to a call to stop().")
+                    break
+                start = perf_counter()
+                await self.snmp_querier()
+                self.metrics.observe_iteration(perf_counter() - start)
+                self.iteration_number += 1
+                # the interval changes when subscriptions with other intervals join the worker
+                interval = self.profile['interval']
+                deadline, missed = next_deadline(deadline, interval, loop.time())
+                if missed:
+                    self.missed_iterations += missed
+                    self.logger.info(f"WARNING : ASYNC-SNMP-MONITOR : run() - The previous iteration overran the interval. "
+                                     f"{missed} iteration(s) skipped.")
+        except Exception as e:
+            self.logger.info(f"CRITICAL : ASYNC-SNMP-MONITOR : run() - Worker operation failed: {e}")
+        # ending the subscriptions is blocking (logfile analysis), so it is not executed on the event loop
+        await loop.run_in_executor(None, self.end_subscriptions)
+        self.stopped.set()
+
+    async def _sleep_until(self, deadline: float) -> None:
+        '''Waits until the loop time reaches the deadline or until stop() is called.'''
+
+        try:
+            await asyncio.wait_for(self.wake.wait(), timeout=max(deadline - asyncio.get_running_loop().time(), 0))
+        except asyncio.TimeoutError:
+            pass
+
+    def reschedule(self) -> None:
+        '''Wakes the worker's loop, which brings its next deadline forward after the interval was shortened (see run()).'''
+
+        if self.started:
+            self.engine.loop.call_soon_threadsafe(self._reschedule_hlp)
+
+    def _reschedule_hlp(self) -> None:
+        '''Helper method. Executed in the loop's thread.'''
+
+        self.rescheduled = True
+        if hasattr(self, 'wake'):
+            self.wake.set()
+
+    def stop(self):
+        self.logger.info(f"INFO : ASYNC-SNMP-MONITOR : stop() - Worker stop command received.")
+        self.stop_thread = True
+        if self.started:
+            # the worker's event belongs to the engine loop, so it is set from the loop's thread
+            self.engine.loop.call_soon_threadsafe(lambda: self.wake.set() if hasattr(self, 'wake') else None)
@@ -1,14 +1,23 @@
 from datetime import datetime, timedelta
 from threading import Thread, Event
-import logging
-from re import search
-from time import sleep
+from re import search, escape, compile
+from time import sleep, perf_counter, monotonic
 from pexpect import spawn, TIMEOUT, EOF, expect
-from monitor_utils import monitor_utils
-from re import compile
-from os.path import dirname, realpath
-
-class console_monitor(Thread):
+from poll_registry import polling_worker, worker_logger
+from scheduler import scheduler
+
+class console_monitor(Thread, polling_worker):
+    '''
+        Each thread (called console worker) inspects a set of items, retrieved from the outputs of CLI commands, for a single DUT.
+        The results are published to the subscriptions of the worker (see poll_registry), which write the logfiles.
+        With 'prompt_sync' in the profile, the CLI is prompt-synchronized: the exact prompt is found once after the login, the paging
+        is disabled ('paging_command', default: 'cli numlines 0') and each command is preceded by a sentinel line ('!sync-<n>') that
+        the DUT echoes or rejects. The output of a command is what comes between the prompt that follows the sentinel and the next
+        prompt, and it is returned as soon as that prompt appears. 'command_timeout' (default: 30 seconds) only bounds a DUT that
+        stopped answering.
+        A dead connection is respawned with a single attempt per iteration. While the DUT is down (see dut_health), the attempts
+        are made at an exponential backoff and the items of the other iterations are published as errors.
+    '''
 
     def __init__(self, profile: dict) -> None:
 
@@ -18,59 +27,68 @@ class console_monitor(Thread):
 
         # set the endtime of the whole monitoring process 
         self.endtime = profile['start_time'] + timedelta(seconds=profile['timeout']) if profile['timeout'] else None
-        # path settings
-        mainDir = f"{dirname(realpath(__file__))}/.."
-         
-        #logfile configuration
-        self.logfile_path = f"{mainDir}/logfiles/logfile_cli_{profile['dut'].replace(' ','_')}_{profile['start_time'].strftime('%d_%b_%Y_%H_%M_%S')}.log"
-        self.logger = logging.getLogger(f"{profile['dut'].replace(' ','_')}_cli")
-        self.logger.setLevel(logging.DEBUG)
-        logfile_handler = logging.FileHandler(self.logfile_path)
-        fmt = logging.Formatter('%(asctime)s | %(message)s')
-        logfile_handler.setFormatter(fmt)
-        self.logger.addHandler(logfile_handler)
+        # logger configuration. The file handlers of the subscriptions are added to it
+        self.logger = worker_logger(f"{profile['dut'].replace(' ','_')}_cli")
+        self.init_subscriptions()
+        self.init_metrics()
+        self.init_health()
 
         # other settings
         self.utility = profile['utility']
-        self.item_list = list(set(profile['items'])) # can contain either OIDs or MIBs. The conversion is done to remove duplicate items
+        self.set_items(profile['items'])
         #self.item_list = item_list
         self.iteration_number = 1 # the index of the iteration
         self.connection = False
         self.error_counter = 0
-        # end-thread processing
-        self.statistics = {item: compile("\\B\s\s[0-9\-\.\\\/]+") for item in profile['statistics']} if 'statistics' in profile else {}
-        self.detect_crashes = {profile['detect_crashes']: compile('\d+\sdays?.*\d+.*\d+.*\d+')} if 'detect_crashes' in profile else {}
-        self.check_values_change = {item: compile("\\B\s\s.*") for item in profile['check_values_change']} if 'check_values_change' in profile else {}
+        # prompt-synchronized CLI
+        self.prompt_sync = bool(profile.get('prompt_sync'))
+        self.paging_command = profile.get('paging_command', 'cli numlines 0')
+        self.command_timeout = profile.get('command_timeout', 30)
+        self.prompt = None # the compiled pattern of the exact prompt, found after each login
+        self.sentinel_number = 0
+        # the iterations are started by the scheduler, at fixed-rate deadlines
+        self.busy = False
+        self.missed_iterations = 0 # the iterations skipped because the previous one overran the interval
+        self.reported_missed_iterations = 0
         # stop mechanism
         self.thread_sleep = Event()
         self.stopped = Event()   # | these two work the thread stop mechanism
         self.stop_thread = False # |
         self.daemon = True
 
-    def spawn_cli_connection(self):
-
+    def spawn_cli_connection(self) -> bool:
+        '''
+        Makes an attempt to open the CLI connection. Returns True if it succeeded. The failed attempts are retried by the
+        next iterations, at the backoff of the DUT's health once it is down.
+        '''
         command = self.profile['dut']
         self.logger.info(f"INFO : CLI-MONITOR : spawn_cli_connection() - Spawning new CLI connection to DUT")
 
-        while True:
-
-            if self.endtime:
-                if not self.endtime > datetime.now():
-                    self.logger.info(f"WARNING : CLI-MONITOR : spawn_cli_connection() - Thread time limit reached before spawning a connection")
-                    break
+        if self.endtime:
+            if not self.endtime > datetime.now():
+                self.logger.info(f"WARNING : CLI-MONITOR : spawn_cli_connection() - Thread time limit reached before spawning a connection")
+                return False
+        if self.stop_thread:
+            self.logger.info(f"WARNING : CLI-MONITOR : spawn_cli_connection() - Thread stopped before spawning a connection")
+            return False
 
-            connection = spawn(command, timeout=int('10'), encoding='utf-8', codec_errors='ignore')
-            index = connection.expect(['Connected.*', TIMEOUT, EOF], timeout=10)
+        # in prompt-synchronized mode, only the DUT echoes: the local echo of the terminal would precede the DUT's pending output
+        connection = spawn(command, timeout=int('10'), encoding='utf-8', codec_errors='ignore', echo=not self.prompt_sync)
+        if self.prompt_sync:
+            connection.delaybeforesend = None # pexpect's fixed delay of 50 ms per send. The prompts pace the input
+        index = connection.expect(['Connected.*', TIMEOUT, EOF], timeout=10)
+        next_index = None
 
-            if index == 0:
-                next_index = connection.expect([TIMEOUT, EOF], timeout=2) # if the connection is open then Timeout. If device open failure, then EOF
-                if next_index != 1:
-                    self.logger.info(f"INFO : CLI-MONITOR : spawn_cli_connection() - CLI connection successful")
-                    self.connection = connection
-                    break
-            self.logger.info(f"ERROR : CLI-MONITOR : spawn_cli_connection() - Unable to open CLI connection. Code: {index}:{next_index}. Retrying in 10 seconds...")
-            connection.close()
-            sleep(10)
+        if index == 0:
+            next_index = connection.expect([TIMEOUT, EOF], timeout=2) # if the connection is open then Timeout. If device open failure, then EOF
+            if next_index != 1:
+                self.logger.info(f"INFO : CLI-MONITOR : spawn_cli_connection() - CLI connection successful")
+                self.connection = connection
+                return True
+        self.logger.info(f"ERROR : CLI-MONITOR : spawn_cli_connection() - Unable to open CLI connection. Code: {index}:{next_index}.")
+        self.metrics.count('spawn_retries')
+        connection.close()
+        return False
 
     def cli_logger(self):
 
@@ -114,6 +132,7 @@ class console_monitor(Thread):
                 self.connection.send('1\r')
             elif state == 7 or state == 8:
                 authentication_failure += 1
+                self.metrics.count('authentication_failures')
                 self.logger.info(f"ERROR : CLI-MONITOR : cli_logger() - Authentication failed using username and password")
                 sleep(10)
                 self.connection.send('\r')
@@ -133,69 +152,175 @@ class console_monitor(Thread):
                 self.connection = False
                 return False
 
-            sleep(1)
+            if not self.prompt_sync: # the prompt-synchronized mode waits for the next prompt only
+                sleep(1)
             state = self.connection.expect(prompts, timeout= 2)
         self.logger.info(f"INFO : CLI-MONITOR : cli_logger() - DUT login successful. Enable reached.")
+        if self.prompt_sync:
+            return self.synchronize_prompt()
         return True
 
-    def cli_querier(self):
-
-        self.logger.info(50*'#' + f" Iteration number #{self.iteration_number} started " + 50*'#')
+    def synchronize_prompt(self) -> bool:
+        '''
+        Finds the exact enable prompt of the DUT and disables the paging of the command outputs. Called after each login
+        in prompt-synchronized mode. Returns False (and closes the connection) if the DUT didn't answer.
+        '''
+        self.prompt = None
+        # the first prompt after the sentinel is the exact prompt: the buffered output of the login is discarded
+        if self.send_sentinel() and self.connection.expect([r'[^\r\n]*\S\#', TIMEOUT, EOF], timeout=self.command_timeout) == 0:
+            prompt = self.connection.after.strip()
+            self.prompt = compile('[\r\n]' + escape(prompt))
+            output = self.get_synchronized_output(self.paging_command)
+            if output is not None:
+                if 'Invalid' in output or 'Error' in output:
+                    self.logger.info(f"WARNING : CLI-MONITOR : synchronize_prompt() - The DUT rejected '{self.paging_command}'. "
+                                     f"The paged outputs are read page by page.")
+                self.logger.info(f"INFO : CLI-MONITOR : synchronize_prompt() - CLI synchronized on prompt {prompt}.")
+                return True
+        self.logger.info(f"ERROR : CLI-MONITOR : synchronize_prompt() - The DUT didn't return its prompt within {self.command_timeout} seconds.")
+        if self.connection:
+            self.connection.close()
+            self.connection = False
+        return False
+
+    def send_sentinel(self) -> bool:
+        '''
+        Sends a sentinel line with a unique token and waits for the DUT to echo it. The DUT handles its input in order, so
+        whatever was pending (late output, prompts of stray newlines) is discarded with the output that precedes the token.
+        Returns False if the token didn't come back.
+        '''
+        self.sentinel_number += 1
+        token = f'!sync-{self.sentinel_number}'
+        self.connection.send(token + '\r')
+        return self.connection.expect_exact([token, TIMEOUT, EOF], timeout=self.command_timeout) == 0
+
+    def set_items(self, items: list) -> None:
+        self.item_list = list(set(items)) # can contain either OIDs or MIBs. The conversion is done to remove duplicate items
+        # the labels of the items, grouped by the command whose output contains them: {command: [label, ...]}
+        commands = {}
+        for command, label in dict.fromkeys(items):
+            commands.setdefault(command, []).append(label)
+        self.commands = commands
 
-        for item in self.item_list:
+    def cli_querier(self):
+        '''
+        Sends the commands of the due items and publishes the items of the iteration. Returns True if the DUT answered at
+        least one command, False if it didn't answer any, None if no command was due.
+        '''
+        results = []
+        answered = None
+
+        # each distinct command is sent once per iteration and all its due items are extracted from its output.
+        # A command whose items are all polled at their own interval is sent only when one of them is due
+        for command, labels in self.commands.items():
+
+            labels = self.due_items(labels)
+            if not labels:
+                continue
 
+            answered = answered or False
             if not self.connection:
-                self.logger.info(f'ITEM: {item[1]} query result: ERROR:  CLI connection dead.')
+                results.extend((label, f'ITEM: {label} query result: ERROR:  CLI connection dead.') for label in labels)
                 continue # crash_detector needs the items written in the logfile for each iteration to calculate time intervals. can't use break or return
 
-            self.connection.send('\r')
+            if not self.prompt_sync: # the prompt-synchronized output needs no buffer flush
+                self.connection.send('\r')
 
-            if not self.clear_cli_buffer():
-                self.logger.info(f'ITEM: {item[1]} query result: ERROR:  CLI connection dead.')
-                continue
+                if not self.clear_cli_buffer():
+                    results.extend((label, f'ITEM: {label} query result: ERROR:  CLI connection dead.') for label in labels)
+                    continue
 
-            self.connection.send(item[0] + '\r')
-            index = self.connection.expect(['--More-- or \(q\)uit', '\S\#$', TIMEOUT, EOF], timeout = 3)
+            start = perf_counter()
+            if self.prompt_sync:
+                output = self.get_synchronized_output(command)
+            else:
+                output = self.get_command_output(command, labels)
+            self.metrics.observe_request(labels, perf_counter() - start)
+            if output is None:
+                error = 'CLI connection dead.' if not self.connection else f'No prompt within {self.command_timeout} seconds.'
+                results.extend((label, f'ITEM: {label} query result: ERROR:  {error}') for label in labels)
+                continue
+            # an output timed out without any text (get_command_output()) is not an answer
+            answered = answered or bool(output.strip())
+
+            for label in labels:
+                try:
+                    result = output[output.find(label):output.find('\n', output.find(label))]
+                    result = search(r'\.\.(-|)[^.].*', result).group(0)[2:]
+                    results.append((label, f'ITEM: {label} query result:  {result.strip()}'))
+                    self.error_counter = 0
+                except Exception as e:
+                    results.append((label, f'ITEM: {label} query result: ERROR:  {str(e).strip()}'))
+                    self.error_counter += 1
+                    if self.connection and self.error_counter >= len(self.item_list)*3: # if for more than three consecutive iterations, values can not be retrieved, close the connection.
+                        self.connection.close()
+                        self.connection = False
+        self.publish(results)
+        return answered
+
+    def get_command_output(self, command: str, labels: list):
+        '''
+        Sends a command and returns its whole output, the pages of a paged output included. Paging stops as soon as
+        all the labels are found in the output. Returns None if the CLI connection died.
+        '''
+        self.connection.send(command + '\r')
+        index = self.connection.expect([r'--More-- or \(q\)uit', r'\S\#$', TIMEOUT, EOF], timeout = 3)
+        output = ''
 
-            while True:
-                if index == 0 and item[1] in self.connection.before:
-                    result = self.connection.before[self.connection.before.find(item[1]):self.connection.before.find('\n', self.connection.before.find(item[1]))]
-                    self.connection.send('q\r')
-                    break
-                elif index == 0:
-                    self.connection.send('\n\r')
-                elif index == 1 or index == 2:
-                    result = self.connection.before[self.connection.before.find(item[1]):self.connection.before.find('\n', self.connection.before.find(item[1]))]
-                    break
-                else:
-                    self.logger.info(f'ITEM: {item[1]} query result: ERROR:  CLI connection dead.')
-                    self.connection.close()
-                    self.connection = False
-                    continue
+        while True:
+            if index == 3:
+                self.connection.close()
+                self.connection = False
+                return None
+            output += self.connection.before
+            if index == 1 or index == 2:
+                return output
+            if all(label in output for label in labels):
+                self.connection.send('q\r')
+                return output
+            self.connection.send('\n\r')
+            index = self.connection.expect([r'--More-- or \(q\)uit', r'\S\#$', TIMEOUT, EOF], timeout = 5)
+
+    def get_synchronized_output(self, command: str):
+        '''
+        Sends a command, framed by a sentinel, and returns its output as soon as the prompt reappears. The pages of a paged
+        output are requested until the prompt. Returns None if the connection died or if the prompt didn't come back within
+        command_timeout: the next sentinel resynchronizes the CLI.
+        '''
+        if not self.send_sentinel() or self.connection.expect([self.prompt, TIMEOUT, EOF], timeout=self.command_timeout) != 0:
+            return self._lost_prompt_hlp()
+        self.connection.send(command + '\r')
+        output = ''
+        while True:
+            index = self.connection.expect([self.prompt, r'--More-- or \(q\)uit', TIMEOUT, EOF], timeout=self.command_timeout)
+            if index >= 2:
+                return self._lost_prompt_hlp()
+            output += self.connection.before
+            if index == 0:
+                return output
+            self.connection.send('\r')
 
-                index = self.connection.expect(['--More-- or (q)uit', '\S\#$', TIMEOUT, EOF], timeout = 5)
+    def _lost_prompt_hlp(self):
+        '''Helper method. Closes the connection if it died, the prompt is searched again by the next sentinel otherwise.'''
 
-            try:
-                result = search('\.\.(-|)[^.].*', result).group(0)[2:]
-                self.logger.info(f'ITEM: {item[1]} query result:  {result.strip()}')
-                self.error_counter = 0
-            except Exception as e:
-                self.logger.info(f'ITEM: {item[1]} query result: ERROR:  {str(e).strip()}')
-                self.error_counter += 1
-                if self.error_counter >= len(self.item_list)*3: # if for more than three consecutive iterations, values can not be retrieved, close the connection.
-                    self.connection.close()
-                    self.connection = False
-                    continue
-        self.logger.info(129*'#' + 3*'\n')
+        if not self.connection.isalive():
+            self.logger.info(f"ERROR : CLI-MONITOR : get_synchronized_output() - CLI connection dead.")
+            self.connection.close()
+            self.connection = False
+        else:
+            self.logger.info(f"ERROR : CLI-MONITOR : get_synchronized_output() - No prompt within {self.command_timeout} seconds.")
+        return None
 
     def clear_cli_buffer(self):
         #self.logger.info(f"INFO : CLI-MONITOR : clear_cli_buffer() - 'before' buffer clear requested")
         index = self.connection.expect([TIMEOUT, EOF], timeout= 0.1)
         if index == 0:
             if self.connection.before:
+                self.metrics.count('cli_buffer_flushes')
                 self.connection.expect (r'.+')  # stack overflow. No idea what this does but it works
             return True
         else:
+            self.metrics.count('cli_buffer_failures')
             self.logger.info(f"ERROR : CLI-MONITOR : clear_cli_buffer() - CLI connection dead.")
             self.connection.close()
             self.connection = False
@@ -203,9 +328,10 @@ class console_monitor(Thread):
 
     def run(self):
         self.logger.info(f"INFO : CLI-MONITOR : run() - Thread operation started.\n\n\n")
-        if not self.endtime:
-            self.logger.info(f"WARNING : CLI-MONITOR : run() - A time limit for the monitoring process was not set.\n")
+        scheduler.add(self)
         while True:
+            self.thread_sleep.wait()
+            self.thread_sleep.clear()
             if self.endtime:
                 if not self.endtime > datetime.now():
                     self.logger.info(f"INFO : CLI-MONITOR : run() - Thread finished execution. Time limit reached.")
@@ -213,36 +339,52 @@ class console_monitor(Thread):
             if self.stop_thread:
                 self.logger.info(f"WARNING : CLI-MONITOR : run() - Thread stopped ahead of time due to a call to stop().")
                 break
+            if self.missed_iterations > self.reported_missed_iterations:
+                self.logger.info(f"WARNING : CLI-MONITOR : run() - The previous iteration overran the interval. "
+                                 f"{self.missed_iterations - self.reported_missed_iterations} iteration(s) skipped.")
+                self.reported_missed_iterations = self.missed_iterations
+            self.busy = True
+            start = perf_counter()
+            if not self.connection and not self.health.polling_due(monotonic()):
+                # the DUT is down and its next connection attempt is not due
+                self.skip_iteration([label for labels in self.commands.values() for label in self.due_items(labels)])
+                self.iteration_number += 1
+                self.busy = False
+                continue
+            connected = None # the result of the connection attempt of the iteration, if there is one
             if not self.connection:
                 self.logger.info(f"ERROR : CLI-MONITOR : run() - CLI connection dead. Trying to respawn it...")
-                self.spawn_cli_connection()
-                if not self.cli_logger():
-                    continue
+                self.metrics.count('connection_spawns')
+                # a console server may accept the connection while the DUT behind it is dead: the login must succeed too
+                connected = self.spawn_cli_connection() and self.cli_logger() is True
+                if not connected and self.connection:
+                    self.connection.close()
+                    self.connection = False
+                # the items of a failed attempt are published as 'CLI connection dead.' errors
             print(f'I am working. Iteration number {self.iteration_number}')
-            self.cli_querier()
+            answered = self.cli_querier()
+            # a failed connection attempt is a failed iteration. An iteration without commands to send counts as answered
+            # if it connected to the DUT
+            answered = False if connected is False else (connected if answered is None else answered)
+            if answered is not None:
+                change = self.record_health(answered)
+                if change:
+                    self.logger.info(f"{'INFO' if answered else 'ERROR'} : CLI-MONITOR : run() - {change}")
+            self.metrics.observe_iteration(perf_counter() - start)
             self.iteration_number += 1
-            self.thread_sleep.wait(timeout=self.profile['interval'])
+            self.busy = False
+        scheduler.remove(self)
         if self.connection:
             self.connection.close()
-        self.end_thread_processing()
+        self.end_subscriptions()
         self.stopped.set()
 
-    def end_thread_processing(self):
-        parse_items = {}
-        parse_items.update(self.check_values_change)
-        parse_items.update(self.statistics)
-        parse_items.update(self.detect_crashes)
-        utils = monitor_utils(parse_item = parse_items)
-        utils.parse_logfile(logfile_path=self.logfile_path, worker_type='CONSOLE_MONITOR')
-        if self.statistics:
-            utils.generate_statistics(logfile_path=self.logfile_path, item_list = self.profile['statistics'],
-                                      worker_type='CONSOLE_MONITOR')
-        if self.detect_crashes:
-            utils.crash_detector(logfile_path=self.logfile_path, uptime_item=self.profile['detect_crashes'],
-                                 uptime_type='timestring', worker_type='CONSOLE_MONITOR')
-        if self.check_values_change:
-            utils.get_item_value_change(logfile_path=self.logfile_path, item_list=self.profile['check_values_change'],
-                                        worker_type='CONSOLE_MONITOR')
+    def tick(self) -> None:
+        '''Called by the scheduler at each deadline. Starts an iteration, unless the previous one is still running.'''
+        if self.busy:
+            self.missed_iterations += 1
+        else:
+            self.thread_sleep.set()
 
     def stop(self):
         self.logger.info(f"INFO : CLI-MONITOR : stop() - Thread stop command received.")
@@ -0,0 +1,112 @@
+'''
+    Change-only (delta) logging of the iterations (profile key 'delta_logging': N).
+    An item is written to the logfile only when its value changed since the previous iteration, or when it is an error.
+    Every N iterations, a keyframe iteration writes all the items. An item that is no longer returned (e.g. a table row that
+    disappeared) is written as 'ITEM: <item> no longer returned'. The logfile starts with the DELTA_HEADER line, from which
+    monitor_utils.parse_logfile() knows that it rebuilds the per-iteration series: the unchanged items get the value they had
+    in the previous iteration, at the time of the iteration.
+    The items polled at their own interval (profile key 'item_intervals', announced by 'ITEM: <item> polled every <n> seconds'
+    lines) are not in every iteration: they are written each time they are polled, and never carried forward.
+'''
+from re import compile
+
+# the banners of the iterations in the logfiles
+BANNER = 50*'#'
+ITERATION_END = 129*'#' + 3*'\n'
+KEYFRAME = '(keyframe)'
+DELTA_HEADER = 'Delta logging enabled'
+REMOVED_PATTERN = compile(r'\| ITEM: (.+?) no longer returned$')
+OWN_INTERVAL_PATTERN = compile(r'\| ITEM: (.+?) polled every \S+ seconds$')
+
+
+def is_delta_logfile(logfile_path: str, head_size: int = 2**16) -> bool:
+    '''Returns True if the logfile was written in delta mode: its first lines contain the DELTA_HEADER line.'''
+
+    with open(logfile_path, 'rb') as logfile:
+        return DELTA_HEADER.encode() in logfile.read(head_size)
+
+
+class delta_encoder():
+    '''Selects the results of the iterations of a subscription that are written to the logfile in delta mode.'''
+
+    def __init__(self, keyframe_interval: int, own_interval=None) -> None:
+
+        self.keyframe_interval = max(int(keyframe_interval), 1)
+        self.own_interval = own_interval or (lambda item: False) # returns True for the items polled at their own interval
+        self.last = {} # {item: logfile_message} of the previous iteration
+
+    def encode(self, iteration_number: int, results: list) -> tuple:
+        '''
+        Returns (keyframe, written, removed): whether the iteration is a keyframe, the (item, logfile_message) results
+        to write and the items that were returned by the previous iteration but not by this one.
+        '''
+        current = dict(results)
+        keyframe = (iteration_number - 1) % self.keyframe_interval == 0
+        if keyframe:
+            written, removed = results, []
+        else:
+            written = [(item, message) for item, message in results
+                       if self.last.get(item) != message or ' query result: ERROR:' in message or self.own_interval(item)]
+            removed = [item for item in self.last if item not in current and not self.own_interval(item)]
+        self.last = current
+        return keyframe, written, removed
+
+
+class delta_decoder():
+    '''
+        Rebuilds the per-iteration samples of the parsed items of a delta logfile. The parser feeds it the parsed samples
+        (sample()) and the other lines (control()); control() returns the samples of the items that were not written in
+        the iteration that just ended, with their last value and the timestamp of the iteration.
+    '''
+
+    def __init__(self) -> None:
+
+        self.timestamp = None  # the timestamp of the current iteration (its banner)
+        self.keyframe = False
+        self.open = False      # True between the banner and the end of an iteration
+        self.items = {}        # {item: [last value, written in the current iteration]}
+        self.own_intervals = set() # the items and tables polled at their own interval
+
+    def sample(self, item: str, value: str) -> None:
+        self.items[item] = [value, True]
+
+    def control(self, line: str) -> list:
+        '''Processes a line which is not a query result. Returns a list of (timestamp, item, value) samples.'''
+
+        message = line.partition(' | ')[2]
+        if message.startswith(BANNER):
+            if ' Iteration number #' in message:
+                samples = self._end_hlp() if self.open else []
+                self.timestamp, self.keyframe, self.open = line[:19], KEYFRAME in message, True
+                return samples
+            if message.startswith(ITERATION_END[:129]) and self.open:
+                return self._end_hlp()
+            return []
+        removed = REMOVED_PATTERN.search(line.rstrip('\n'))
+        if removed:
+            self.items.pop(removed.group(1), None)
+        own_interval = OWN_INTERVAL_PATTERN.search(line.rstrip('\n'))
+        if own_interval:
+            self.own_intervals.add(own_interval.group(1))
+        return []
+
+    def _own_interval_hlp(self, item: str) -> bool:
+        '''Helper method. Returns True if the item, or the table of the row item, is polled at its own interval.'''
+
+        return any(item == name or item.startswith(name + '.') for name in self.own_intervals)
+
+    def _end_hlp(self) -> list:
+        '''Helper method. Ends the current iteration. The items not written by a keyframe are no longer returned.'''
+
+        samples = []
+        for item, state in list(self.items.items()):
+            if state[1]:
+                state[1] = False
+            elif self._own_interval_hlp(item):
+                continue
+            elif self.keyframe:
+                del self.items[item]
+            else:
+                samples.append((self.timestamp, item, state[0]))
+        self.open = False
+        return samples
@@ -0,0 +1,80 @@
+'''
+    The health of the DUT of a polling worker: a circuit breaker, so an unreachable DUT doesn't keep its worker waiting out
+    the request timeouts of every item in every iteration.
+    An iteration in which the DUT didn't answer any request is a failure. The first failure makes the DUT degraded, and
+    'down_after' consecutive failures (profile key, default: 3) make it down. While the DUT is down, its items are not polled:
+    they are published as errors, and a single cheap probe (a GET of sysUpTime.0, or a connection attempt) is sent at an
+    exponential backoff, from the worker's interval up to 'max_backoff' seconds (profile key, default: 300).
+    The first answered probe or iteration makes the DUT healthy again.
+'''
+
+HEALTHY, DEGRADED, DOWN = 'healthy', 'degraded', 'down'
+STATES = (HEALTHY, DEGRADED, DOWN)
+# any answer to a GET of this OID, even an error, proves that the SNMP agent of the DUT is reachable
+PROBE_OID = '.1.3.6.1.2.1.1.3.0'
+
+
+def is_timeout(error) -> bool:
+    '''Returns True if the error of a request (netsnmp's ErrorStr, an exception) is a timeout: the DUT didn't answer.'''
+
+    return 'timeout' in str(error).lower() or isinstance(error, TimeoutError)
+
+
+def unreachable_message(item: str) -> str:
+    '''Returns the logfile message of an item that is not polled because the DUT didn't answer a previous request of the iteration.'''
+
+    return f'ITEM: {item} query result: ERROR: Timeout. Not polled, the DUT didn\'t answer the previous request of the iteration.'
+
+
+class dut_health():
+    '''
+        The health state machine (healthy / degraded / down) of a DUT. The worker asks polling_due() at the start of each
+        iteration and records the outcome of the iteration, or of the probe, with record().
+    '''
+
+    def __init__(self, down_after: int = 3, max_backoff: float = 300) -> None:
+
+        self.down_after = max(int(down_after), 1)
+        self.max_backoff = max_backoff
+        self.state = HEALTHY
+        self.failures = 0      # the consecutive failed iterations (or probes)
+        self.backoff = None    # the delay between two probes of a down DUT
+        self.next_probe = None # the monotonic time of the next probe of a down DUT
+
+    def polling_due(self, now: float) -> bool:
+        '''Returns True if the DUT is polled in this iteration: it isn't down, or its next probe is due.'''
+
+        return self.state != DOWN or now >= self.next_probe
+
+    def record(self, answered: bool, now: float, interval: float) -> str:
+        '''
+        Records whether the DUT answered the requests of an iteration (or the probe). Returns the description of the state
+        change, or None if the state didn't change.
+        :interval: the interval of the worker, the first delay between the probes of a down DUT
+        '''
+        previous = self.state
+        if answered:
+            self.state, self.failures, self.backoff, self.next_probe = HEALTHY, 0, None, None
+        else:
+            self.failures += 1
+            if self.state == DOWN:
+                self.backoff = min(self.backoff * 2, max(self.max_backoff, interval))
+                self.next_probe = now + self.backoff
+            elif self.failures >= self.down_after:
+                self.state, self.backoff = DOWN, interval
+                self.next_probe = now + self.backoff
+            else:
+                self.state = DEGRADED
+        if self.state == previous:
+            return None
+        if self.state == DOWN:
+            return f"The DUT is down: no answer in {self.failures} consecutive iterations. Its items are not polled until it " \
+                   f"answers a probe. The first probe is in {self.backoff:g} seconds."
+        if self.state == DEGRADED:
+            return "The DUT is degraded: it didn't answer the requests of the iteration."
+        return f"The DUT is healthy again, after {previous}."
+
+    def skipped_message(self, item: str, now: float) -> str:
+        '''Returns the logfile message of an item that is not polled because the DUT is down.'''
+
+        return f'ITEM: {item} query result: ERROR: DUT down, not polled. Next probe in {max(self.next_probe - now, 0):.0f} seconds.'
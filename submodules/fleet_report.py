@@ -0,0 +1,108 @@
+'''
+    The fleet report of a dut_monitor: the results of the end of run analysis of all its workers (see
+    monitor_utils.analyze_logfile()), collected in memory as the workers finish, merged into a single summary:
+    the distribution of each 'statistics' item across the DUTs, the DUTs with the highest maximums (top N),
+    the crashes and the value changes per DUT. The summary is written once, as text and as JSON.
+'''
+from datetime import datetime
+from json import dump as json_dump
+from monitor_utils import monitor_utils
+
+# the percentiles of the distributions across the DUTs
+PERCENTILES = {'min': 0, 'median': 50, 'p90': 90, 'max': 100}
+
+
+def summarize(analyses: list, top: int = 5, pending: list = ()) -> dict:
+    '''
+    Merges the analysis results of the workers into the fleet summary. Returns a dictionary:
+    {'generated', 'duts', 'failed': {dut: error}, 'pending': [dut],
+     'items': {item: {'duts', 'maximum': {min, median, p90, max}, 'mean': {min, median, p90, max}, 'top': [{dut, maximum, maximum_at, mean}]}},
+     'crashes': {'total', 'duts': {dut: [crash]}}, 'value_changes': {'total', 'items': {item: {dut: number of changes}}}}
+    :analyses: the analysis dictionaries of the workers (keys dut, utility, logfile, error, statistics, crashes, value_changes)
+    :top: the number of DUTs listed per item, by descending maximum
+    :pending: the DUTs whose workers didn't finish their analysis
+    '''
+    summary = {'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'duts': len(analyses),
+               'failed': {analysis['dut']: analysis['error'] for analysis in analyses if analysis['error']},
+               'pending': list(pending), 'items': {}, 'crashes': {'total': 0, 'duts': {}},
+               'value_changes': {'total': 0, 'items': {}}}
+
+    per_item = {} # {item: [(dut, stats)]}
+    for analysis in sorted(analyses, key=lambda analysis: analysis['dut']):
+        for item, stats in analysis.get('statistics', {}).items():
+            per_item.setdefault(item, []).append((analysis['dut'], stats))
+        if analysis.get('crashes'):
+            summary['crashes']['duts'][analysis['dut']] = analysis['crashes']
+            summary['crashes']['total'] += len(analysis['crashes'])
+        for item, changes in analysis.get('value_changes', {}).items():
+            summary['value_changes']['items'].setdefault(item, {})[analysis['dut']] = len(changes)
+            summary['value_changes']['total'] += len(changes)
+
+    for item, duts in sorted(per_item.items()):
+        outliers = sorted(duts, key=lambda pair: pair[1]['maximum'], reverse=True)[:max(top, 0)]
+        summary['items'][item] = {'duts': len(duts),
+                                  'maximum': _distribution_hlp([stats['maximum'] for _, stats in duts]),
+                                  'mean': _distribution_hlp([stats['mean'] for _, stats in duts]),
+                                  'top': [{'dut': dut, 'maximum': stats['maximum'], 'maximum_at': stats['maximum_at'],
+                                           'mean': stats['mean']} for dut, stats in outliers]}
+    return summary
+
+
+def _distribution_hlp(values: list) -> dict:
+    '''Helper function. Returns the percentiles of the values of the DUTs: {name: value} (see PERCENTILES)'''
+
+    values = sorted(values)
+    percentiles = monitor_utils._percentiles_hlp(values.__getitem__, len(values), tuple(PERCENTILES.values()))
+    return {name: percentiles[p] for name, p in PERCENTILES.items()}
+
+
+def _number_hlp(value) -> str:
+    '''Helper function. Formats a value of a distribution: the integers as they are, the other values with 2 decimals at most.'''
+
+    return f'{value:.2f}'.rstrip('0').rstrip('.') if isinstance(value, float) else str(value)
+
+
+def format_text(summary: dict) -> str:
+    '''Returns the fleet summary as a text report.'''
+
+    failed, pending = summary['failed'], summary['pending']
+    logs = f"Fleet report, generated at {summary['generated']}\n"
+    logs += f"DUTs analyzed: {summary['duts'] - len(failed)}, failed: {len(failed)}, not finished: {len(pending)}\n"
+    logs += f"DUTs with crashes: {len(summary['crashes']['duts'])} ({summary['crashes']['total']} crash(es)), " \
+            f"value changes: {summary['value_changes']['total']}\n"
+
+    logs += '\nSTATISTICS (distribution across the DUTs: min / median / p90 / max)\n'
+    for item, stats in summary['items'].items():
+        logs += f"Item {item}, {stats['duts']} DUT(s):\n" \
+                f" Maximum: {' / '.join(_number_hlp(value) for value in stats['maximum'].values())}\n" \
+                f" Average: {' / '.join(_number_hlp(value) for value in stats['mean'].values())}\n" \
+                f" Highest maximums: " + ', '.join(f"{dut['dut']} {dut['maximum']} (at {dut['maximum_at']})" for dut in stats['top']) + '\n'
+
+    logs += '\nCRASHES\n'
+    for dut, crashes in sorted(summary['crashes']['duts'].items(), key=lambda pair: len(pair[1]), reverse=True):
+        logs += f"{dut}: {len(crashes)} crash(es), in iteration(s) " + \
+                ', '.join(f"{crash['iteration']} (at {crash['timestamp']})" for crash in crashes) + '\n'
+
+    logs += '\nVALUE CHANGES\n'
+    for item, duts in summary['value_changes']['items'].items():
+        changed = sorted(((dut, changes) for dut, changes in duts.items() if changes), key=lambda pair: pair[1], reverse=True)
+        logs += f"Item {item}: {sum(changes for _, changes in changed)} change(s) on {len(changed)} of {len(duts)} DUT(s)"
+        logs += (': ' + ', '.join(f'{dut} {changes}' for dut, changes in changed) + '\n') if changed else '\n'
+
+    for dut, error in failed.items():
+        logs += f"\nERROR : {dut} : the end of run analysis failed: {error}"
+    if pending:
+        logs += f"\nWARNING : the workers of {len(pending)} DUT(s) didn't finish their analysis: {', '.join(pending)}"
+    return logs + '\n'
+
+
+def write(summary: dict, path: str) -> tuple:
+    '''Writes the fleet summary to path (text) and to path with the .json extension. Returns (text_path, json_path).'''
+
+    json_path = path.rsplit('.', 1)[0] + '.json'
+    with open(path, 'w', encoding='utf-8') as report:
+        report.write(format_text(summary))
+    with open(json_path, 'w', encoding='utf-8') as report:
+        # the values that are not numbers (e.g. the timestamps) are written as strings
+        json_dump(summary, report, indent=1, default=str)
+    return path, json_path
@@ -0,0 +1,154 @@
+from array import array
+from datetime import datetime, timedelta
+
+# the logfile timestamps are naive local times. They are stored as seconds elapsed since this naive epoch,
+# so the conversion back to the logfile format is exact and doesn't depend on the timezone or DST
+EPOCH = datetime(1970, 1, 1)
+
+
+class item_series():
+    '''
+        Columnar storage of the values parsed for a single item. Each sample takes about 16 bytes:
+        * timestamps: array('d') of seconds since EPOCH
+        * values: array('q') holding either the integral value of the sample, or the code of its dictionary-encoded value
+        * errors: bitmap, the bit of a sample is set if the value couldn't be retrieved ('error')
+        * encoded: bitmap, the bit of a sample is set if its value is dictionary-encoded (non integral values)
+        Only the stripped values are kept, which is how they are used by the monitor_utils analysis methods.
+        Iterating over the series yields (timestamp, value) string tuples, like the lists that were used before.
+    '''
+
+    __slots__ = ('timestamps', 'values', 'errors', 'encoded', 'dictionary', 'codes', '_last_timestamp')
+
+    def __init__(self) -> None:
+
+        self.timestamps = array('d')
+        self.values = array('q')
+        self.errors = bytearray()
+        self.encoded = bytearray()
+        self.dictionary = [] # code -> value
+        self.codes = {}      # value -> code
+        self._last_timestamp = (None, None) # consecutive samples usually share their timestamp
+
+    def append(self, timestamp: str, value: str) -> None:
+        '''
+        Appends a sample to the series.
+        :timestamp: the logfile timestamp of the sample: YYYY-MM-DD HH:MM:SS
+        :value: the parsed value, or 'error' if it couldn't be retrieved
+        '''
+
+        if timestamp != self._last_timestamp[0]:
+            self._last_timestamp = (timestamp, (datetime.fromisoformat(timestamp) - EPOCH).total_seconds())
+        self.append_sample(self._last_timestamp[1], value)
+
+    def append_sample(self, timestamp: float, value: str) -> None:
+        '''Appends a sample whose timestamp is already converted to seconds since EPOCH.'''
+
+        index = len(self.values)
+        if not index & 7:
+            self.errors.append(0)
+            self.encoded.append(0)
+        self.timestamps.append(timestamp)
+
+        if value == 'error':
+            self.errors[index >> 3] |= 1 << (index & 7)
+            self.values.append(0)
+            return
+
+        value = value.strip()
+        try:
+            number = int(value)
+            if str(number) != value or not -2**63 <= number < 2**63:
+                raise ValueError
+            self.values.append(number)
+        except ValueError:
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.dictionary)
+                self.dictionary.append(value)
+            self.encoded[index >> 3] |= 1 << (index & 7)
+            self.values.append(code)
+
+    def extend(self, other) -> None:
+        '''Appends all the samples of another series, e.g. the series of the same item parsed from the next chunk of a logfile.'''
+
+        offset = len(self.values)
+        self.timestamps.extend(other.timestamps)
+        if other.dictionary:
+            # the codes of the other series are translated to codes of this series
+            codes = []
+            for value in other.dictionary:
+                code = self.codes.get(value)
+                if code is None:
+                    code = self.codes[value] = len(self.dictionary)
+                    self.dictionary.append(value)
+                codes.append(code)
+            self.values.extend(codes[value] if other.is_encoded(index) else value for index, value in enumerate(other.values))
+        else:
+            self.values.extend(other.values)
+        self.errors = self._extend_bitmap_hlp(self.errors, other.errors, offset, len(self.values))
+        self.encoded = self._extend_bitmap_hlp(self.encoded, other.encoded, offset, len(self.values))
+        self._last_timestamp = (None, None)
+
+    @staticmethod
+    def _extend_bitmap_hlp(bitmap: bytearray, other: bytearray, offset: int, length: int) -> bytearray:
+        '''Helper method. Returns the bitmap of 'offset' samples followed by the bits of 'other', sized for 'length' samples.'''
+
+        bits = int.from_bytes(bitmap, 'little') | int.from_bytes(other, 'little') << offset
+        return bytearray(bits.to_bytes((length + 7) >> 3, 'little'))
+
+    def is_error(self, index: int) -> bool:
+        return bool(self.errors[index >> 3] >> (index & 7) & 1)
+
+    def is_encoded(self, index: int) -> bool:
+        return bool(self.encoded[index >> 3] >> (index & 7) & 1)
+
+    def value(self, index: int) -> str:
+        '''Returns the stripped value of a sample as string, or 'error'.'''
+
+        if self.is_error(index):
+            return 'error'
+        if self.is_encoded(index):
+            return self.dictionary[self.values[index]]
+        return str(self.values[index])
+
+    def integral_value(self, index: int) -> int:
+        '''Returns the value of a sample as integer. Raises ValueError if the value is not integral.'''
+
+        if self.is_encoded(index):
+            return int(self.dictionary[self.values[index]])
+        return self.values[index]
+
+    def timestamp(self, index: int) -> str:
+        '''Returns the timestamp of a sample in the logfile format: YYYY-MM-DD HH:MM:SS'''
+
+        return format_timestamp(self.timestamps[index])
+
+    def valid_indexes(self) -> list:
+        '''Returns the indexes of the samples whose value could be retrieved.'''
+
+        errors = self.errors
+        return [index for index in range(len(self.values)) if not errors[index >> 3] >> (index & 7) & 1]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index: int) -> tuple:
+        if index < 0:
+            index += len(self.values)
+        return (self.timestamp(index), self.value(index))
+
+    def __iter__(self):
+        for index in range(len(self.values)):
+            yield self[index]
+
+    def nbytes(self) -> int:
+        '''Returns the memory used by the columns, in bytes (the dictionary of the encoded values excluded).'''
+
+        return self.timestamps.itemsize * len(self.timestamps) + self.values.itemsize * len(self.values) + \
+               len(self.errors) + len(self.encoded)
+
+
+def format_timestamp(seconds: float) -> str:
+    '''Converts seconds since EPOCH to the logfile timestamp format: YYYY-MM-DD HH:MM:SS'''
+
+    return (EPOCH + timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,147 @@
+from threading import Thread, Event, Lock, current_thread
+from queue import Queue, Empty
+from time import monotonic
+from os.path import realpath
+import logging
+import sys
+
+
+class log_writer():
+    '''
+        Process-wide writer of the worker output. The polling threads only queue their log records and samples,
+        and a dedicated thread writes them in batches: each target (logfile, sample store) gets a single write per batch.
+        A batch is written when the oldest queued item is flush_interval seconds old, when max_batch items are queued,
+        or when flush() is called. The queue is bounded by max_pending items: if the disk can't keep up,
+        the polling threads wait for room in the queue instead of the memory growing without limit.
+        A target implements write_batch(items), which is called by the writer thread only.
+    '''
+
+    def __init__(self, flush_interval: float = 1.0, max_batch: int = 10000, max_pending: int = 100000) -> None:
+
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue = Queue(maxsize=max_pending)
+        self.thread = None
+        self.thread_lock = Lock()
+        self.open_paths = set() # the real paths of the files of the open batched_file_handlers
+
+    def configure(self, flush_interval: float = None, max_batch: int = None, max_pending: int = None) -> None:
+        '''Changes the settings of the writer. They apply to the items queued afterwards.'''
+
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if max_batch is not None:
+            self.max_batch = max_batch
+        if max_pending is not None:
+            self.queue.maxsize = max_pending
+
+    def put(self, target, item) -> None:
+        '''Queues an item to be written by target.write_batch(). Blocks only if max_pending items are already queued.'''
+
+        if self.thread is None:
+            with self.thread_lock:
+                if self.thread is None:
+                    self.thread = Thread(target=self._run, name='log_writer', daemon=True)
+                    self.thread.start()
+        self.queue.put((target, item))
+
+    def is_writing(self, path: str) -> bool:
+        '''Returns True if the file is written by an open batched_file_handler, e.g. the logfile of a running worker.'''
+
+        return realpath(path) in self.open_paths
+
+    def flush(self) -> None:
+        '''Returns once all the items queued before the call are written.'''
+
+        if self.thread is None or current_thread() is self.thread:
+            return
+        flushed = Event()
+        self.queue.put((None, flushed))
+        flushed.wait()
+
+    def _run(self) -> None:
+
+        pending = {}     # {target: [items]}, in the order they were queued
+        count = 0
+        deadline = None  # when the pending items are written at the latest
+        while True:
+            waiters = []
+            try:
+                target, item = self.queue.get(timeout=None if deadline is None else max(deadline - monotonic(), 0))
+                if target is None:
+                    waiters.append(item)
+                else:
+                    pending.setdefault(target, []).append(item)
+                    count += 1
+                    if deadline is None:
+                        deadline = monotonic() + self.flush_interval
+            except Empty:
+                pass
+            if waiters or count >= self.max_batch or (deadline is not None and monotonic() >= deadline):
+                self._write_hlp(pending)
+                pending, count, deadline = {}, 0, None
+                for flushed in waiters:
+                    flushed.set()
+
+    @staticmethod
+    def _write_hlp(pending: dict) -> None:
+        '''Helper method. Writes the pending items of each target. The failure of a target doesn't affect the others.'''
+
+        for target, items in pending.items():
+            try:
+                target.write_batch(items)
+            except Exception as e:
+                print(f"ERROR : LOG-WRITER : _write_hlp() - Failed to write {len(items)} item(s) to {target}: {e}", file=sys.stderr)
+
+
+class batched_file_handler(logging.Handler):
+    '''
+        Logging handler whose records are written to the file by the log_writer thread. emit() only queues the record:
+        the record is formatted and written later, with its original creation time. flush() waits for the queued
+        records to be written, so the file can be read afterwards. Like logging.FileHandler(delay=True), the file is
+        opened by the first write, so creating the handler doesn't wait for the disk.
+    '''
+
+    terminator = '\n'
+
+    def __init__(self, path: str) -> None:
+
+        logging.Handler.__init__(self)
+        self.path = path
+        self.file = None
+        writer.open_paths.add(realpath(path))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        writer.put(self, record)
+
+    def write_batch(self, records: list) -> None:
+
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(''.join(lines))
+        self.file.flush()
+
+    def flush(self) -> None:
+        writer.flush()
+
+    def close(self) -> None:
+        try:
+            writer.flush()
+            if self.file is not None and not self.file.closed:
+                self.file.close()
+        finally:
+            writer.open_paths.discard(realpath(self.path))
+            logging.Handler.close(self)
+
+    def __repr__(self) -> str:
+        return f'<batched_file_handler {self.path}>'
+
+
+# the writer shared by all the workers of the process
+writer = log_writer()
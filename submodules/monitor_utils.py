@@ -1,36 +1,120 @@
-from datetime import datetime
-from re import split
-from subprocess import run, CalledProcessError
+from re import split, compile
+from shutil import which
 from sys import version_info
-from importlib import util
+from importlib import util, import_module
 from platform import system
 from collections import defaultdict
+from math import floor
 from statistics import median, mean, multimode
+from item_series import item_series
+from sample_store import sample_store
+from os.path import isfile, getsize, dirname, realpath
+from os import cpu_count
+from mmap import mmap, ACCESS_READ
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from json import load as json_load
+from copy import deepcopy
+from threading import Lock
+from snmp_tables import table_of
+from delta_logging import is_delta_logfile, delta_decoder
+from log_writer import writer
 
 class monitor_utils():
 
+    # matches the item name of a query result line: '<TIMESTAMP> | ITEM: <item> query result: <value>'
+    ITEM_LINE_PATTERN = compile(r'\| ITEM: (.+?) query result:')
+
+    # the end of run analysis settings of each utility: the patterns that extract the values of the 'statistics',
+    #  'detect_crashes' and 'check_values_change' items from the logfile lines, the format of the uptime values,
+    #  and the names used in the logfile messages
+    UTILITY_SETTINGS = {'snmp_monitor': {'statistics': compile(r"\s\s[0-9]+\s"),
+                                         'detect_crashes': compile(r"\s\s[0-9]+\s"),
+                                         'check_values_change': compile(r"\s\s.+\s"),
+                                         'uptime_type': None,
+                                         'worker_type': 'SNMP_MONITOR',
+                                         'log_entity': 'SNMP-MONITOR',
+                                         'logfile_prefix': 'logfile_'},
+                        'async_snmp_monitor': {'statistics': compile(r"\s\s[0-9]+\s"),
+                                               'detect_crashes': compile(r"\s\s[0-9]+\s"),
+                                               'check_values_change': compile(r"\s\s.+\s"),
+                                               'uptime_type': None,
+                                               'worker_type': 'ASYNC_SNMP_MONITOR',
+                                               'log_entity': 'ASYNC-SNMP-MONITOR',
+                                               'logfile_prefix': 'logfile_'},
+                        'console_monitor': {'statistics': compile(r"\B\s\s[0-9\-\.\\/]+"),
+                                            'detect_crashes': compile(r'\d+\sdays?.*\d+.*\d+.*\d+'),
+                                            'check_values_change': compile(r"\B\s\s.*"),
+                                            'uptime_type': 'timestring',
+                                            'worker_type': 'CONSOLE_MONITOR',
+                                            'log_entity': 'CLI-MONITOR',
+                                            'logfile_prefix': 'logfile_cli_'}}
+
+    # the parsed configuration files of the config directory, shared by the workers of the process (see load_config())
+    _configs = {}
+    _configs_lock = Lock()
+
+    @classmethod
+    def load_config(cls, name: str) -> dict:
+        '''
+        Returns the content of a JSON configuration file of the config directory, e.g. load_config('snmp_monitor').
+        The file is read and parsed once per process, each call returns its own copy of the content.
+        Raises the OSError or json.JSONDecodeError of the first reading if it fails (failures are not cached).
+        '''
+        with cls._configs_lock:
+            if name not in cls._configs:
+                with open(f"{dirname(realpath(__file__))}/../config/{name}.json", 'r') as file:
+                    cls._configs[name] = json_load(file)
+            return deepcopy(cls._configs[name])
+
     def __init__(self, **kwargs):
         '''
-        self.kwargs is an argument use to provide additional functionality to the methods
+        self.kwargs is an argument use to provide additional functionality to the methods:
+        * parse_item: a dictionary of {'item':<compiled_ptrn_obj>} parsed by every call of parse_logfile() (see README)
+        * report_path: the path of the file where the methods write their results and log messages, instead of the logfile
+                       they analyze. Used to analyze archived logfiles without modifying them. Without it, the reports on the
+                       logfile of a running worker of the process (mid-run reports) are written to <logfile>.report.log: the
+                       logfile is still written by the log_writer thread, and the report would be interleaved with its iterations
+        * backend: 'numpy' computes the statistics, crash detection and value changes over whole series with NumPy
+                   (see numpy_backend). The reports are the same as those of the default, pure Python, implementation
         '''
 
         self.kwargs = kwargs
-        self.parsed_items_dict = defaultdict(list)
+        self.backend = import_module('numpy_backend') if kwargs.get('backend') == 'numpy' else None
+        self.parsed_items_dict = defaultdict(item_series)
+        self.parse_checkpoints = {} # {logfile_path: (byte offset, line number, {item: pattern})} of the parsed logfiles
+        self.delta_decoders = {}    # {logfile_path: delta_decoder} of the parsed delta logfiles, at their checkpoint
+        # the results of the analysis methods, besides their reports: {'statistics': {item: stats}, 'crashes': [crash],
+        # 'value_changes': {item: changes}}. They are returned by analyze_logfile() (see fleet_report)
+        self.results = {'statistics': {}, 'crashes': [], 'value_changes': {}}
 
     def _write_to_file_hlp(self, logfile_path: str, mode: str, content: str) -> None:
-        '''Helper method. Writes content to file. Does not return anything.'''
+        '''Helper method. Writes content to file, or to self.kwargs['report_path'] if it is set, or to <logfile>.report.log
+        if the logfile is still written by a running worker. Does not return anything.'''
 
-        with open(file=logfile_path, mode=mode, encoding='utf-8') as logfile:
+        path = self.kwargs.get('report_path', logfile_path)
+        if path == logfile_path and writer.is_writing(logfile_path):
+            path = f"{logfile_path[:-len('.log')] if logfile_path.endswith('.log') else logfile_path}.report.log"
+        with open(file=path, mode=mode, encoding='utf-8') as logfile:
             logfile.write(content)
 
-    def parse_logfile(self, logfile_path: str, item_dict: dict = {}, worker_type: str = 'undefined') -> None:
+    def parse_logfile(self, logfile_path: str, item_dict: dict = {}, worker_type: str = 'undefined', processes: int = None) -> None:
         """
-        Parses the logfile and populates a dictionary of {item_1:[(timestamp, value), (timestamp, 'error')],
-                                                          item_2:[(timestamp, value). (timestamp, value)],...}
+        Parses the logfile and populates a dictionary of {item_1:<item_series_obj>, item_2:<item_series_obj>,...}
+        Each item_series stores the (timestamp, value) | (timestamp, 'error') samples of the item in compact columns.
         If a value can't be retrieved based on the regex pattern provided
+        The parsing is incremental: the byte offset up to which the logfile was parsed is remembered, and the next call
+        resumes from it, appending the new samples of the items already parsed from the logfile to their series. Items
+        requested for the first time are parsed from the start of the logfile. Only complete lines are parsed, so a
+        logfile can be parsed while a worker is still writing it.
         :logfile_path: string path to the logfile that will be parsed
         :item_dict: a dictionary of {'item':<compiled_ptrn_obj>, 'item2':<compiled_ptrn_obj>}
         :worker_type: for logging purposes. Not mandatory
+        :processes: if set, the logfile is memory-mapped and its chunks are parsed in parallel by a pool of this many
+                    processes (0: one per CPU). The result is the same as the one of the sequential parsing.
+                    It is used only for the first parsing of a logfile, the incremental ones are sequential.
+        The logfiles written in delta mode (see delta_logging) are parsed sequentially, and their per-iteration series are
+        rebuilt: an item not written in an iteration gets the value it had in the previous one, at the time of the iteration.
         """
 
         logs = f'\nINFO : {worker_type} : parse_logfile() - Checking the items to parse.\n'
@@ -38,35 +122,234 @@ class monitor_utils():
         # if there are any items in self.kwargs['parse_items'] then use those plus the items passed
         items_d = item_dict | self.kwargs['parse_item'] if 'parse_item' in self.kwargs else item_dict
 
+        # the items already parsed from this logfile, with the patterns they were parsed with, are resumed from the checkpoint
+        offset, lines_before, resumed_items = self.parse_checkpoints.get(logfile_path, (0, 0, {}))
+
         # check whether there are any items to parse (not already parsed) and:
         #  if there aren't any, open the file in append and write the log messages at the bottom
         items_d = {item:pattern for item, pattern in items_d.items() if item not in self.parsed_items_dict}
-        if not items_d:
+        if not items_d and not resumed_items:
             logs += f'WARNING : {worker_type} : parse_logfile() - Nothing to parse. The values of the supplied items have already been parsed.\n'
             self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
             return
 
-        #  if there are, open the file in read so you can iterate through it and parse the items
-        with open(logfile_path, 'r+', encoding='utf-8') as logfile:
-
-            logs += f'INFO : {worker_type} : parse_logfile() - Started parsing the logfile.\n'
+        delta = is_delta_logfile(logfile_path)
+        if delta and processes is not None:
+            logs += f'INFO : {worker_type} : parse_logfile() - The logfile was written in delta mode, it is parsed sequentially.\n'
+        if processes is not None and not resumed_items and not delta:
+            parallel_logs, end, line_count = self._parse_logfile_parallel_hlp(logfile_path, items_d, worker_type, processes or cpu_count() or 1)
+            self.parse_checkpoints[logfile_path] = (end, line_count, items_d)
+            self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs + parallel_logs)
+            return
 
-            for line_nr, line in enumerate(logfile, start=1):
-                if not line.strip():
-                    continue 
-                for item, pattern in items_d.items():
-                    if f'| ITEM: {item}' in line:
+        #  if there are, open the file in read so you can iterate through it and parse the items.
+        #  the new items are parsed from the start of the logfile, the resumed ones from the checkpoint
+        with open(logfile_path, 'rb') as logfile:
+
+            if items_d:
+                logs += f'INFO : {worker_type} : parse_logfile() - Started parsing the logfile.\n'
+                # the lines before the checkpoint are parsed for the new items only
+                ranges = [(0, offset, items_d), (offset, None, resumed_items | items_d)] if resumed_items else [(0, None, items_d)]
+                line_nr = 0
+            else:
+                logs += f'INFO : {worker_type} : parse_logfile() - Resumed parsing the logfile from line {lines_before + 1}.\n'
+                ranges = [(offset, None, resumed_items)]
+                line_nr = lines_before
+
+            # the item name is extracted once per line and its pattern is looked up in items_d, so the cost
+            #  of a line does not depend on the number of items that are parsed
+            item_line_search = self.ITEM_LINE_PATTERN.search
+            # the decoder of a delta logfile carries the state of the iteration and of the resumed items from the checkpoint.
+            #  The new items parsed up to the checkpoint have their own decoder, merged into it at the checkpoint
+            checkpoint_decoder = self.delta_decoders.get(logfile_path, delta_decoder()) if delta else None
+            for start, stop, active_items in ranges:
+                decoder = (delta_decoder() if stop is not None else checkpoint_decoder) if delta else None
+                position = start
+                for lines, position in self._read_lines_hlp(logfile, start, stop):
+                    for line in lines:
+                        line_nr += 1
+                        item_line = item_line_search(line)
+                        if not item_line:
+                            if decoder:
+                                try:
+                                    for timestamp, item, value in decoder.control(line):
+                                        self.parsed_items_dict[item].append(timestamp, value)
+                                except ValueError:
+                                    logs += f"WARNING : {worker_type} : parse_logfile() - Couldn't parse the timestamp of line {line_nr}\n"
+                            continue
+                        item = item_line.group(1)
+                        pattern = active_items.get(item)
+                        if pattern is None:
+                            continue
                         val = pattern.search(line)
-                        if val:
-                            self.parsed_items_dict[item].append((line[:19], val.group(0)))
-                            break
-                        logs += f"WARNING : {worker_type} : parse_logfile() - Couldn't retrieve value of {item} from line {line_nr}\n"
-                        self.parsed_items_dict[item].append((line[:19], 'error'))
-                        break
+                        value = val.group(0) if val else 'error'
+                        try:
+                            self.parsed_items_dict[item].append(line[:19], value)
+                        except ValueError:
+                            logs += f"WARNING : {worker_type} : parse_logfile() - Couldn't parse the timestamp of line {line_nr}\n"
+                            continue
+                        if not val:
+                            logs += f"WARNING : {worker_type} : parse_logfile() - Couldn't retrieve value of {item} from line {line_nr}\n"
+                        if decoder:
+                            decoder.sample(item, value)
+                if decoder and decoder is not checkpoint_decoder:
+                    checkpoint_decoder.items.update(decoder.items)
+                    checkpoint_decoder.own_intervals |= decoder.own_intervals
+            if delta:
+                self.delta_decoders[logfile_path] = checkpoint_decoder
             logs += f"INFO : {worker_type} : parse_logfile() - Finished parsing the logfile\n"
-            logfile.write(logs)
+        self.parse_checkpoints[logfile_path] = (position, line_nr, resumed_items | items_d)
+        self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
 
-    def generate_statistics(self, logfile_path: str, item_list: list, worker_type: str='undefined') -> None:
+    @staticmethod
+    def _read_lines_hlp(logfile, start: int, stop: int = None, block_size: int = 2**20):
+        """
+        Helper method. Reads the complete lines of a logfile opened in binary mode (or memory-mapped), from the byte
+        offset start to stop (both at line boundaries, stop=None: the end of the file), in blocks.
+        Yields (lines, offset): an iterator over the text lines of a block, split the way a logfile opened in text mode
+        splits them (universal newlines), and the byte offset of the end of the block.
+        A last line that isn't terminated by a newline is still being written, so it is not read.
+        """
+
+        logfile.seek(start)
+        position = start
+        pending = b''
+        while True:
+            data = logfile.read(block_size if stop is None else min(block_size, stop - position - len(pending)))
+            if not data:
+                return
+            data = pending + data
+            end = data.rfind(b'\n') + 1
+            pending = data[end:]
+            if end:
+                position += end
+                yield StringIO(data[:end].decode('utf-8'), newline=None), position
+
+    def _parse_logfile_parallel_hlp(self, logfile_path: str, items_d: dict, worker_type: str, processes: int) -> tuple:
+        """
+        Helper method. Splits the logfile in newline-aligned chunks, parses them in a pool of processes and merges the
+        series of the chunks, in the order of the chunks, into self.parsed_items_dict.
+        Returns (log messages, byte offset of the end of the last complete line, number of parsed lines).
+        """
+
+        logs = f'INFO : {worker_type} : parse_logfile() - Started parsing the logfile in {processes} processes.\n'
+        boundaries = [0]
+        end = 0
+        if getsize(logfile_path):
+            with open(logfile_path, 'rb') as logfile, mmap(logfile.fileno(), 0, access=ACCESS_READ) as mapped_file:
+                # only the complete lines are parsed
+                end = mapped_file.rfind(b'\n') + 1
+                for chunk in range(1, processes):
+                    newline = mapped_file.find(b'\n', max(end * chunk // processes, boundaries[-1]), end)
+                    if newline == -1:
+                        break
+                    boundaries.append(newline + 1)
+        boundaries.append(end)
+        chunks = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks) or 1)) as executor:
+            results = list(executor.map(self._parse_chunk_hlp, [logfile_path]*len(chunks), *zip(*chunks), [items_d]*len(chunks)))
+
+        lines_before = 0
+        for parsed_items, unmatched_lines, malformed_lines, line_count in results:
+            for item, series in parsed_items.items():
+                self.parsed_items_dict[item].extend(series)
+            for line_nr, item in unmatched_lines:
+                logs += f"WARNING : {worker_type} : parse_logfile() - Couldn't retrieve value of {item} from line {lines_before + line_nr}\n"
+            for line_nr in malformed_lines:
+                logs += f"WARNING : {worker_type} : parse_logfile() - Couldn't parse the timestamp of line {lines_before + line_nr}\n"
+            lines_before += line_count
+        logs += f"INFO : {worker_type} : parse_logfile() - Finished parsing the logfile\n"
+        return logs, end, lines_before
+
+    @staticmethod
+    def _parse_chunk_hlp(logfile_path: str, start: int, end: int, items_d: dict) -> tuple:
+        """
+        Helper method, executed by the processes of the pool. Parses the lines of the logfile between the byte offsets
+        start and end, like parse_logfile() does. Returns ({item: <item_series_obj>}, [(line_nr, item), ...], [line_nr, ...], line_count),
+        where the second element lists the lines whose value couldn't be retrieved and the third one the lines whose timestamp
+        couldn't be parsed (which are skipped), numbered from the start of the chunk.
+        """
+
+        parsed_items = defaultdict(item_series)
+        unmatched_lines, malformed_lines = [], []
+        item_line_search = monitor_utils.ITEM_LINE_PATTERN.search
+        line_nr = 0
+        with open(logfile_path, 'rb') as logfile, mmap(logfile.fileno(), 0, access=ACCESS_READ) as mapped_file:
+            for lines, _ in monitor_utils._read_lines_hlp(mapped_file, start, end):
+                for line in lines:
+                    line_nr += 1
+                    item_line = item_line_search(line)
+                    if not item_line:
+                        continue
+                    item = item_line.group(1)
+                    pattern = items_d.get(item)
+                    if pattern is None:
+                        continue
+                    val = pattern.search(line)
+                    try:
+                        parsed_items[item].append(line[:19], val.group(0) if val else 'error')
+                    except ValueError:
+                        malformed_lines.append(line_nr)
+                        continue
+                    if not val:
+                        unmatched_lines.append((line_nr, item))
+        return dict(parsed_items), unmatched_lines, malformed_lines, line_nr
+
+    def load_samples(self, logfile_path: str, store_path: str, item_dict: dict = {}, worker_type: str = 'undefined') -> None:
+        """
+        Populates self.parsed_items_dict like parse_logfile(), but loads the samples of the items from the sample store
+        of the run (see sample_store) instead of scanning the logfile. Only the samples of the requested items are read.
+        The patterns are applied to the stored values the same way parse_logfile() applies them to the logfile lines.
+        The samples whose value couldn't be retrieved by the worker are loaded as 'error'.
+        The stored timestamps are truncated to the second, like those of the logfile lines, so the reports are the same.
+        :logfile_path: string path to the logfile where the log messages are written
+        :store_path: string path to the sample store
+        :item_dict: a dictionary of {'item':<compiled_ptrn_obj>, 'item2':<compiled_ptrn_obj>}. A None pattern loads the values as stored
+        :worker_type: for logging purposes. Not mandatory
+        """
+
+        logs = f'\nINFO : {worker_type} : load_samples() - Checking the items to load.\n'
+
+        items_d = item_dict | self.kwargs['parse_item'] if 'parse_item' in self.kwargs else item_dict
+        items_d = {item:pattern for item, pattern in items_d.items() if item not in self.parsed_items_dict}
+        if not items_d:
+            logs += f'WARNING : {worker_type} : load_samples() - Nothing to load. The values of the supplied items have already been parsed.\n'
+            self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
+            return
+        if not isfile(store_path):
+            logs += f'ERROR : {worker_type} : load_samples() - The sample store {store_path} does not exist.\n'
+            self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
+            return
+
+        logs += f'INFO : {worker_type} : load_samples() - Started loading the samples.\n'
+        store = sample_store(store_path)
+        try:
+            for item, pattern in items_d.items():
+                series = self.parsed_items_dict[item]
+                unmatched = 0
+                for timestamp, value, error in store.load(item):
+                    timestamp = floor(timestamp)
+                    if error is not None:
+                        series.append_sample(timestamp, 'error')
+                        continue
+                    if pattern is not None:
+                        val = pattern.search(f'  {value}\n')
+                        if not val:
+                            unmatched += 1
+                            series.append_sample(timestamp, 'error')
+                            continue
+                        value = val.group(0)
+                    series.append_sample(timestamp, str(value))
+                if unmatched:
+                    logs += f"WARNING : {worker_type} : load_samples() - Couldn't retrieve {unmatched} value(s) of {item}\n"
+                logs += f"INFO : {worker_type} : load_samples() - Loaded {len(series)} samples of {item}\n"
+        finally:
+            store.close()
+        logs += f"INFO : {worker_type} : load_samples() - Finished loading the samples\n"
+        self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
+
+    def generate_statistics(self, logfile_path: str, item_list: list, worker_type: str='undefined', percentiles: tuple = ()) -> None:
             """
             The method searches for the items, through a logfile. For each item, from every line in the logfile it is present,
             extracts its value and calculates various statistics.
@@ -77,6 +360,7 @@ class monitor_utils():
             :item_dict: a dictionary of {'item':<compiled_ptrn_obj>, 'item2':<compiled_ptrn_obj>}
                         the patterns should  match an integral. Ex: \s\s[0-9]+\s
             :worker_type: Optional. the worker type used to generate the logfile.
+            :percentiles: Optional. the percentiles (0-100) added to the report, linearly interpolated between the closest ranks.
             """
 
             logs = f'\nINFO : {worker_type} : generate_statistics() - Started generating statistics.\n\n'
@@ -88,25 +372,38 @@ class monitor_utils():
                             "Make sure to execute parse_logfile(). Skipping it.\n"
                     continue
 
-                timestamp_list = [val_tup[0] for val_tup in self.parsed_items_dict[item] if val_tup[1] != 'error']
+                series = self.parsed_items_dict[item]
+                if self.backend:
+                    # None: the series has values the backend doesn't handle, they are reported by the Python implementation
+                    stats = self.backend.item_statistics(series, percentiles, self._percentiles_hlp)
+                    if stats is not None:
+                        logs += self._statistics_report_hlp(item, *stats)
+                        self._record_statistics_hlp(item, *stats[:4], stats[5])
+                        continue
+                index_list = series.valid_indexes()
                 try:
-                    values_list = [int(val_tup[1]) for val_tup in self.parsed_items_dict[item] if val_tup[1] != 'error']
+                    if any(series.is_encoded(index) for index in index_list):
+                        values_list = [series.integral_value(index) for index in index_list]
+                    else:
+                        values_list = [series.values[index] for index in index_list]
                 except ValueError:
                     logs += f'\nERROR : {worker_type} : generate_statistics() - Item {item} does not have integral value. Skipping it.\n'
                     continue
 
                 try:
-                    minimum = min(zip(values_list, timestamp_list), key=lambda pair: pair[0])
-                    maximum = max(zip(values_list, timestamp_list), key=lambda pair: pair[0])
+                    # the timestamps are formatted only for the samples reported as minimum and maximum
+                    minimum = min(zip(values_list, index_list), key=lambda pair: pair[0])
+                    minimum = (minimum[0], series.timestamp(minimum[1]))
+                    maximum = max(zip(values_list, index_list), key=lambda pair: pair[0])
+                    maximum = (maximum[0], series.timestamp(maximum[1]))
                     average = mean(values_list)
                     med = median(values_list)
                     mmode = multimode(values_list)
                     length = len(values_list)
+                    percentiles_d = self._percentiles_hlp(sorted(values_list).__getitem__, length, percentiles) if percentiles else None
 
-                    result = f'Stats for item {item} are:\n Minimum: {minimum[0]} (value first recorded at {minimum[1]})\n ' \
-                             f'Maximum: {maximum[0]} (value first recorded at {maximum[1]})\n Average: {average}\n ' \
-                             f'Median: {med}\n Most common values: {mmode}\n Number of values used for the calculations: {length}\n\n'
-                    logs += result
+                    logs += self._statistics_report_hlp(item, minimum, maximum, average, med, mmode, length, percentiles_d)
+                    self._record_statistics_hlp(item, minimum, maximum, average, med, length)
                 except Exception as e:
                     logs += f'\nERROR : {worker_type} : generate_statistics() - Unable to generate statistics for item {item}. Error: {e}\n'
 
@@ -115,6 +412,75 @@ class monitor_utils():
             # iterate through the file and append the results to the dict
             self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
 
+    def write_accumulated_statistics(self, logfile_path: str, accumulators: dict, item_list: list, worker_type: str='undefined') -> None:
+            """
+            Writes the statistics of the items, as accumulated by the worker while polling (see stream_statistics), to the logfile.
+            The report has the same format as the one of generate_statistics(), but it doesn't need the logfile to be parsed.
+            :logfile_path: path to the logfile
+            :accumulators: a dictionary of {'item':<item_accumulator_obj>, 'item2':<item_accumulator_obj>}
+            :item_list: the items whose statistics are written
+            :worker_type: Optional. the worker type used to generate the logfile.
+            """
+
+            logs = f'\nINFO : {worker_type} : generate_statistics() - Started generating statistics.\n\n'
+
+            for item in item_list:
+
+                accumulator = accumulators.get(item)
+                if accumulator is None:
+                    logs += f"\nERROR : {worker_type} : generate_statistics() - Item {item} was not accumulated by the worker. Skipping it.\n"
+                    continue
+                if accumulator.invalid is not None:
+                    logs += f'\nERROR : {worker_type} : generate_statistics() - Item {item} does not have integral value. Skipping it.\n'
+                    continue
+                if not accumulator.count:
+                    logs += f'\nERROR : {worker_type} : generate_statistics() - Unable to generate statistics for item {item}. ' \
+                             'Error: no values were retrieved\n'
+                    continue
+
+                stats = accumulator.snapshot()
+                med = f"{stats['median']} (estimated)" if stats['approximate'] else stats['median']
+                mmode = f"{stats['most_common']} (estimated)" if stats['approximate'] else stats['most_common']
+                logs += self._statistics_report_hlp(item, stats['minimum'], stats['maximum'], stats['mean'], med, mmode, stats['count'])
+                self._record_statistics_hlp(item, stats['minimum'], stats['maximum'], stats['mean'], stats['median'], stats['count'],
+                                            stats['approximate'])
+
+            logs += f"\nINFO : {worker_type} : generate_statistics() - Finished generating statistics for the items provided.\n"
+
+            self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
+
+    def _statistics_report_hlp(self, item: str, minimum: tuple, maximum: tuple, average, med, mmode, length: int,
+                               percentiles: dict = None) -> str:
+        '''Helper method. Formats the statistics of an item. Returns the formatted string.'''
+
+        percentiles = f" Percentiles: {', '.join(f'{p}%: {value}' for p, value in percentiles.items())}\n" if percentiles else ''
+        return f'Stats for item {item} are:\n Minimum: {minimum[0]} (value first recorded at {minimum[1]})\n ' \
+               f'Maximum: {maximum[0]} (value first recorded at {maximum[1]})\n Average: {average}\n ' \
+               f'Median: {med}\n Most common values: {mmode}\n{percentiles} Number of values used for the calculations: {length}\n\n'
+
+    def _record_statistics_hlp(self, item: str, minimum: tuple, maximum: tuple, average, med, length: int,
+                               approximate: bool = False) -> None:
+        '''Helper method. Records the statistics of an item in self.results. Does not return anything.'''
+
+        self.results['statistics'][item] = {'minimum': minimum[0], 'minimum_at': minimum[1], 'maximum': maximum[0],
+                                            'maximum_at': maximum[1], 'mean': average, 'median': med, 'count': length,
+                                            'approximate': approximate}
+
+    @staticmethod
+    def _percentiles_hlp(order_statistic, length: int, percentiles: tuple) -> dict:
+        '''Helper method. Computes percentiles by linear interpolation between the closest ranks.
+        order_statistic(k) returns the k-th smallest value (0-based) of the 'length' values. Returns {percentile: value}'''
+
+        result = {}
+        for p in percentiles:
+            position = p / 100 * (length - 1)
+            lower = int(position)
+            value = order_statistic(lower)
+            if position > lower:
+                value = value + (order_statistic(lower + 1) - value) * (position - lower)
+            result[p] = value
+        return result
+
     def crash_detector(self, logfile_path: str, uptime_item: str, uptime_type=None, worker_type: str = 'undefined') -> None:
             '''Checks whether a crash has occurred by comparing the expected and actual uptimes, based on the timestamps
             of the records.
@@ -131,51 +497,164 @@ class monitor_utils():
                 self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
                 return
 
-            last_successful_iteration = None # an iteration which had a valid uptime value (!= 'error')
-            for iteration, time_tup in enumerate(self.parsed_items_dict[uptime_item], start=1):
-                # if the value for the uptime item (sysUpTime.0), could not be retrieved from the logfile, skip the iteration
-                if time_tup[1] == 'error':
-                    logs += f"WARNING : {worker_type} : crash_detector() - Error at value retrieval in iteration {iteration}\n"
-                    continue
-                # convert the current iteration's timestamp into a datetime object
-                current_iteration_timestamp = datetime.strptime(time_tup[0], '%Y-%m-%d %H:%M:%S')
-                if uptime_type == 'timestring':
-                    # convert the uptime item value (CLI: 0 days, 0:0:0 / SNMP: 0:0:00:00.00) to seconds (pattern '[\D\s]+')
-                    uptime_value = [int(''.join(char for char in element if char.isdigit())) for element in split('[\D\s]+', time_tup[1])]
-                    uptime_value = 86400*uptime_value[0] + 3600*uptime_value[1] + 60*uptime_value[2] + uptime_value[3]
-                else:
-                    # convert SNMP timeticks to seconds
-                    uptime_value = int(time_tup[1])/100
-                # if no last_successful_iteration exist, record the current one and skip anything else.
-                if not last_successful_iteration:
-                    logs += f"ERROR : {worker_type} : crash_detector() - Couldn't compare uptime values because no " \
-                             "previous successful iteration was recorded.\nThis happened because during none of the " \
-                            f"iterations before this one (iteration {iteration}) could the uptime be retrieved.\n"
-                    last_successful_iteration = (iteration, current_iteration_timestamp, uptime_value)
-                    continue
-                # true_interval is the time interval between the iterations.
-                true_interval = (current_iteration_timestamp - last_successful_iteration[1]).total_seconds()
-                try:
-                    # expected_uptime is the expected interval between the values of the uptime item
-                    expected_uptime = (last_successful_iteration[2] + true_interval) - 1
-                    # if the interval between the values of the uptime item, is lower than the interval between iterations
-                    # (minus 1 second due to the fractions of second needed for processing), then a crash has occurred
-                    if uptime_value < expected_uptime:
-                        logs += f"INFO : {worker_type} : crash_detector() - CRASH detected in iteration {iteration}:" \
-                                f' Expected uptime is {expected_uptime} seconds and the retrieved uptime is {uptime_value}' \
-                                f' seconds.\nLast successful iteration is {last_successful_iteration[0]}, it is possible' \
-                                 ' that the crash occurred immediately after that iteration. \n'
-                    last_successful_iteration = (iteration, current_iteration_timestamp, uptime_value)
-                except Exception as e:
-                    logs += f"ERROR : {worker_type} : crash_detector() - Couldn't compare uptime values: {e}\n"
+            series = self.parsed_items_dict[uptime_item]
+            events = self.backend.crash_events(series, uptime_type, self._timestring_to_seconds_hlp) if self.backend else None
+            if events is None:
+                events = self._crash_events_hlp(series, uptime_type)
+            logs += self._crash_report_hlp(events, worker_type)
+            self.results['crashes'] = [{'iteration': event[1], 'timestamp': series.timestamp(event[1] - 1), 'expected_uptime': event[2],
+                                        'uptime': event[3], 'last_successful_iteration': event[4]}
+                                       for event in events if event[0] == 'crash']
             logs += f"INFO : {worker_type} : crash_detector() - {len(self.parsed_items_dict[uptime_item])} iterations were checked for crashes.\n"
             logs += f"INFO : {worker_type} : crash_detector() - Operation finished.\n"
             self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
 
+    def _crash_events_hlp(self, series, uptime_type=None) -> list:
+        '''Helper method. Checks the uptime series for crashes. Returns the list of the events reported by crash_detector(),
+        in the order of the iterations: ('error', iteration) | ('first', iteration) |
+        ('crash', iteration, expected_uptime, uptime_value, last_successful_iteration) | ('exception', exception)'''
+
+        events = []
+        timestring_seconds = {} # the timestring values are dictionary-encoded, so each distinct one is converted once
+        last_successful_iteration = None # an iteration which had a valid uptime value (!= 'error')
+        for iteration in range(1, len(series) + 1):
+            index = iteration - 1
+            # if the value for the uptime item (sysUpTime.0), could not be retrieved from the logfile, skip the iteration
+            if series.is_error(index):
+                events.append(('error', iteration))
+                continue
+            # the current iteration's timestamp, in seconds
+            current_iteration_timestamp = series.timestamps[index]
+            if uptime_type == 'timestring':
+                # convert the uptime item value (CLI: 0 days, 0:0:0 / SNMP: 0:0:00:00.00) to seconds (pattern '[\D\s]+')
+                value = series.value(index)
+                if value not in timestring_seconds:
+                    timestring_seconds[value] = self._timestring_to_seconds_hlp(value)
+                uptime_value = timestring_seconds[value]
+            else:
+                # convert SNMP timeticks to seconds
+                uptime_value = series.integral_value(index)/100
+            # if no last_successful_iteration exist, record the current one and skip anything else.
+            if not last_successful_iteration:
+                events.append(('first', iteration))
+                last_successful_iteration = (iteration, current_iteration_timestamp, uptime_value)
+                continue
+            # true_interval is the time interval between the iterations.
+            true_interval = current_iteration_timestamp - last_successful_iteration[1]
+            try:
+                # expected_uptime is the expected interval between the values of the uptime item
+                expected_uptime = (last_successful_iteration[2] + true_interval) - 1
+                # if the interval between the values of the uptime item, is lower than the interval between iterations
+                # (minus 1 second due to the fractions of second needed for processing), then a crash has occurred
+                if uptime_value < expected_uptime:
+                    events.append(('crash', iteration, expected_uptime, uptime_value, last_successful_iteration[0]))
+                last_successful_iteration = (iteration, current_iteration_timestamp, uptime_value)
+            except Exception as e:
+                events.append(('exception', e))
+        return events
+
+    def _crash_report_hlp(self, events: list, worker_type: str) -> str:
+        '''Helper method. Formats the events of crash_detector(). Returns the formatted string.'''
+
+        logs = ''
+        for event in events:
+            if event[0] == 'error':
+                logs += f"WARNING : {worker_type} : crash_detector() - Error at value retrieval in iteration {event[1]}\n"
+            elif event[0] == 'first':
+                logs += f"ERROR : {worker_type} : crash_detector() - Couldn't compare uptime values because no " \
+                         "previous successful iteration was recorded.\nThis happened because during none of the " \
+                        f"iterations before this one (iteration {event[1]}) could the uptime be retrieved.\n"
+            elif event[0] == 'exception':
+                logs += f"ERROR : {worker_type} : crash_detector() - Couldn't compare uptime values: {event[1]}\n"
+            else:
+                _, iteration, expected_uptime, uptime_value, last_successful_iteration = event
+                logs += f"INFO : {worker_type} : crash_detector() - CRASH detected in iteration {iteration}:" \
+                        f' Expected uptime is {expected_uptime} seconds and the retrieved uptime is {uptime_value}' \
+                        f' seconds.\nLast successful iteration is {last_successful_iteration}, it is possible' \
+                         ' that the crash occurred immediately after that iteration. \n'
+        return logs
+
+    @staticmethod
+    def _timestring_to_seconds_hlp(value: str) -> int:
+        '''Helper method. Converts an uptime timestring (CLI: 0 days, 0:0:0 / SNMP: 0:0:00:00.00) to seconds.'''
+
+        uptime_value = [int(''.join(char for char in element if char.isdigit())) for element in split(r'[\D\s]+', value)]
+        return 86400*uptime_value[0] + 3600*uptime_value[1] + 60*uptime_value[2] + uptime_value[3]
+
     # crash_detector() iterates through the logfile and dynamically calculates the expected seconds based on the interval between two distict iterations.
     # thus, it takes into account both the interval between iterations AND the time needed for an iteration to complete, plus an error of 1 seconds. 
     # it is VERY dependant on the format of the logfile
 
+    def analyze_logfile(self, logfile_path: str, profile: dict, accumulators: dict = None, store_path: str = None) -> dict:
+        '''Runs the end of run analysis requested by a profile ('statistics', 'detect_crashes' and 'check_values_change' keys)
+        and writes its results to the logfile. Returns the results (self.results): {'statistics': {item: {minimum, minimum_at,
+        maximum, maximum_at, mean, median, count, approximate}}, 'crashes': [{iteration, timestamp, expected_uptime, uptime,
+        last_successful_iteration}], 'value_changes': {item: [{timestamp, from, to}]}}. The items that couldn't be analyzed are
+        not in the results, their errors are only reported in the logfile.
+        logfile_path: the path to the logfile of the profile.
+        profile: the monitor profile. Its 'utility' selects the patterns used to parse the logfile.
+        accumulators: the item_accumulator objects of the 'statistics' items, if the worker accumulated them while polling.
+                      If they are not provided, the statistics are generated by parsing the logfile.
+        store_path: the sample store of the run. If it is provided, the values are loaded from it instead of parsing the logfile.
+        The 'statistics' and 'check_values_change' entries that name a walked table (profile key 'tables') apply to all its rows.'''
+
+        settings = self.UTILITY_SETTINGS[profile['utility']]
+        worker_type = settings['worker_type']
+        statistics = profile.get('statistics', [])
+        check_values_change = profile.get('check_values_change', [])
+        tables = [table for table in profile.get('tables', []) if table in statistics or table in check_values_change]
+        if tables:
+            rows = self._table_rows_hlp(logfile_path, tables, store_path)
+            statistics = [row for item in statistics for row in rows.get(item, [item])]
+            check_values_change = [row for item in check_values_change for row in rows.get(item, [item])]
+
+        parse_items = {item: settings['check_values_change'] for item in check_values_change}
+        if accumulators is None:
+            parse_items.update({item: settings['statistics'] for item in statistics})
+        if 'detect_crashes' in profile:
+            parse_items[profile['detect_crashes']] = settings['detect_crashes']
+        if parse_items and store_path:
+            self.load_samples(logfile_path=logfile_path, store_path=store_path, item_dict=parse_items, worker_type=worker_type)
+        elif parse_items:
+            self.parse_logfile(logfile_path=logfile_path, item_dict=parse_items, worker_type=worker_type)
+        if statistics and accumulators is None:
+            self.generate_statistics(logfile_path=logfile_path, item_list=statistics, worker_type=worker_type)
+        elif statistics:
+            self.write_accumulated_statistics(logfile_path=logfile_path, accumulators=accumulators,
+                                              item_list=statistics, worker_type=worker_type)
+        if 'detect_crashes' in profile:
+            self.crash_detector(logfile_path=logfile_path, uptime_item=profile['detect_crashes'],
+                                uptime_type=settings['uptime_type'], worker_type=worker_type)
+        if check_values_change:
+            self.get_item_value_change(logfile_path=logfile_path, item_list=check_values_change, worker_type=worker_type)
+        return self.results
+
+    def _table_rows_hlp(self, logfile_path: str, tables: list, store_path: str = None) -> dict:
+        '''Helper method. Returns the rows of the walked tables, in the order of their first sample: {table: [row, ...]}.
+        The rows are read from the sample store of the run if it exists, from the item names of the logfile lines otherwise.'''
+
+        if store_path and isfile(store_path):
+            store = sample_store(store_path)
+            try:
+                items = store.item_names()
+            finally:
+                store.close()
+        else:
+            items = {}
+            item_line_search = self.ITEM_LINE_PATTERN.search
+            with open(logfile_path, 'rb') as logfile:
+                for lines, _ in self._read_lines_hlp(logfile, 0):
+                    for line in lines:
+                        item_line = item_line_search(line)
+                        if item_line:
+                            items[item_line.group(1)] = None
+        rows = {table: [] for table in tables}
+        for item in items:
+            table = table_of(item, tables)
+            if table:
+                rows[table].append(item)
+        return rows
+
     def _console_monitor_req_check_hlp(self) -> tuple:
         '''Helper method. Checks whether the requirements for 'console_monitor' utility are met or not. Returns:
         * tuple: (True, None) if requirements are met;
@@ -186,9 +665,7 @@ class monitor_utils():
             return (False, 'Pexpect module is needed to use console_monitor utility')
 
         # check if telnet is installed
-        try:
-            run(['which', 'telnet'], capture_output=True, check=True)
-        except (FileNotFoundError, CalledProcessError):
+        if not which('telnet'):
             return (False, 'telnet is needed to use console_monitor utility but it is not installed')
 
         return True, None
@@ -203,6 +680,13 @@ class monitor_utils():
 
         return True, None
 
+    def _async_snmp_monitor_req_check_hlp(self) -> tuple:
+        '''Helper method. Checks whether the requirements for 'async_snmp_monitor' utility are met or not.
+        The utility implements the SNMP protocol itself, on top of asyncio, so it has no requirements. Returns:
+        * tuple: (True, None)'''
+
+        return True, None
+
     def get_item_value_change(self, logfile_path: str, item_list: list, worker_type: str = 'undefined') -> None:
         '''Checks whether an item had a change in value, and when did it occur.
         Verifies the item directly from self.parsed_items_dict so parse_logfile() has to be called first.
@@ -219,24 +703,48 @@ class monitor_utils():
                 logs += f'ERROR : {worker_type} : get_item_value_change() - Item {item} is not parsed from the logfile.' \
                         ' Make sure to call parse_logfile() before calling this method. Skipping it.\n'
                 continue
-            default_value = None
-            for timestamp_value_tuple in self.parsed_items_dict[item]:
-                current_value = timestamp_value_tuple[1].strip()
-                if current_value == 'error':
+            series = self.parsed_items_dict[item]
+            events = self.backend.value_change_events(series) if self.backend else None
+            if events is None:
+                events = self._value_change_events_hlp(series)
+            self.results['value_changes'][item] = [{'timestamp': series.timestamp(event[1]), 'from': event[2], 'to': event[3]}
+                                                   for event in events if event[0] == 'change']
+            for event in events:
+                if event[0] == 'error':
                     logs += f"WARNING : {worker_type} : get_item_value_change() - Cannot check if there was a value change at " \
-                            f"{timestamp_value_tuple[0]} because there was an 'error' in parsing it.\n"
-                elif not default_value:
+                            f"{series.timestamp(event[1])} because there was an 'error' in parsing it.\n"
+                elif event[0] == 'first':
                     logs += f"INFO : {worker_type} : get_item_value_change() - The first value of item {item} " \
-                            f"is {current_value} retrieved at {timestamp_value_tuple[0]}.\n"
-                    default_value = current_value
-                elif current_value != default_value:
+                            f"is {event[2]} retrieved at {series.timestamp(event[1])}.\n"
+                else:
                     logs += f"INFO : {worker_type} : get_item_value_change() - A change in value of {item} " \
-                            f"from {default_value} to {current_value} was detected at {timestamp_value_tuple[0]}.\n"
-                    default_value = current_value
+                            f"from {event[2]} to {event[3]} was detected at {series.timestamp(event[1])}.\n"
             logs += f"INFO : {worker_type} : get_item_value_change() - Finished checking the change in values of {item}.\n"
 
         self._write_to_file_hlp(logfile_path=logfile_path, mode='a+', content=logs)
 
+    def _value_change_events_hlp(self, series) -> list:
+        '''Helper method. Returns the events reported by get_item_value_change(), in the order of the samples:
+        ('error', index) | ('first', index, value) | ('change', index, previous_value, value)'''
+
+        events = []
+        default_value = None
+        default_key = None # (is_encoded, value) column pair of default_value, compared instead of the strings
+        for index in range(len(series)):
+            if series.is_error(index):
+                events.append(('error', index))
+                continue
+            current_key = (series.is_encoded(index), series.values[index])
+            if not default_value:
+                current_value = series.value(index)
+                events.append(('first', index, current_value))
+                default_value, default_key = current_value, current_key
+            elif current_key != default_key:
+                current_value = series.value(index)
+                events.append(('change', index, default_value, current_value))
+                default_value, default_key = current_value, current_key
+        return events
+
     def environment_check(self, utility:str) -> tuple:
         '''Checks whether the requirements for running the app are met or not.\n
         Parms: 
@@ -247,7 +755,8 @@ class monitor_utils():
         * tuple: (False, 'err_msg') if requirements are not met.'''
 
         d = {'console_monitor': self._console_monitor_req_check_hlp,
-             'snmp_monitor': self._snmp_monitor_req_check_hlp}
+             'snmp_monitor': self._snmp_monitor_req_check_hlp,
+             'async_snmp_monitor': self._async_snmp_monitor_req_check_hlp}
 
         if system() != 'Linux':
             # Linux is needed because pexpect module is available on Linux only.
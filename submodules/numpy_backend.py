@@ -0,0 +1,140 @@
+'''
+    NumPy implementation of the analysis methods of monitor_utils (monitor_utils(backend='numpy')).
+    The item_series columns are used as arrays without copying them, and each analysis is computed over the whole series
+    at once. The results are the same as those of the pure Python implementation, down to the types of the reported
+    values. A function returns None for a series it doesn't handle (e.g. values that don't fit 64-bit integers), which is
+    then analyzed by the Python implementation.
+'''
+import numpy as np
+
+# the largest magnitude of an integer that is exactly representable as a float64
+MAX_EXACT_FLOAT_INT = 2**53
+
+
+def _columns(series) -> tuple:
+    '''Returns (values, errors, encoded) of a series: the int64 values column and the boolean masks of its bitmaps.'''
+
+    length = len(series)
+    values = np.frombuffer(series.values, dtype=np.int64, count=length)
+    errors = np.unpackbits(np.frombuffer(series.errors, dtype=np.uint8), bitorder='little', count=length).astype(bool)
+    encoded = np.unpackbits(np.frombuffer(series.encoded, dtype=np.uint8), bitorder='little', count=length).astype(bool)
+    return values, errors, encoded
+
+
+def _integral_values(series, values: np.ndarray, encoded: np.ndarray):
+    '''Returns the integral values of the samples (the encoded ones are converted like item_series.integral_value() does),
+    or None if a value is not integral or doesn't fit an int64.'''
+
+    if not encoded.any():
+        return values
+    try:
+        decoded = np.array([int(value) for value in series.dictionary], dtype=np.int64)
+    except (ValueError, OverflowError):
+        return None
+    values = values.copy()
+    values[encoded] = decoded[values[encoded]]
+    return values
+
+
+def item_statistics(series, percentiles: tuple, percentiles_hlp):
+    '''
+    Returns the statistics of a series, as generate_statistics() computes them:
+    (minimum, maximum, average, median, most common values, number of values, percentiles | None), or None.
+    :percentiles_hlp: monitor_utils._percentiles_hlp, so the percentiles are interpolated the same way by both implementations
+    '''
+    values, errors, encoded = _columns(series)
+    valid = np.flatnonzero(~errors)
+    if not valid.size:
+        return None
+    values = _integral_values(series, values[valid], encoded[valid])
+    if values is None:
+        return None
+    length = int(values.size)
+
+    minimum_index, maximum_index = int(values.argmin()), int(values.argmax())
+    minimum = (int(values[minimum_index]), series.timestamp(int(valid[minimum_index])))
+    maximum = (int(values[maximum_index]), series.timestamp(int(valid[maximum_index])))
+
+    # statistics.mean() of integers: exact sum, int result if the division is exact, correctly rounded float otherwise
+    if max(abs(minimum[0]), abs(maximum[0])) * length < 2**63:
+        total = int(values.sum())
+    else:
+        total = sum(values.tolist())
+    quotient, remainder = divmod(total, length)
+    average = quotient if not remainder else total / length
+
+    # the order statistics needed by the median and the percentiles are placed by a single partition
+    ranks = {length // 2} if length % 2 else {length // 2 - 1, length // 2}
+    for p in percentiles:
+        position = p / 100 * (length - 1)
+        ranks.update((int(position), min(int(position) + 1, length - 1)))
+    partitioned = np.partition(values, sorted(ranks))
+    order_statistic = lambda rank: int(partitioned[rank])
+    med = order_statistic(length // 2) if length % 2 else (order_statistic(length // 2 - 1) + order_statistic(length // 2)) / 2
+
+    # statistics.multimode(): the most common values, in the order they were first seen
+    unique, first_indexes, counts = np.unique(values, return_index=True, return_counts=True)
+    most_common = counts == counts.max()
+    mmode = unique[most_common][np.argsort(first_indexes[most_common])].tolist()
+
+    percentiles_d = percentiles_hlp(order_statistic, length, percentiles) if percentiles else None
+    return minimum, maximum, average, med, mmode, length, percentiles_d
+
+
+def crash_events(series, uptime_type, timestring_to_seconds):
+    '''
+    Returns the events of crash_detector() for an uptime series (see monitor_utils._crash_events_hlp()), or None.
+    :timestring_to_seconds: monitor_utils._timestring_to_seconds_hlp
+    '''
+    values, errors, encoded = _columns(series)
+    valid = np.flatnonzero(~errors)
+
+    if uptime_type == 'timestring':
+        # each distinct timestring is converted once. Non-encoded (integral) values aren't timestrings
+        if not encoded[valid].all():
+            return None
+        try:
+            seconds = np.array([timestring_to_seconds(value) for value in series.dictionary], dtype=np.int64)
+        except Exception:
+            return None
+        uptimes = seconds[values[valid]]
+        if uptimes.size and np.abs(uptimes).max() >= MAX_EXACT_FLOAT_INT:
+            return None
+    else:
+        if encoded[valid].any() or (valid.size and np.abs(values[valid]).max() >= MAX_EXACT_FLOAT_INT):
+            return None
+        uptimes = values[valid] / 100 # SNMP timeticks to seconds
+
+    # each valid iteration is compared with the previous valid one
+    timestamps = np.frombuffer(series.timestamps, dtype=np.float64, count=len(series))[valid]
+    expected_uptimes = (uptimes[:-1] + (timestamps[1:] - timestamps[:-1])) - 1
+    crashes = np.flatnonzero(uptimes[1:] < expected_uptimes)
+
+    iterations = valid + 1
+    events = [(int(index) + 1, ('error', int(index) + 1)) for index in np.flatnonzero(errors)]
+    if valid.size:
+        events.append((int(iterations[0]), ('first', int(iterations[0]))))
+    events.extend((int(iterations[crash + 1]), ('crash', int(iterations[crash + 1]), expected_uptime, uptime, int(iterations[crash])))
+                  for crash, expected_uptime, uptime in zip(crashes.tolist(), expected_uptimes[crashes].tolist(), uptimes[crashes + 1].tolist()))
+    events.sort(key=lambda event: event[0])
+    return [event for _, event in events]
+
+
+def value_change_events(series):
+    '''Returns the events of get_item_value_change() for a series (see monitor_utils._value_change_events_hlp()), or None.'''
+
+    values, errors, encoded = _columns(series)
+    # an empty value is not recorded as the first value by the Python implementation, it is handled there
+    if '' in series.codes:
+        return None
+    valid = np.flatnonzero(~errors)
+    valid_values, valid_encoded = values[valid], encoded[valid]
+    changes = np.flatnonzero((valid_values[1:] != valid_values[:-1]) | (valid_encoded[1:] != valid_encoded[:-1])) + 1
+
+    value = lambda position: series.dictionary[valid_values[position]] if valid_encoded[position] else str(valid_values[position])
+    events = [(int(index), ('error', int(index))) for index in np.flatnonzero(errors)]
+    if valid.size:
+        events.append((int(valid[0]), ('first', int(valid[0]), value(0))))
+    events.extend((int(valid[change]), ('change', int(valid[change]), value(change - 1), value(change))) for change in changes.tolist())
+    events.sort(key=lambda event: event[0])
+    return [event for _, event in events]
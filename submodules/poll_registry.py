@@ -0,0 +1,475 @@
+from datetime import datetime, timedelta
+from threading import Thread, Event, Lock, Timer
+import logging
+from random import choices
+from string import ascii_uppercase
+from time import time, monotonic
+from os.path import dirname, realpath
+from monitor_utils import monitor_utils
+from stream_statistics import item_accumulator, crash_tracker
+from sample_store import sample_store
+from worker_metrics import worker_metrics
+from log_writer import writer, batched_file_handler
+from snmp_tables import table_of
+from delta_logging import BANNER, ITERATION_END, KEYFRAME, DELTA_HEADER, delta_encoder
+from dut_health import dut_health, DOWN
+from scheduler import scheduler
+
+# the loggers of the workers and of the subscriptions are children of this logger, whose level is set once:
+# setting the level of a logger clears the level cache of all the loggers of the process, which is slow with thousands of them
+WORKERS_LOGGER = 'dut_monitor_workers'
+logging.getLogger(WORKERS_LOGGER).setLevel(logging.DEBUG)
+
+
+def worker_logger(name: str) -> logging.Logger:
+    '''Returns the logger of a worker or of a subscription, at the DEBUG level.'''
+
+    # the dots would make a hierarchy of the DUT's address
+    return logging.getLogger(f"{WORKERS_LOGGER}.{name.replace('.', '_')}")
+
+
+class polling_worker():
+    '''
+        Mixin of the worker classes (snmp_monitor, console_monitor, async_snmp_monitor).
+        A worker polls its DUT for the union of the items of its subscriptions, at the fastest interval of its subscriptions,
+        and publishes the results of each iteration to all of them. The logfiles are written by the subscriptions: the file
+        handler of each subscription is added to the worker's logger, so the worker's own messages reach all the logfiles.
+        The worker class must implement set_items(items), which replaces the list of polled items, and set_tables(tables)
+        if it walks the 'tables' of the profiles (see snmp_tables).
+        The items and tables listed in the 'item_intervals' of the profiles ({item: seconds}) are polled at their own interval:
+        the worker builds each iteration from the items that are due (see due_items()). An item of a subscription without
+        its own interval is polled in every iteration.
+        The worker records its request latencies, iteration durations and counters in self.metrics (see worker_metrics).
+        The health of the DUT is tracked by self.health (see dut_health): the worker doesn't poll a DUT which is down, it
+        publishes its items as errors (skip_iteration()) and probes it at an exponential backoff instead.
+    '''
+
+    def init_subscriptions(self) -> None:
+
+        self.subscriptions = []
+        self.subscriptions_lock = Lock()
+        self.item_intervals = {} # {item or table: interval} of the items polled at their own interval
+        self.next_polls = {}     # {item or table: monotonic time of its next poll}
+
+    def init_metrics(self) -> None:
+
+        self.metrics = worker_metrics(self.profile['dut'], self.profile['utility'])
+
+    def init_health(self) -> None:
+
+        self.health = dut_health(self.profile.get('down_after', 3), self.profile.get('max_backoff', 300))
+
+    def set_tables(self, tables: list) -> None:
+        '''Replaces the list of walked tables. The workers that don't walk tables ignore them.'''
+        pass
+
+    def get_metrics(self) -> dict:
+        '''Returns a snapshot of the worker's metrics (see worker_metrics.snapshot()).'''
+        return self.metrics.snapshot(missed_iterations=self.missed_iterations, health=self.health.state)
+
+    def record_health(self, answered: bool) -> str:
+        '''Records whether the DUT answered in this iteration (or answered the probe). Returns the description of the health
+        state change, which the worker logs, or None.'''
+
+        if self.health.state == DOWN:
+            self.metrics.count('probes')
+        return self.health.record(answered, monotonic(), self.profile['interval'])
+
+    def skip_iteration(self, items: list) -> None:
+        '''Publishes the items (or tables) of an iteration as errors, without polling them, because the DUT is down.'''
+
+        now = monotonic()
+        self.metrics.count('skipped_iterations')
+        self.publish([(item, self.health.skipped_message(item, now)) for item in items])
+
+    def subscribe(self, subscription) -> None:
+
+        with self.subscriptions_lock:
+            self.subscriptions.append(subscription)
+            self.logger.addHandler(subscription.handler)
+            self._update_polling_hlp()
+
+    def unsubscribe(self, subscription) -> int:
+        '''Removes a subscription. Once this method returns, nothing is written to its logfile anymore.
+        Returns the number of remaining subscriptions.'''
+
+        with self.subscriptions_lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+                self.logger.removeHandler(subscription.handler)
+            if self.subscriptions:
+                self._update_polling_hlp()
+            return len(self.subscriptions)
+
+    def _update_polling_hlp(self) -> None:
+        '''Helper method. Polls the union of the subscriptions' items, at the fastest interval of the subscriptions.'''
+
+        interval = min(subscription.profile['interval'] for subscription in self.subscriptions)
+        shortened = interval < self.profile['interval']
+        self.profile['interval'] = interval
+        self.set_items(list(dict.fromkeys(item for subscription in self.subscriptions for item in subscription.profile['items'])))
+        self.set_tables(list(dict.fromkeys(table for subscription in self.subscriptions for table in subscription.profile.get('tables', []))))
+        # an item has its own interval if all the subscriptions polling it give it one. The fastest of them is used
+        intervals, every_iteration = {}, set()
+        for subscription in self.subscriptions:
+            own = subscription.profile.get('item_intervals', {})
+            for name in (*subscription.items, *subscription.tables):
+                if name in own:
+                    intervals[name] = min(intervals.get(name, own[name]), own[name])
+                else:
+                    every_iteration.add(name)
+        self.item_intervals = {name: interval for name, interval in intervals.items() if name not in every_iteration}
+        if shortened:
+            # otherwise, the next iteration would wait out the previous interval (e.g. a 1 s subscriber joining a 300 s worker)
+            self.reschedule()
+
+    def reschedule(self) -> None:
+        '''Brings the next iteration forward after the interval was shortened (see scheduler.reschedule()).'''
+        scheduler.reschedule(self)
+
+    def due_items(self, items: list) -> list:
+        '''
+        Returns the items that are due in the current iteration, in their order: the items without an interval of their own,
+        and those whose interval elapsed since their last poll. An item due within half of the worker's interval is not
+        postponed to the next iteration. Called once per iteration for each item (the label of the console items).
+        '''
+        item_intervals = self.item_intervals
+        if not item_intervals:
+            return items
+        now, tolerance = monotonic(), self.profile['interval'] / 2
+        due = []
+        for item in items:
+            interval = item_intervals.get(item)
+            if interval is not None:
+                next_poll = self.next_polls.get(item)
+                if next_poll is not None and now < next_poll - tolerance:
+                    continue
+                self.next_polls[item] = now + interval if next_poll is None or next_poll + interval < now else next_poll + interval
+            due.append(item)
+        return due
+
+    def publish(self, results: list) -> None:
+        '''
+        Delivers the results of an iteration to the subscriptions.
+        :results: a list of (item, logfile_message) tuples. 'item' is the name of the item in the logfile (the label
+                  of console items, the row name of the rows of the walked tables).
+        '''
+
+        now = monotonic()
+        errors = sum(1 for _, message in results if ' query result: ERROR:' in message)
+        if errors:
+            self.metrics.count('item_errors', errors)
+        with self.subscriptions_lock:
+            for subscription in self.subscriptions:
+                subscription.deliver(results, now, self.profile['interval'])
+
+    def end_subscriptions(self) -> None:
+        '''Ends the subscriptions that are left when the worker stops on its own (e.g. DUT authentication failure).'''
+
+        with self.subscriptions_lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.finish(f"WARNING : {subscription.entity} : run() - The polling worker of the DUT stopped.")
+
+
+class poll_subscription():
+    '''
+        The worker of a dut_monitor profile, as seen by dut_monitor. The DUT is polled by a polling_worker which may be shared
+        with other subscriptions (other dut_monitor objects monitoring the same DUT with the same utility).
+        The subscription writes its own logfile and sample store, containing only its items at its own interval, accumulates the statistics
+        of its items and runs the end of run analysis. It has the interface of a worker: start(), stop(), stopped,
+        is_alive() and join().
+    '''
+
+    def __init__(self, registry, worker_class, profile: dict, on_crash=None, on_analysis=None) -> None:
+
+        self.registry = registry
+        self.worker_class = worker_class # the class of the profile's utility
+        self.profile = profile
+        self.utility = profile['utility']
+        settings = monitor_utils.UTILITY_SETTINGS[self.utility]
+        self.entity = settings['log_entity']
+
+        # set the endtime of the whole monitoring process
+        self.endtime = profile['start_time'] + timedelta(seconds=profile['timeout']) if profile['timeout'] else None
+        # logfile configuration. An unique id is added to the logfile name if another subscription already uses it
+        id = ''.join(choices(ascii_uppercase, k=5))
+        mainDir = f"{dirname(realpath(__file__))}/.."
+        self.logfile_path = f"{mainDir}/logfiles/{settings['logfile_prefix']}{profile['dut'].replace(' ','_')}_" \
+                            f"{profile['start_time'].strftime('%d_%b_%Y_%H_%M_%S')}.log"
+        if not registry.reserve_logfile(self.logfile_path):
+            self.logfile_path = self.logfile_path.replace('.log', f'_{id}.log')
+            registry.reserve_logfile(self.logfile_path)
+        self.logger = worker_logger(f"{profile['dut'].replace(' ','_')}_{id}")
+        # the logfile and the sample store are written by the log_writer thread, so the polling doesn't wait for the disk
+        self.handler = batched_file_handler(self.logfile_path)
+        fmt = logging.Formatter('%(asctime)s | %(message)s')
+        self.handler.setFormatter(fmt)
+        self.logger.addHandler(self.handler)
+        # the samples are also stored in a binary store next to the logfile, from which the end of run analysis loads them
+        self.store_path = self.logfile_path.replace('.log', '.samples.db')
+        self.store = sample_store(self.store_path)
+        # in delta mode, the logfile gets the items whose value changed, and all of them every 'delta_logging' iterations.
+        # The sample store keeps all the samples
+        self.delta = delta_encoder(profile['delta_logging'], self._own_interval_hlp) if profile.get('delta_logging') else None
+        if self.delta:
+            self.logger.info(f"INFO : {self.entity} : __init__() - {DELTA_HEADER}: the items are written when their value changes "
+                             f"or on errors, and all of them every {self.delta.keyframe_interval} iterations {KEYFRAME}.")
+
+        # the names of the items in the logfile (the labels of the console items)
+        self.items = {item if isinstance(item, str) else item[1] for item in profile['items']}
+        # the walked tables. Their rows are items of their own, which appear and disappear with the rows of the DUT
+        self.tables = list(profile.get('tables', []))
+        self.rows = {}  # {row item: table | None}, the tables of the items published by the worker that are not in self.items
+        # the items and tables polled at their own interval are only in the iterations in which they are due. Those polled
+        # in the worker iterations that the subscription skips are delivered with its next iteration
+        self.item_intervals = profile.get('item_intervals', {})
+        self.pending = {} # {item: logfile_message}
+        for name, interval in self.item_intervals.items():
+            self.logger.info(f"ITEM: {name} polled every {interval} seconds")
+        self.iteration_number = 1 # the index of the iteration, counted for this subscription
+        self.next_delivery = None
+        # statistics are accumulated while polling, so they don't need the logfile to be parsed
+        self.statistics = {item: settings['statistics'] for item in profile['statistics']} if 'statistics' in profile else {}
+        # the accumulators of the rows of the 'statistics' tables are created with the rows
+        self.accumulators = {item: item_accumulator() for item in self.statistics if item not in self.tables}
+        # the uptime item is checked for crashes in each iteration. on_crash(crash: dict) is called, in its own thread,
+        # as soon as a crash is detected
+        self.uptime_item = profile.get('detect_crashes')
+        self.crash_tracker = crash_tracker(settings['detect_crashes'], settings['uptime_type']) if self.uptime_item else None
+        self.on_crash = on_crash
+        # the results of the end of run analysis (see monitor_utils.analyze_logfile()), with the keys dut, utility, logfile
+        # and error (None, or why the analysis failed). on_analysis(analysis: dict) is called with them before the subscription stops
+        self.analysis = None
+        self.on_analysis = on_analysis
+        # stop mechanism
+        self.stopped = Event()
+        self.finished = False
+        self.finish_lock = Lock()
+        self.timer = None
+        self.worker = None # the polling worker of the subscription, set when it starts
+
+    def start(self) -> None:
+
+        if not self.endtime:
+            self.logger.info(f"WARNING : {self.entity} : run() - A time limit for the monitoring process was not set.\n")
+        self.registry.start(self)
+        if self.endtime:
+            self.timer = Timer((self.endtime - datetime.now()).total_seconds(), self.finish,
+                               args=(f"INFO : {self.entity} : run() - Thread finished execution. Time limit reached.",))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def deliver(self, results: list, now: float, worker_interval: float) -> None:
+        '''
+        Writes the results of a worker iteration to the logfile, if the subscription's interval elapsed since the last
+        delivery. A delivery due within half of the worker's interval is not postponed to the next worker iteration.
+        '''
+
+        if self.next_delivery is not None and now < self.next_delivery - worker_interval / 2:
+            if self.item_intervals:
+                self.pending.update((item, message) for item, message in results if self._own_interval_hlp(item))
+            return
+        interval = self.profile['interval']
+        self.next_delivery = now + interval if self.next_delivery is None or self.next_delivery + interval < now \
+                             else self.next_delivery + interval
+
+        results = [(item, message) for item, message in results if item in self.items or self._table_hlp(item)]
+        if self.pending:
+            polled = {item for item, _ in results}
+            results.extend((item, message) for item, message in self.pending.items() if item not in polled)
+            self.pending = {}
+        keyframe, written, removed = self.delta.encode(self.iteration_number, results) if self.delta else (False, results, [])
+        self.logger.info(f"{BANNER} Iteration number #{self.iteration_number} started {KEYFRAME + ' ' if keyframe else ''}{BANNER}")
+        for item, message in written:
+            self.logger.info(message)
+        for item in removed:
+            self.logger.info(f"ITEM: {item} no longer returned")
+        for item, message in results:
+            self.update_statistics(item, message)
+            if item == self.uptime_item:
+                self.check_crash(message, now)
+        self.logger.info(ITERATION_END)
+        writer.put(self.store, (results, now, datetime.now()))
+        self.iteration_number += 1
+
+    def _table_hlp(self, item: str) -> str:
+        '''Helper method. Returns the table of a row item (or the table itself, whose errors are published under its name),
+        or None if the item is not a row of the subscription's tables.'''
+
+        if item not in self.rows:
+            self.rows[item] = item if item in self.tables else table_of(item, self.tables)
+        return self.rows[item]
+
+    def _own_interval_hlp(self, item: str) -> bool:
+        '''Helper method. Returns True if the item, or the table of the row item, is polled at its own interval.'''
+
+        return item in self.item_intervals or (item not in self.items and self._table_hlp(item) in self.item_intervals)
+
+    def update_statistics(self, item: str, message: str) -> None:
+        '''
+        Feeds the value of a statistics item to its accumulator. The value is extracted from the logfile message
+        using the same pattern parse_logfile() would use on the logfile line.
+        '''
+        if item not in self.accumulators:
+            table = self.rows.get(item)
+            if table is None or table == item or table not in self.statistics:
+                return
+            # the first value of a row of a 'statistics' table
+            self.statistics[item] = self.statistics[table]
+            self.accumulators[item] = item_accumulator()
+        val = self.statistics[item].search(message + '\n')
+        if val:
+            self.accumulators[item].update(val.group(0), time())
+
+    def check_crash(self, message: str, now: float) -> None:
+        '''Checks the uptime retrieved in the current iteration and reports a crash as soon as it is detected.'''
+
+        crash = self.crash_tracker.update(self.iteration_number, message, now)
+        if not crash:
+            return
+        crash.update({'dut': self.profile['dut'], 'utility': self.utility, 'logfile': self.logfile_path,
+                      'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+        self.logger.info(f"WARNING : {self.entity} : check_crash() - CRASH detected in iteration {crash['iteration']}: Expected uptime "
+                         f"is {crash['expected_uptime']:.2f} seconds and the retrieved uptime is {crash['uptime']} seconds. "
+                         f"Last successful iteration is {crash['last_successful_iteration']}.")
+        if self.on_crash:
+            # the callback is not executed by the polling worker, so it can't delay the polling
+            Thread(target=self.on_crash, args=(crash,), daemon=True).start()
+
+    def get_statistics(self) -> dict:
+        '''Returns the statistics accumulated so far: {item: stats_dict}'''
+        # the accumulators of the table rows are added while polling
+        return {item: accumulator.snapshot() for item, accumulator in list(self.accumulators.items())}
+
+    def get_metrics(self) -> dict:
+        '''Returns the metrics of the polling worker (shared with the other subscriptions of the worker), or {} if it didn't start.'''
+        return self.worker.get_metrics() if self.worker else {}
+
+    def is_alive(self) -> bool:
+        return not self.stopped.is_set()
+
+    def join(self, timeout: float = None) -> None:
+        self.stopped.wait(timeout=timeout)
+
+    def stop(self) -> None:
+        self.logger.info(f"INFO : {self.entity} : stop() - Thread stop command received.")
+        self.finish(f"WARNING : {self.entity} : run() - Thread stopped ahead of time due to a call to stop().")
+
+    def finish(self, message: str) -> None:
+        '''Unsubscribes from the worker and starts the end of run analysis of the logfile. Only the first call has effect.'''
+
+        with self.finish_lock:
+            if self.finished:
+                return
+            self.finished = True
+        if self.timer:
+            self.timer.cancel()
+        self.registry.unsubscribe(self)
+        self.logger.info(message)
+        Thread(target=self.end_thread_processing, daemon=True).start()
+
+    def end_thread_processing(self) -> None:
+        analysis = {'dut': self.profile['dut'], 'utility': self.utility, 'logfile': self.logfile_path, 'error': None}
+        try:
+            # the logfile and the sample store are complete once the queued records and samples are written. The handler
+            # is closed first: the logfile isn't written by the log_writer thread anymore, so the analysis appends to it
+            self.logger.removeHandler(self.handler)
+            self.handler.close()
+            self.store.close()
+            utils = monitor_utils()
+            analysis.update(utils.analyze_logfile(logfile_path=self.logfile_path, profile=self.profile, accumulators=self.accumulators,
+                                                  store_path=self.store_path))
+        except Exception as e:
+            # the analysis runs in a thread of its own: the failure is logged to the logfile, where the analysis would have
+            #  been, and reported to on_analysis (dut_monitor logs it too) instead of being raised where nobody catches it
+            analysis['error'] = f"{type(e).__name__}: {e}"
+            try:
+                with open(file=self.logfile_path, mode='a+', encoding='utf-8') as logfile:
+                    logfile.write(f"ERROR : {self.entity} : end_thread_processing() - The end of run analysis failed: {analysis['error']}\n")
+            except OSError:
+                pass
+        finally:
+            self.analysis = analysis
+            try:
+                if self.on_analysis:
+                    self.on_analysis(analysis)
+            finally:
+                self.stopped.set()
+
+
+class poll_registry():
+    '''
+        Process-wide registry of the polling workers, keyed by (DUT, utility). The first subscription to a DUT creates and
+        starts its worker, the following ones join it, and the worker is stopped when its last subscription ends.
+        The workers of different DUTs are created concurrently: only the subscriptions of the same DUT wait for each other.
+    '''
+
+    def __init__(self) -> None:
+
+        self.lock = Lock()
+        self.workers = {}       # {(dut, utility): worker}
+        self.key_locks = {}     # {(dut, utility): Lock}, held while the worker of the key is created or stopped
+        self.logfiles = set()   # the logfiles used by the subscriptions of the process
+
+    def _key_lock_hlp(self, key: tuple) -> Lock:
+        '''Helper method. Returns the lock of a (dut, utility) key.'''
+
+        with self.lock:
+            return self.key_locks.setdefault(key, Lock())
+
+    def reserve_logfile(self, logfile_path: str) -> bool:
+        '''Returns False if the logfile is already used by another subscription of the process.'''
+
+        with self.lock:
+            if logfile_path in self.logfiles:
+                return False
+            self.logfiles.add(logfile_path)
+            return True
+
+    def subscribe(self, worker_class, profile: dict, on_crash=None, on_analysis=None) -> poll_subscription:
+        '''Returns a new, not started, subscription for the profile. worker_class is the class of the profile's utility.
+        on_crash(crash: dict) is called when a crash of the DUT is detected (profile key 'detect_crashes').
+        on_analysis(analysis: dict) is called with the results of the end of run analysis, before the subscription stops.'''
+
+        return poll_subscription(self, worker_class, profile, on_crash, on_analysis)
+
+    def start(self, subscription: poll_subscription) -> None:
+        '''Subscribes to the worker of the subscription's DUT, creating and starting it if there is none.'''
+
+        key = (subscription.profile['dut'], subscription.utility)
+        with self._key_lock_hlp(key):
+            worker = self.workers.get(key)
+            if worker is not None and worker.is_alive() and not worker.stop_thread:
+                worker.subscribe(subscription)
+                subscription.worker = worker
+                subscription.logger.info(f"INFO : {subscription.entity} : run() - Subscribed to the running worker of the DUT.")
+                return
+            # the worker's own time limit is not used, each subscription has its own
+            try:
+                worker = subscription.worker_class(profile=dict(subscription.profile, timeout=None))
+            except Exception as e:
+                subscription.logger.info(f"ERROR : {subscription.entity} : start() - Failed to create the worker of the DUT: {type(e).__name__}: {e}")
+                subscription.logger.removeHandler(subscription.handler)
+                subscription.handler.close()
+                subscription.store.close()
+                raise
+            worker.subscribe(subscription)
+            subscription.worker = worker
+            self.workers[key] = worker
+            worker.start()
+
+    def unsubscribe(self, subscription: poll_subscription) -> None:
+
+        key = (subscription.profile['dut'], subscription.utility)
+        with self._key_lock_hlp(key):
+            worker = self.workers.get(key)
+            if worker is None:
+                return
+            if not worker.unsubscribe(subscription):
+                worker.stop()
+                del self.workers[key]
+
+
+# the registry shared by all the dut_monitor objects of the process
+registry = poll_registry()
@@ -0,0 +1,212 @@
+from threading import Thread, Event, Lock
+from itertools import count
+from queue import Empty
+import multiprocessing
+
+
+class shard_worker():
+    '''
+        The worker of a profile running in a shard process, as seen by the dut_monitor of the main process. It has the
+        worker interface used by dut_monitor: stop(), stopped, is_alive(), join(), utility, get_statistics() and get_metrics().
+        The statistics and metrics are requested from the shard, and the last ones are kept once the worker stopped.
+    '''
+
+    def __init__(self, shard, profile: dict) -> None:
+
+        self.shard = shard
+        self.profile = profile
+        self.utility = profile['utility']
+        self.logfile_path = self.store_path = None # set when the shard started the worker
+        self.stopped = Event()
+        self.final = {'statistics': {}, 'metrics': {}, 'analysis': None} # sent by the shard when the worker stops
+
+    def stop(self) -> None:
+        self.shard.send('stop', self.profile['dut'])
+
+    def is_alive(self) -> bool:
+        return not self.stopped.is_set()
+
+    def join(self, timeout: float = None) -> None:
+        self.stopped.wait(timeout=timeout)
+
+    def get_statistics(self) -> dict:
+        if self.stopped.is_set():
+            return self.final['statistics']
+        return self.shard.request('statistics', self.profile['dut'])
+
+    def get_metrics(self) -> dict:
+        if self.stopped.is_set():
+            return self.final['metrics']
+        return self.shard.request('metrics', self.profile['dut'])
+
+
+class process_shard():
+    '''A process running the workers of a part of the profiles, with its own dut_monitor (see shard_main()).'''
+
+    def __init__(self, index: int, context, monitor_class, profiles: list, run_kwargs: dict, events) -> None:
+
+        self.index = index
+        self.commands = context.Queue()
+        self.process = context.Process(target=shard_main, name=f'dut_monitor_shard_{index}', daemon=True,
+                                       args=(index, monitor_class, profiles, run_kwargs, self.commands, events))
+        self.workers = {profile['dut']: shard_worker(self, profile) for profile in profiles}
+        self.started = Event()  # set when the shard reported the result of its startup
+        self.result = None      # {'started': [dut, ...], 'failed': {dut: reason}}
+        self.exited = False
+        self.requests = {}      # {request_id: [Event, reply]}
+        self.request_ids = count()
+        self.lock = Lock()
+
+    def send(self, *command) -> None:
+        if not self.exited:
+            self.commands.put(command)
+
+    def request(self, kind: str, dut: str, timeout: float = 10) -> dict:
+        '''Sends a request to the shard and returns its reply, or {} if the shard doesn't reply in time.'''
+
+        with self.lock:
+            if self.exited:
+                return {}
+            request_id = next(self.request_ids)
+            pending = self.requests[request_id] = [Event(), {}]
+        self.send(kind, dut, request_id)
+        pending[0].wait(timeout=timeout)
+        with self.lock:
+            self.requests.pop(request_id, None)
+        return pending[1]
+
+    def reply(self, request_id: int, data: dict) -> None:
+        with self.lock:
+            pending = self.requests.get(request_id)
+        if pending:
+            pending[1] = data
+            pending[0].set()
+
+    def exit(self, reason: str = None) -> None:
+        '''Called when the shard process ended. The workers it did not report as stopped are stopped.'''
+
+        with self.lock:
+            self.exited = True
+            for pending in self.requests.values():
+                pending[0].set()
+        if not self.started.is_set():
+            self.result = {'started': [], 'failed': {dut: reason or 'the shard process ended' for dut in self.workers}}
+            self.started.set()
+        for worker in self.workers.values():
+            worker.stopped.set()
+
+
+class shard_supervisor():
+    '''
+        Spreads the profiles of a dut_monitor over a pool of processes, so the polling and parsing of the workers is not
+        limited to the core of a single process. Each process (shard) runs a dut_monitor with its part of the profiles and
+        sends its events to the main process: startup result, crashes (forwarded to the dut_monitor's crash_handler()),
+        workers stopped (with the results of their analysis, forwarded to the dut_monitor's analysis_handler()), and replies to the statistics/metrics requests. The stop commands are sent to the shards.
+    '''
+
+    def __init__(self, monitor, processes: int) -> None:
+
+        self.monitor = monitor
+        self.processes = max(processes, 1)
+        # the processes are spawned, not forked: the main process runs threads (scheduler, log writer, ...)
+        self.context = multiprocessing.get_context('spawn')
+        self.events = self.context.Queue()
+        self.shards = []
+        self.listener = None
+
+    def start(self, profiles: list, run_kwargs: dict) -> list:
+        '''
+        Starts the shards and waits for them to start their workers. The started workers are added to the dut_monitor's
+        workers, as shard_worker proxies. Returns the list of (profile, reason) tuples of the profiles that failed to start.
+        '''
+        shard_profiles = [profiles[index::self.processes] for index in range(min(self.processes, len(profiles)))]
+        for index, part in enumerate(shard_profiles):
+            self.shards.append(process_shard(index, self.context, type(self.monitor), part, run_kwargs, self.events))
+        for shard in self.shards:
+            shard.process.start()
+        self.listener = Thread(target=self._listen, name='shard_supervisor', daemon=True)
+        self.listener.start()
+
+        failures = []
+        for shard in self.shards:
+            shard.started.wait()
+        # the workers are added in the order of the profiles, the profile of index i being in the shard i % processes
+        for index, profile in enumerate(profiles):
+            shard = self.shards[index % len(self.shards)]
+            if profile['dut'] in shard.result['started']:
+                self.monitor.workers[profile['dut']] = shard.workers[profile['dut']]
+            else:
+                failures.append((profile, shard.result['failed'].get(profile['dut'], 'the worker was not started')))
+        return failures
+
+    def _listen(self) -> None:
+        '''Dispatches the events of the shards, until all the shard processes ended.'''
+
+        while not all(shard.exited for shard in self.shards):
+            try:
+                event = self.events.get(timeout=1)
+            except Empty:
+                # a shard that died without reporting it (e.g. killed) is detected once its events are all read
+                for shard in self.shards:
+                    if not shard.exited and not shard.process.is_alive():
+                        shard.exit(f'the shard process ended with the exit code {shard.process.exitcode}')
+                continue
+            kind, shard = event[0], self.shards[event[1]]
+            if kind == 'started':
+                shard.result = event[2]
+                for dut, (logfile_path, store_path) in event[3].items():
+                    shard.workers[dut].logfile_path, shard.workers[dut].store_path = logfile_path, store_path
+                shard.started.set()
+            elif kind == 'stopped':
+                worker = shard.workers[event[2]]
+                worker.final = event[3]
+                if worker.final['analysis']:
+                    self.monitor.analysis_handler(worker.final['analysis'])
+                worker.stopped.set()
+            elif kind == 'crash':
+                Thread(target=self.monitor.crash_handler, args=(event[2],), daemon=True).start()
+            elif kind == 'reply':
+                shard.reply(event[2], event[3])
+            elif kind == 'exit':
+                shard.exit()
+
+
+def shard_main(index: int, monitor_class, profiles: list, run_kwargs: dict, commands, events) -> None:
+    '''
+    The main function of a shard process: runs a dut_monitor with the shard's profiles and serves the commands of the
+    main process until all the workers stopped.
+    '''
+    start_time = profiles[0]['start_time']
+    # the fleet report is written by the main process, with the analysis results of all the shards
+    monitor = monitor_class(monitor_map=profiles, report_top=None)
+    # the logfiles and time limits of the shard's workers are based on the start time of the main dut_monitor
+    monitor.start_time = start_time
+    monitor.add_crash_callback(lambda crash: events.put(('crash', index, crash)))
+    result = monitor.run(**run_kwargs)
+    events.put(('started', index, result, {dut: (worker.logfile_path, worker.store_path) for dut, worker in monitor.workers.items()}))
+
+    def watch(dut: str, worker) -> None:
+        worker.join()
+        events.put(('stopped', index, dut, {'statistics': worker.get_statistics(), 'metrics': worker.get_metrics(),
+                                            'analysis': worker.analysis}))
+
+    watchers = [Thread(target=watch, args=(dut, worker), daemon=True) for dut, worker in monitor.workers.items()]
+    for watcher in watchers:
+        watcher.start()
+
+    while any(watcher.is_alive() for watcher in watchers):
+        try:
+            command = commands.get(timeout=0.5)
+        except Empty:
+            continue
+        kind, dut = command[0], command[1]
+        if kind == 'stop':
+            # stop_workers() waits for the worker to stop, the commands are served meanwhile
+            Thread(target=monitor.stop_workers, args=(dut,), daemon=True).start()
+        elif kind == 'statistics':
+            events.put(('reply', index, command[2], monitor.get_statistics(dut)))
+        elif kind == 'metrics':
+            events.put(('reply', index, command[2], monitor.get_metrics(dut).get(dut, {})))
+    for watcher in watchers:
+        watcher.join()
+    events.put(('exit', index))
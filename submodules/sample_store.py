@@ -0,0 +1,113 @@
+import sqlite3
+from datetime import datetime
+from item_series import EPOCH
+
+
+def parse_result(message: str) -> tuple:
+    '''
+    Splits a query result message ('ITEM: <item> query result:  <value>' | 'ITEM: <item> query result: ERROR: <error>')
+    into (value, error). The value is an int if it is integral, the stripped string otherwise. Exactly one of them is None.
+    '''
+    result = message.partition(' query result: ')[2]
+    if result.startswith('ERROR:'):
+        return None, result[6:].strip()
+    value = result.strip()
+    try:
+        number = int(value)
+        if str(number) == value and -2**63 <= number < 2**63:
+            return number, None
+    except ValueError:
+        pass
+    return value, None
+
+
+class sample_store():
+    '''
+        Append-only SQLite store of the samples of a run, written next to the text logfile. Each sample is a row of
+        (item id, monotonic timestamp, timestamp, typed value, error). The timestamp is the logfile's local time, as seconds
+        since item_series.EPOCH, and the rows are indexed by item id, so the series of a few items can be loaded
+        without reading the samples of the other ones.
+        The database is created by the first write or read, not by the constructor, so starting many workers doesn't wait
+        for the disk: the samples are written by the log_writer thread.
+    '''
+
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)',
+              'CREATE TABLE IF NOT EXISTS samples (item_id INTEGER NOT NULL, monotonic REAL NOT NULL, timestamp REAL NOT NULL, '
+              'value, error TEXT)',
+              'CREATE INDEX IF NOT EXISTS samples_item_id ON samples (item_id)')
+
+    def __init__(self, path: str) -> None:
+
+        self.path = path
+        self.connection = None
+        self.item_ids = {}
+
+    def _connect_hlp(self) -> None:
+        '''Helper method. Opens the database, creating it if needed.'''
+
+        # the samples are written by the log_writer thread, the store is created and closed by other threads
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.item_ids = dict(self.connection.execute('SELECT name, id FROM items'))
+
+    def _item_id_hlp(self, item: str) -> int:
+        '''Helper method. Returns the id of an item, adding the item to the index if it is new.'''
+
+        item_id = self.item_ids.get(item)
+        if item_id is None:
+            item_id = self.item_ids[item] = self.connection.execute('INSERT INTO items (name) VALUES (?)', (item,)).lastrowid
+        return item_id
+
+    def append(self, results: list, monotonic: float, timestamp: datetime) -> None:
+        '''
+        Appends the samples of an iteration, in a single transaction.
+        :results: a list of (item, logfile_message) tuples, as published by the polling workers
+        :monotonic: the monotonic time of the iteration
+        :timestamp: the local time of the iteration
+        '''
+        self.write_batch([(results, monotonic, timestamp)])
+
+    def write_batch(self, iterations: list) -> None:
+        '''Appends the samples of several iterations, in a single transaction. Called by the log_writer thread.
+        :iterations: a list of (results, monotonic, timestamp) tuples, see append()'''
+
+        if self.connection is None:
+            self._connect_hlp()
+        rows = []
+        for results, monotonic, timestamp in iterations:
+            seconds = (timestamp - EPOCH).total_seconds()
+            rows.extend((self._item_id_hlp(item), monotonic, seconds, *parse_result(message)) for item, message in results)
+        self.connection.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?)', rows)
+        self.connection.commit()
+
+    def load(self, item: str):
+        '''Yields the (timestamp, value, error) samples of an item, in the order they were appended.'''
+
+        if self.connection is None:
+            self._connect_hlp()
+        item_id = self.item_ids.get(item)
+        if item_id is None:
+            row = self.connection.execute('SELECT id FROM items WHERE name = ?', (item,)).fetchone()
+            if row is None:
+                return
+            item_id = row[0]
+        yield from self.connection.execute('SELECT timestamp, value, error FROM samples WHERE item_id = ? ORDER BY rowid', (item_id,))
+
+    def item_names(self) -> list:
+        '''Returns the names of the items of the store, in the order of their first sample.'''
+
+        if self.connection is None:
+            self._connect_hlp()
+        return [name for name, in self.connection.execute('SELECT name FROM items ORDER BY id')]
+
+    def close(self) -> None:
+        '''Closes the database. The database of a run without samples is created empty, so each run has a store.'''
+
+        if self.connection is None:
+            self._connect_hlp()
+        self.connection.close()
+        self.connection = None
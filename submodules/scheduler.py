@@ -0,0 +1,107 @@
+from threading import Thread, Condition
+from heapq import heappush, heappop
+from itertools import count
+from time import monotonic
+from zlib import crc32
+
+
+def start_offset(dut: str, interval: float) -> float:
+    '''
+    Returns the delay of the first iteration of a DUT's worker, within [0, interval). The delay is derived from the
+    DUT's name, so the workers started at the same time are spread over the interval instead of polling in bursts.
+    '''
+    return (crc32(dut.encode()) % 1000) / 1000 * interval
+
+
+def next_deadline(deadline: float, interval: float, now: float) -> tuple:
+    '''
+    Returns (next_deadline, missed): the deadline that follows 'deadline' at a fixed rate and the number of deadlines
+    that were skipped because they already passed at 'now'. Missed deadlines are skipped instead of being fired in a burst.
+    '''
+    deadline += interval
+    if deadline > now:
+        return deadline, 0
+    missed = int((now - deadline) // interval) + 1
+    return deadline + missed * interval, missed
+
+
+class fixed_rate_scheduler():
+    '''
+        Process-wide scheduler of the worker iterations. It keeps a heap of deadlines, one per worker, and a single thread
+        that calls worker.tick() when the deadline of a worker is reached. The deadlines follow a fixed rate (start + n*interval),
+        so the iterations don't drift by the time needed to query the DUT. A tick that finds the worker still busy with
+        the previous iteration is missed: the worker counts it and the iteration is skipped.
+        The interval is read from the worker's profile at each deadline, so it can change while the worker runs. A worker
+        whose interval was shortened is rescheduled (see reschedule()), so its next iteration doesn't wait out the old interval.
+    '''
+
+    def __init__(self) -> None:
+
+        self.condition = Condition()
+        self.heap = []           # [(deadline, sequence_number, worker)]
+        self.deadlines = {}      # {worker: (deadline, sequence_number, interval)}, the current heap entry of each scheduled worker.
+                                 #  The other entries (of removed or rescheduled workers) are dropped when they are reached
+        self.sequence = count()  # breaks the ties between equal deadlines
+        self.thread = None
+
+    def add(self, worker) -> None:
+        '''Schedules the iterations of a worker. The first one is delayed by the start offset of its DUT.'''
+
+        with self.condition:
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name='fixed_rate_scheduler', daemon=True)
+                self.thread.start()
+            interval = worker.profile['interval']
+            self._push_hlp(worker, monotonic() + start_offset(worker.profile['dut'], interval), interval)
+            self.condition.notify()
+
+    def remove(self, worker) -> None:
+        with self.condition:
+            self.deadlines.pop(worker, None)
+
+    def reschedule(self, worker) -> None:
+        '''
+        Re-pushes the deadline of a worker after its interval was shortened: the next deadline follows the previous one
+        at the new interval, or is now if that already passed. A deadline that wouldn't be sooner, or a worker which is
+        not scheduled, is left as it is.
+        '''
+        with self.condition:
+            if worker not in self.deadlines:
+                return
+            deadline, _, interval = self.deadlines[worker]
+            rescheduled = max(deadline - interval + worker.profile['interval'], monotonic())
+            if rescheduled < deadline:
+                self._push_hlp(worker, rescheduled, worker.profile['interval'])
+                self.condition.notify()
+
+    def _push_hlp(self, worker, deadline: float, interval: float) -> None:
+        '''Helper method. Pushes the next deadline of a worker, which replaces its previous one. Called with the condition held.'''
+
+        entry = (deadline, next(self.sequence), worker)
+        self.deadlines[worker] = (deadline, entry[1], interval)
+        heappush(self.heap, entry)
+
+    def _run(self) -> None:
+
+        with self.condition:
+            while True:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                deadline, _, worker = self.heap[0]
+                now = monotonic()
+                if deadline > now:
+                    self.condition.wait(timeout=deadline - now)
+                    continue
+                _, sequence, _ = heappop(self.heap)
+                if self.deadlines.get(worker, (None, None))[1] != sequence:
+                    continue
+                worker.tick()
+                interval = worker.profile['interval']
+                deadline, missed = next_deadline(deadline, interval, monotonic())
+                worker.missed_iterations += missed
+                self._push_hlp(worker, deadline, interval)
+
+
+# the scheduler shared by all the workers of the process
+scheduler = fixed_rate_scheduler()
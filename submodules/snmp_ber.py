@@ -0,0 +1,226 @@
+'''
+    Minimal BER codec for SNMPv1/SNMPv2c messages (RFC 1157, RFC 3416).
+    It is used by the asyncio based SNMP engine, which can't rely on the blocking netsnmp bindings.
+'''
+
+# universal and SNMP application tags
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+IP_ADDRESS = 0x40
+COUNTER32 = 0x41
+GAUGE32 = 0x42
+TIMETICKS = 0x43
+OPAQUE = 0x44
+COUNTER64 = 0x46
+NO_SUCH_OBJECT = 0x80
+NO_SUCH_INSTANCE = 0x81
+END_OF_MIB_VIEW = 0x82
+
+# PDU tags
+GET_REQUEST = 0xA0
+GET_NEXT_REQUEST = 0xA1
+RESPONSE = 0xA2
+GET_BULK_REQUEST = 0xA5
+
+# message versions
+VERSIONS = {1: 0, 2: 1} # snmp_monitor.json 'Version' setting -> version field of the message
+
+ERROR_STATUS = {0: 'noError', 1: 'tooBig', 2: 'noSuchName', 3: 'badValue', 4: 'readOnly', 5: 'genErr',
+                6: 'noAccess', 7: 'wrongType', 8: 'wrongLength', 9: 'wrongEncoding', 10: 'wrongValue',
+                11: 'noCreation', 12: 'inconsistentValue', 13: 'resourceUnavailable', 14: 'commitFailed',
+                15: 'undoFailed', 16: 'authorizationError', 17: 'notWritable', 18: 'inconsistentName'}
+
+EXCEPTIONS = {NO_SUCH_OBJECT: 'NOSUCHOBJECT', NO_SUCH_INSTANCE: 'NOSUCHINSTANCE', END_OF_MIB_VIEW: 'ENDOFMIBVIEW'}
+
+
+class snmp_decode_error(Exception):
+    pass
+
+
+def _encode_length(length: int) -> bytes:
+
+    if length < 0x80:
+        return bytes((length,))
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes((0x80 | len(encoded),)) + encoded
+
+
+def _encode_tlv(tag: int, content: bytes) -> bytes:
+    return bytes((tag,)) + _encode_length(len(content)) + content
+
+
+def _encode_integer(tag: int, value: int) -> bytes:
+    return _encode_tlv(tag, value.to_bytes((value + (value < 0)).bit_length() // 8 + 1, 'big', signed=True))
+
+
+def _encode_unsigned(tag: int, value: int) -> bytes:
+    # unsigned application types are encoded like integers, with a leading zero octet if the high bit is set
+    return _encode_tlv(tag, value.to_bytes(value.bit_length() // 8 + 1, 'big'))
+
+
+def encode_oid(oid: str) -> bytes:
+    '''Encodes a numeric OID ('.1.3.6.1.2.1.1.3.0' or '1.3.6.1.2.1.1.3.0') to its BER content octets.'''
+
+    arcs = [int(arc) for arc in oid.strip('.').split('.')]
+    if len(arcs) < 2:
+        raise ValueError(f'Invalid OID {oid}')
+    content = bytearray()
+    for arc in [40 * arcs[0] + arcs[1]] + arcs[2:]:
+        chunk = [arc & 0x7F]
+        arc >>= 7
+        while arc:
+            chunk.append(0x80 | (arc & 0x7F))
+            arc >>= 7
+        content.extend(reversed(chunk))
+    return bytes(content)
+
+
+def encode_value(tag: int, value) -> bytes:
+    '''Encodes a varbind value of the given type.'''
+
+    if tag == INTEGER:
+        return _encode_integer(tag, value)
+    if tag in (COUNTER32, GAUGE32, TIMETICKS, COUNTER64):
+        return _encode_unsigned(tag, value)
+    if tag in (OCTET_STRING, OPAQUE):
+        return _encode_tlv(tag, value.encode('utf-8') if isinstance(value, str) else bytes(value))
+    if tag == OBJECT_IDENTIFIER:
+        return _encode_tlv(tag, encode_oid(value))
+    if tag == IP_ADDRESS:
+        return _encode_tlv(tag, bytes(int(octet) for octet in value.split('.')))
+    # NULL and the v2c exceptions (noSuchObject, noSuchInstance, endOfMibView) don't have content
+    return _encode_tlv(tag, b'')
+
+
+def encode_message(version: int, community: str, pdu_type: int, request_id: int, varbinds: list,
+                   error_status: int = 0, error_index: int = 0) -> bytes:
+    '''
+    Encodes a SNMP message.
+    :version: 1 | 2 (SNMPv1 | SNMPv2c)
+    :varbinds: list of (oid, tag, value) tuples. Requests use (oid, NULL, None)
+    :error_status, error_index: non-repeaters and max-repetitions for GetBulkRequest PDUs
+    '''
+
+    varbind_list = b''.join(_encode_tlv(SEQUENCE, _encode_tlv(OBJECT_IDENTIFIER, encode_oid(oid)) + encode_value(tag, value))
+                            for oid, tag, value in varbinds)
+    pdu = _encode_integer(INTEGER, request_id) + _encode_integer(INTEGER, error_status) + \
+          _encode_integer(INTEGER, error_index) + _encode_tlv(SEQUENCE, varbind_list)
+    message = _encode_integer(INTEGER, VERSIONS[version]) + _encode_tlv(OCTET_STRING, community.encode('utf-8')) + \
+              _encode_tlv(pdu_type, pdu)
+    return _encode_tlv(SEQUENCE, message)
+
+
+def encode_request(version: int, community: str, pdu_type: int, request_id: int, oids: list,
+                   non_repeaters: int = 0, max_repetitions: int = 0) -> bytes:
+    '''Encodes a GetRequest, GetNextRequest or GetBulkRequest message for the list of numeric OIDs.'''
+
+    return encode_message(version, community, pdu_type, request_id, [(oid, NULL, None) for oid in oids],
+                          non_repeaters, max_repetitions)
+
+
+def _decode_tlv(data: bytes, offset: int) -> tuple:
+    '''Returns (tag, content_start, content_end) of the TLV that starts at offset.'''
+
+    try:
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            size = length & 0x7F
+            length = int.from_bytes(data[offset:offset + size], 'big')
+            offset += size
+    except IndexError:
+        raise snmp_decode_error('Truncated message')
+    if offset + length > len(data):
+        raise snmp_decode_error('Truncated message')
+    return tag, offset, offset + length
+
+
+def decode_oid(content: bytes) -> str:
+    '''Decodes the BER content octets of an OID to the numeric format netsnmp uses: '.1.3.6.1.2.1.1.3.0' '''
+
+    arcs = []
+    arc = 0
+    for octet in content:
+        arc = (arc << 7) | (octet & 0x7F)
+        if not octet & 0x80:
+            arcs.append(arc)
+            arc = 0
+    if not arcs:
+        return ''
+    first = min(arcs[0] // 40, 2)
+    return '.' + '.'.join(str(arc) for arc in [first, arcs[0] - 40 * first] + arcs[1:])
+
+
+def decode_value(tag: int, content: bytes):
+    '''Decodes a varbind value. Integral types are returned as int, strings as bytes and OIDs/IP addresses as str.'''
+
+    if tag == INTEGER:
+        return int.from_bytes(content, 'big', signed=True)
+    if tag in (COUNTER32, GAUGE32, TIMETICKS, COUNTER64):
+        return int.from_bytes(content, 'big')
+    if tag == OBJECT_IDENTIFIER:
+        return decode_oid(content)
+    if tag == IP_ADDRESS:
+        return '.'.join(str(octet) for octet in content)
+    if tag == NULL or tag in EXCEPTIONS:
+        return None
+    return bytes(content)
+
+
+def decode_message(data: bytes) -> dict:
+    '''
+    Decodes a SNMPv1/SNMPv2c message. Returns a dictionary with the keys:
+    version, community, pdu_type, request_id, error_status, error_index and
+    varbinds: a list of (oid, tag, value) tuples.
+    '''
+
+    tag, start, end = _decode_tlv(data, 0)
+    if tag != SEQUENCE:
+        raise snmp_decode_error('The message is not a sequence')
+    fields = []
+    offset = start
+    # version, community and the PDU
+    for _ in range(3):
+        tag, content_start, content_end = _decode_tlv(data, offset)
+        fields.append((tag, content_start, content_end))
+        offset = content_end
+
+    version = {value: key for key, value in VERSIONS.items()}.get(decode_value(INTEGER, data[fields[0][1]:fields[0][2]]))
+    community = data[fields[1][1]:fields[1][2]].decode('utf-8', errors='replace')
+    pdu_type, offset, pdu_end = fields[2]
+
+    header = []
+    for _ in range(3):
+        tag, content_start, content_end = _decode_tlv(data, offset)
+        header.append(decode_value(INTEGER, data[content_start:content_end]))
+        offset = content_end
+
+    varbinds = []
+    tag, offset, list_end = _decode_tlv(data, offset)
+    while offset < list_end:
+        _, varbind_start, varbind_end = _decode_tlv(data, offset)
+        _, oid_start, oid_end = _decode_tlv(data, varbind_start)
+        value_tag, value_start, value_end = _decode_tlv(data, oid_end)
+        varbinds.append((decode_oid(data[oid_start:oid_end]), value_tag, decode_value(value_tag, data[value_start:value_end])))
+        offset = varbind_end
+
+    return {'version': version, 'community': community, 'pdu_type': pdu_type, 'request_id': header[0],
+            'error_status': header[1], 'error_index': header[2], 'varbinds': varbinds}
+
+
+def format_value(tag: int, value) -> str:
+    '''
+    Formats a decoded varbind value the way the netsnmp bindings return it (UseNumeric=1),
+    so the logfile lines written by the asyncio engine are the same as those of snmp_monitor.
+    Raises ValueError for the v2c exceptions (noSuchObject, noSuchInstance, endOfMibView).
+    '''
+
+    if tag in EXCEPTIONS:
+        raise ValueError(EXCEPTIONS[tag])
+    if isinstance(value, bytes):
+        return str(value, 'UTF-8')
+    return '' if value is None else str(value)
@@ -1,16 +1,24 @@
 from datetime import datetime, timedelta
+from time import perf_counter
 from threading import Thread, Event
-import logging
-from monitor_utils import monitor_utils
-from re import compile
+from poll_registry import polling_worker, worker_logger
+from scheduler import scheduler
 from netsnmp import *
-from json import load as json_load, decoder
-from os.path import dirname, realpath
+from json import decoder
+from monitor_utils import monitor_utils
+from snmp_tables import OID_NAMES, MAX_REPETITIONS, resolve_oid, oid_key, row_item, table_rows
+from dut_health import DOWN, PROBE_OID, is_timeout, unreachable_message
+from time import monotonic
 
 
-class snmp_monitor(Thread):
+class snmp_monitor(Thread, polling_worker):
     '''
-        Each thread (called snmp worker/oid_inspector worker) inspects a set of OIDs for a single IP. 
+        Each thread (called snmp worker/oid_inspector worker) inspects a set of OIDs for a single IP.
+        The results are published to the subscriptions of the worker (see poll_registry), which write the logfiles.
+        The 'tables' of the profile are walked with GETBULK requests (GETNEXT with SNMPv1) and each row is published as an item.
+        Their roots are given numerically or by a name of snmp_tables.OID_NAMES or of the 'oid_names' of snmp_monitor.json.
+        After the first request of an iteration that times out, the remaining items of the iteration are not queried, and a DUT
+        that is down is only probed (see dut_health).
     '''
 
     def __init__(self, profile: dict) -> None:
@@ -21,20 +29,16 @@ class snmp_monitor(Thread):
 
         # set the endtime of the whole monitoring process 
         self.endtime = profile['start_time'] + timedelta(seconds=profile['timeout']) if profile['timeout'] else None 
-        # path settings
-        mainDir = f"{dirname(realpath(__file__))}/.."
-        # logfile configuration
-        self.logfile_path = f"{mainDir}/logfiles/logfile_{profile['dut']}_{profile['start_time'].strftime('%d_%b_%Y_%H_%M_%S')}.log"
-        self.logger = logging.getLogger(profile['dut'])
-        self.logger.setLevel(logging.DEBUG)
-        logfile_handler = logging.FileHandler(self.logfile_path)
-        fmt = logging.Formatter('%(asctime)s | %(message)s')
-        logfile_handler.setFormatter(fmt)
-        self.logger.addHandler(logfile_handler)
-        # import snmp settings
+        # logger configuration. The file handlers of the subscriptions are added to it
+        self.logger = worker_logger(profile['dut'])
+        self.init_subscriptions()
+        self.init_metrics()
+        self.init_health()
+        self.answered = False  # | whether a request of the current iteration was answered, and
+        self.timed_out = False # | whether one timed out
+        # import snmp settings. The configuration file is parsed once per process
         try:
-            with open(f"{mainDir}/config/snmp_monitor.json", 'r') as file:
-                json_data = json_load(file)
+            json_data = monitor_utils.load_config('snmp_monitor')
         except decoder.JSONDecodeError as e:
             self.logger.info(f"CRITICAL : SNMP-MONITOR : __init__() - Failed to parse snmp_monitor.json: {e}.\n")
             self.stop()
@@ -42,37 +46,175 @@ class snmp_monitor(Thread):
         self.item_list = list(set(profile['items'])) # can contain either OIDs or MIBs. The conversion is done to remove duplicate items
         self.iteration_number = 1 # the index of the iteration
         self.utility = profile['utility']
+        # the iterations are started by the scheduler, at fixed-rate deadlines
+        self.busy = False
+        self.missed_iterations = 0 # the iterations skipped because the previous one overran the interval
+        self.reported_missed_iterations = 0
         # stop mechanism
         self.thread_sleep = Event()
         self.stopped = Event()   # | these two work the thread stop mechanism
         self.stop_thread = False # |
         self.daemon = True
-        # end thread processing
-        self.statistics = {item: compile("\s\s[0-9]+\s") for item in profile['statistics']} if 'statistics' in profile else {}
-        self.detect_crashes = {profile['detect_crashes']: compile("\s\s[0-9]+\s")} if 'detect_crashes' in profile else {}
-        self.check_values_change = {item: compile("\s\s.+\s") for item in profile['check_values_change']} if 'check_values_change' in profile else {}
         # configure the snmp session
-        snmp_settings = json_data[profile['snmp_settings']] if 'snmp_settings' in profile else json_data['default_settings']
+        snmp_settings = dict(json_data[profile['snmp_settings']] if 'snmp_settings' in profile else json_data['default_settings'])
+        # the maximum number of varbinds packed in a single GET request. It is not a netsnmp session setting
+        self.max_varbinds = max(int(snmp_settings.pop('MaxVarbinds', 1)), 1)
+        # the number of rows of a GETBULK request of the table walks. It is not a netsnmp session setting either
+        self.max_repetitions = max(int(snmp_settings.pop('MaxRepetitions', MAX_REPETITIONS)), 1)
+        self.bulk = snmp_settings.get('Version') != 1
         self.snmp_session = Session(DestHost=self.profile['dut'], **snmp_settings)
+        # the tables walked in each iteration
+        self.oid_names = OID_NAMES | json_data.get('oid_names', {})
+        self.table_oids = {}
+        self.set_tables(profile.get('tables', []))
+        self.table_rows = table_rows()
+
+    def set_items(self, items: list) -> None:
+        self.item_list = list(set(items))
+
+    def set_tables(self, tables: list) -> None:
+        for table in tables:
+            if table not in self.table_oids:
+                try:
+                    self.table_oids[table] = resolve_oid(table, self.oid_names)
+                except ValueError as e:
+                    self.table_oids[table] = e # logged as the query result of the table in every iteration
+        self.table_list = list(dict.fromkeys(tables))
 
     def snmp_querier(self):
         '''
-        This method snmp queries the DUT, and updates self.results with the retrieved data.
+        This method snmp queries the DUT, and publishes the retrieved data to the subscriptions.
+        '''
+        results = []
+        item_list, table_list = self.due_items(self.item_list), self.due_items(self.table_list)
+        if self.health.state == DOWN:
+            # a single probe stands in for the iteration of a DUT which is down
+            if not self.health.polling_due(monotonic()) or not self.probe():
+                self.skip_iteration(item_list + table_list)
+                return
+        self.answered, self.timed_out = False, False
+        # the items are packed in GET requests of at most self.max_varbinds varbinds. Only the due items are polled
+        for chunk_start in range(0, len(item_list), self.max_varbinds):
+            results.extend(self.get_items(item_list[chunk_start:chunk_start + self.max_varbinds]))
+        for table in table_list:
+            results.extend(self.walk_table(table))
+        self._health_hlp(self.answered)
+        self.publish(results)
+
+    def probe(self) -> bool:
+        '''Probes a DUT which is down with a single GET. Returns True, and the DUT is healthy again, if it answered.'''
+
+        try:
+            self.snmp_session.get(VarList(Varbind(PROBE_OID)))
+            answered = not is_timeout(self.snmp_session.ErrorStr)
+        except Exception:
+            answered = False
+        self._health_hlp(answered)
+        return answered
+
+    def _health_hlp(self, answered: bool) -> None:
+        '''Helper method. Records whether the DUT answered and logs the changes of its health.'''
+
+        change = self.record_health(answered)
+        if change:
+            self.logger.info(f"{'INFO' if answered else 'ERROR'} : SNMP-MONITOR : snmp_querier() - {change}")
+
+    def get_items(self, items: list) -> list:
         '''
-        self.logger.info(50*'#' + f" Iteration number #{self.iteration_number} started " + 50*'#')
-        for item in self.item_list:
+        Queries a list of items using a single GET request. If the DUT answers the request with an error status (e.g. tooBig,
+        or noSuchName in SNMPv1 PDUs), the items are split in two halves which are queried separately, down to one item per request.
+        Returns a list of (item, logfile_message) tuples, one for each item, in the order of the items.
+        The items are not queried if a previous request of the iteration timed out.
+        '''
+        if self.timed_out:
+            return [(item, unreachable_message(item)) for item in items]
+        start = perf_counter()
+        try:
+            values = self.snmp_session.get(VarList(*items))
+            error, status = self.snmp_session.ErrorStr, self.snmp_session.ErrorNum
+            # an error status is an answer of the DUT
+            self.answered = self.answered or not error or status > 0
+        except Exception as e:
+            values, error, status = None, str(e), 0
+        self.metrics.observe_request(items, perf_counter() - start)
+
+        # a timeout ends the queries of the iteration: the DUT didn't answer, the remaining requests are not sent.
+        # Only the error statuses of the PDU are retried in halves: an exception would fail the same way
+        if error and is_timeout(error):
+            self.timed_out = True
+        elif len(items) > 1 and error and status > 0:
+            self.metrics.count('request_splits')
+            half = len(items) // 2
+            return self.get_items(items[:half]) + self.get_items(items[half:])
+
+        messages = []
+        for index, item in enumerate(items):
+            try:
+                if error:
+                    raise Exception(error)
+                result = str(values[index], 'UTF-8')
+                messages.append((item, f'ITEM: {item} query result:  {result.rstrip()}'))
+            except Exception as e:
+                messages.append((item, f'ITEM: {item} query result: ERROR: {str(e).rstrip()}'))
+        return messages
+
+    def walk_table(self, table: str) -> list:
+        '''
+        Walks a table (or subtree) with GETBULK requests of max_repetitions rows (GETNEXT with SNMPv1), from its root
+        to the first OID outside of it. Returns a list of (row_item, logfile_message) tuples, one for each row, or
+        [(table, error_message)] if the walk failed. The rows that appeared or disappeared since the previous walk are logged.
+        '''
+        table_oid = self.table_oids[table]
+        if isinstance(table_oid, Exception):
+            return [(table, f'ITEM: {table} query result: ERROR: {table_oid}')]
+        if self.timed_out:
+            return [(table, unreachable_message(table))]
+        messages, oid, last_key, done = [], table_oid, oid_key(table_oid), False
+        while not done:
+            varlist = VarList(Varbind(oid))
+            start = perf_counter()
             try:
-                result = str(self.snmp_session.get(VarList(item))[0], 'UTF-8')
-                self.logger.info(f'ITEM: {item} query result:  {result.rstrip()}')
+                if self.bulk:
+                    self.snmp_session.getbulk(0, self.max_repetitions, varlist)
+                else:
+                    self.snmp_session.getnext(varlist)
+                # noSuchName is the end of the MIB view of a SNMPv1 agent
+                error = self.snmp_session.ErrorStr if self.snmp_session.ErrorNum != 2 else None
             except Exception as e:
-                self.logger.info(f'ITEM: {item} query result: ERROR: {str(e).rstrip()}')
-        self.logger.info(129*'#' + 3*'\n')
+                error = str(e)
+            self.metrics.observe_request([table], perf_counter() - start)
+            if error and is_timeout(error):
+                self.timed_out = True
+            else:
+                self.answered = True
+            if error:
+                self.logger.info(f"ERROR : SNMP-MONITOR : walk_table() - The walk of table {table} failed after {len(messages)} row(s): {error}")
+                return [(table, f'ITEM: {table} query result: ERROR: {error}')]
+            done = not varlist or self.snmp_session.ErrorNum == 2
+            for var in varlist if not done else []:
+                # the varbinds of the response are numeric (UseNumeric): <tag>.<iid>
+                row_oid = '.' + '.'.join(part.strip('.') for part in (var.tag, var.iid) if part)
+                # the walk ends at the first OID outside of the table, and at an agent returning OIDs out of order
+                if var.type == 'ENDOFMIBVIEW' or not row_oid.startswith(table_oid + '.') or oid_key(row_oid) <= last_key:
+                    done = True
+                    break
+                item = row_item(table, table_oid, row_oid)
+                try:
+                    messages.append((item, f"ITEM: {item} query result:  {str(var.val, 'UTF-8').rstrip()}"))
+                except Exception as e:
+                    messages.append((item, f'ITEM: {item} query result: ERROR: {str(e).rstrip()}'))
+                oid, last_key = row_oid, oid_key(row_oid)
+        changes = self.table_rows.update(table, [item for item, _ in messages])
+        if changes:
+            self.logger.info(f"WARNING : SNMP-MONITOR : walk_table() - {changes}")
+        return messages
 
     def run(self):
         self.logger.info(f"INFO : SNMP-MONITOR : run() - Thread operation started.\n\n\n")
-        if not self.endtime:
-            self.logger.info(f"WARNING : SNMP-MONITOR : run() - A time limit for the monitoring process was not set.\n")
+        scheduler.add(self)
         while True:
+            self.thread_sleep.wait()
+            self.thread_sleep.clear()
             if self.endtime:
                 if not self.endtime > datetime.now():
                     self.logger.info(f"INFO : SNMP-MONITOR : run() - Thread finished execution. Time limit reached.")
@@ -80,29 +222,27 @@ class snmp_monitor(Thread):
             if self.stop_thread:
                 self.logger.info(f"WARNING : SNMP-MONITOR : run() - Thread stopped ahead of time due to a call to stop().")
                 break
+            if self.missed_iterations > self.reported_missed_iterations:
+                self.logger.info(f"WARNING : SNMP-MONITOR : run() - The previous iteration overran the interval. "
+                                 f"{self.missed_iterations - self.reported_missed_iterations} iteration(s) skipped.")
+                self.reported_missed_iterations = self.missed_iterations
+            self.busy = True
+            start = perf_counter()
             self.snmp_querier()
+            self.metrics.observe_iteration(perf_counter() - start)
             print(f'I am working. Iteration number {self.iteration_number}')
             self.iteration_number += 1
-            self.thread_sleep.wait(timeout=self.profile['interval'])
-        self.end_thread_processing()
+            self.busy = False
+        scheduler.remove(self)
+        self.end_subscriptions()
         self.stopped.set()
 
-    def end_thread_processing(self):
-        parse_items = {}
-        parse_items.update(self.check_values_change)
-        parse_items.update(self.statistics)
-        parse_items.update(self.detect_crashes)
-        utils = monitor_utils(parse_item = parse_items)
-        utils.parse_logfile(logfile_path=self.logfile_path, worker_type='SNMP_MONITOR')
-        if self.statistics:
-            utils.generate_statistics(logfile_path=self.logfile_path, item_list = self.profile['statistics'],
-                                      worker_type='SNMP_MONITOR')
-        if self.detect_crashes:
-            utils.crash_detector(logfile_path=self.logfile_path, uptime_item=self.profile['detect_crashes'],
-                                 worker_type='SNMP_MONITOR')
-        if self.check_values_change:
-            utils.get_item_value_change(logfile_path=self.logfile_path, item_list=self.profile['check_values_change'],
-                                        worker_type='SNMP_MONITOR')
+    def tick(self) -> None:
+        '''Called by the scheduler at each deadline. Starts an iteration, unless the previous one is still running.'''
+        if self.busy:
+            self.missed_iterations += 1
+        else:
+            self.thread_sleep.set()
 
     def stop(self):
         self.logger.info(f"INFO : SNMP-MONITOR : stop() - Thread stop command received.")
@@ -111,8 +251,8 @@ class snmp_monitor(Thread):
     # the stop mechanism of a worker, works in three steps:
     # 1. a worker is stopped by calling its stop() method. The stop method:
     #    - sets stop_thread attribute to true, which breaks the while loop ahead of time.
-    #    - sets the event thread_sleep: - the run function waits for this event to be set with a timeout of self.profile['interval']. Usually
-    #                                     this event is not set, the run() function waits the timeout interval, after which a new iteration will begin.
-    #                                   - when the thread_sleep event is set, thread_sleep.wait() resolves and a new iteration is forced before the waiting interval
+    #    - sets the event thread_sleep: - the run function waits for this event to be set. Usually it is set by the scheduler at the deadline
+    #                                     of the next iteration (see tick()).
+    #                                   - when stop() sets it, thread_sleep.wait() resolves and a new iteration is forced before the deadline
     # 2. So, stop_thread is set to True, thread_sleep is set() which forces a new iteration which will break the loop due to the condition based on stop thread.
     # 3. when run() ends, it set() the 'stopped' event. When this event is set, it tells stop_workers() that the thread really stopped and didn't hang
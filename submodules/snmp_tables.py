@@ -0,0 +1,81 @@
+'''
+    The OID names known without MIB files and the helpers of the SNMP table walks (profile key 'tables').
+    A table (or any subtree) is walked with GETBULK requests (GETNEXT with SNMPv1), and each returned row is an item of its own,
+    named after the root of the walk and the row's OID suffix: the root 'ifHCInOctets' gives the items 'ifHCInOctets.1', 'ifHCInOctets.2', ...
+'''
+
+# MIB object names that can be used without MIB files. Any other object must be given numerically or
+# added to the 'oid_names' section of snmp_monitor.json
+OID_NAMES = {'sysDescr': '.1.3.6.1.2.1.1.1', 'sysObjectID': '.1.3.6.1.2.1.1.2', 'sysUpTime': '.1.3.6.1.2.1.1.3',
+             'sysContact': '.1.3.6.1.2.1.1.4', 'sysName': '.1.3.6.1.2.1.1.5', 'sysLocation': '.1.3.6.1.2.1.1.6',
+             'sysServices': '.1.3.6.1.2.1.1.7', 'ifNumber': '.1.3.6.1.2.1.2.1',
+             # IF-MIB tables and columns, walked by the 'tables' of the profiles
+             'ifTable': '.1.3.6.1.2.1.2.2', 'ifDescr': '.1.3.6.1.2.1.2.2.1.2', 'ifSpeed': '.1.3.6.1.2.1.2.2.1.5',
+             'ifAdminStatus': '.1.3.6.1.2.1.2.2.1.7', 'ifOperStatus': '.1.3.6.1.2.1.2.2.1.8',
+             'ifInOctets': '.1.3.6.1.2.1.2.2.1.10', 'ifInDiscards': '.1.3.6.1.2.1.2.2.1.13', 'ifInErrors': '.1.3.6.1.2.1.2.2.1.14',
+             'ifOutOctets': '.1.3.6.1.2.1.2.2.1.16', 'ifOutDiscards': '.1.3.6.1.2.1.2.2.1.19', 'ifOutErrors': '.1.3.6.1.2.1.2.2.1.20',
+             'ifXTable': '.1.3.6.1.2.1.31.1.1', 'ifName': '.1.3.6.1.2.1.31.1.1.1.1', 'ifHCInOctets': '.1.3.6.1.2.1.31.1.1.1.6',
+             'ifHCOutOctets': '.1.3.6.1.2.1.31.1.1.1.10', 'ifHighSpeed': '.1.3.6.1.2.1.31.1.1.1.15'}
+
+# the maximum number of rows returned by a GETBULK request, unless the SNMP settings have 'MaxRepetitions'
+MAX_REPETITIONS = 25
+
+
+def resolve_oid(item: str, oid_names: dict) -> str:
+    '''Returns the numeric OID of an item given as numeric OID ('.1.3.6.1.2.1.1.3.0') or as <name>.<instance> ('sysUpTime.0').'''
+
+    if all(arc.isdigit() for arc in item.strip('.').split('.')):
+        return '.' + item.strip('.')
+    name, _, instance = item.partition('.')
+    if name not in oid_names:
+        raise ValueError(f'Unknown Object Identifier: {item}')
+    return f"{oid_names[name]}.{instance}" if instance else oid_names[name]
+
+
+def oid_key(oid: str) -> tuple:
+    '''Returns the arcs of a numeric OID, which sort the OIDs in the lexicographic order of the agents.'''
+
+    return tuple(int(arc) for arc in oid.strip('.').split('.'))
+
+
+def row_item(table: str, table_oid: str, oid: str) -> str:
+    '''Returns the item name of a row of a walked table: the table's name followed by the OID suffix of the row.'''
+
+    return table + oid[len(table_oid):]
+
+
+def table_of(row: str, tables) -> str:
+    '''Returns the table of a row item, or None if the item is not a row of any of the tables.'''
+
+    for table in tables:
+        if row.startswith(table + '.'):
+            return table
+    return None
+
+
+class table_rows():
+    '''
+        The rows returned by the last walk of each table of a worker, to report the rows that appear or disappear
+        between iterations (e.g. a module plugged in, a LAG created).
+    '''
+
+    def __init__(self) -> None:
+
+        self.rows = {} # {table: set of row items}
+
+    def update(self, table: str, rows: list) -> str:
+        '''Records the rows of a walk. Returns the description of the rows that appeared or disappeared since the
+        previous walk of the table, or None if they are the same or if it is the first walk.'''
+
+        current, previous = set(rows), self.rows.get(table)
+        self.rows[table] = current
+        if previous is None or previous == current:
+            return None
+        added = [row for row in rows if row not in previous]
+        removed = sorted(previous - current)
+        changes = []
+        if added:
+            changes.append(f"{len(added)} new row(s): {', '.join(added)}")
+        if removed:
+            changes.append(f"{len(removed)} row(s) disappeared: {', '.join(removed)}")
+        return f"Table {table}: {'; '.join(changes)}"
@@ -0,0 +1,241 @@
+from datetime import datetime
+from bisect import insort
+from monitor_utils import monitor_utils
+
+
+class p2_quantile():
+    '''
+        Bounded-memory quantile estimator (the P-square algorithm of Jain & Chlamtac).
+        It keeps five markers whatever the number of observed values. Until five values are observed,
+        the quantile is computed exactly.
+    '''
+
+    def __init__(self, p: float) -> None:
+
+        self.p = p
+        self.heights = []                            # marker heights (the estimated quantiles)
+        self.positions = [0, 1, 2, 3, 4]             # actual marker positions
+        self.desired = [0, 2*p, 4*p, 2 + 2*p, 4]     # desired marker positions
+        self.increments = [0, p/2, p, (1 + p)/2, 1]  # desired position increments
+
+    def update(self, x) -> None:
+
+        heights = self.heights
+        if len(heights) < 5:
+            insort(heights, x)
+            return
+
+        # find the cell k the new value falls in and adjust the extreme markers if needed
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # adjust the heights of the middle markers if they are off their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        '''Helper method. Piecewise-parabolic prediction of the height of marker i moved by d positions.'''
+
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                                                   (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        '''Returns the current estimation of the quantile, or None if no value was observed.'''
+
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return self.heights[round(self.p * (len(self.heights) - 1))]
+        return self.heights[2]
+
+
+class item_accumulator():
+    '''
+        Online statistics of a single monitored item. The accumulator is fed with each value as it is retrieved by a worker,
+        so the statistics are available at any time without parsing the logfile.
+        Memory usage is bounded: the value-frequency counter used for the mode (and the exact median) tracks at most
+        'max_distinct' values. When more distinct values are observed, the counter turns into a space-saving heavy hitters
+        summary and the median is taken from the P-square estimator.
+    '''
+
+    def __init__(self, quantiles: tuple = (0.5,), max_distinct: int = 4096) -> None:
+
+        self.count = 0
+        self.total = 0           # integral sum, so the mean is computed exactly
+        self.minimum = None      # (value, timestamp the value was first recorded at)
+        self.maximum = None      # (value, timestamp the value was first recorded at)
+        self.frequencies = {}    # {value: count}, in the order the values were first recorded
+        self.max_distinct = max_distinct
+        self.approximate = False # True once 'frequencies' overflowed 'max_distinct'
+        self.invalid = None      # the first value that is not integral. Once set, the item is not accumulated anymore
+        # the median is always estimated, it is needed once the frequency counter stops being exact
+        self.quantiles = {p: p2_quantile(p) for p in (0.5, *quantiles)}
+
+    def update(self, value: str, timestamp: float) -> None:
+        '''
+        Accumulates one value of the item.
+        :value: the value as retrieved from the DUT (e.g. '  100 '). It must be integral.
+        :timestamp: epoch timestamp of the moment the value was retrieved.
+        '''
+
+        if self.invalid is not None:
+            return
+        try:
+            value = int(value)
+        except ValueError:
+            self.invalid = value
+            return
+
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum[0]:
+            self.minimum = (value, timestamp)
+        if self.maximum is None or value > self.maximum[0]:
+            self.maximum = (value, timestamp)
+        for estimator in self.quantiles.values():
+            estimator.update(value)
+        self._count_value_hlp(value)
+
+    def _count_value_hlp(self, value: int) -> None:
+        '''Helper method. Updates the value-frequency counter.'''
+
+        frequencies = self.frequencies
+        if value in frequencies:
+            frequencies[value] += 1
+        elif len(frequencies) < self.max_distinct:
+            frequencies[value] = 1
+        else:
+            # space-saving: the least frequent value is replaced by the new one, which inherits its count
+            self.approximate = True
+            evicted = min(frequencies, key=frequencies.get)
+            frequencies[value] = frequencies.pop(evicted) + 1
+
+    def mean(self):
+        '''Same result as statistics.mean() over the accumulated values.'''
+
+        if not self.count:
+            return None
+        quotient, remainder = divmod(self.total, self.count)
+        return quotient if not remainder else self.total / self.count
+
+    def median(self):
+        '''
+        Same result as statistics.median() over the accumulated values, as long as the frequency counter is exact.
+        Afterwards, the P-square estimation of the median is returned.
+        '''
+
+        if not self.count:
+            return None
+        if self.approximate:
+            return self.quantile(0.5)
+        middle = self.count // 2
+        seen = 0
+        lower = None
+        for value in sorted(self.frequencies):
+            seen += self.frequencies[value]
+            if self.count % 2 and seen > middle:
+                return value
+            if not self.count % 2:
+                if lower is None and seen >= middle:
+                    lower = value
+                if seen > middle:
+                    return (lower + value) / 2
+
+    def quantile(self, p: float):
+        '''Returns the estimation of the quantile p, or None if the quantile was not requested at instantiation.'''
+
+        return self.quantiles[p].value() if p in self.quantiles else None
+
+    def multimode(self) -> list:
+        '''Same result as statistics.multimode() over the accumulated values, as long as the frequency counter is exact.'''
+
+        if not self.frequencies:
+            return []
+        top = max(self.frequencies.values())
+        return [value for value, count in self.frequencies.items() if count == top]
+
+    def snapshot(self) -> dict:
+        '''Returns the current statistics of the item.'''
+
+        if self.invalid is not None or not self.count:
+            return {'count': self.count, 'invalid': self.invalid}
+        return {'count': self.count,
+                'minimum': (self.minimum[0], format_timestamp(self.minimum[1])),
+                'maximum': (self.maximum[0], format_timestamp(self.maximum[1])),
+                'mean': self.mean(),
+                'median': self.median(),
+                'quantiles': {p: estimator.value() for p, estimator in self.quantiles.items()},
+                'most_common': self.multimode(),
+                'approximate': self.approximate}
+
+
+class crash_tracker():
+    '''
+        Online crash detection on the uptime item of a DUT, with the same rule as monitor_utils.crash_detector():
+        a crash occurred if the uptime grew less than the time elapsed since the last successful iteration (minus 1 second).
+        Only the last successful sample is kept.
+    '''
+
+    def __init__(self, pattern, uptime_type: str = None) -> None:
+        '''
+        :pattern: the compiled pattern that extracts the uptime value from the logfile message of the item
+        :uptime_type: the format of the uptime values: None (timeticks) or 'timestring' (e.g. 0 days, 0:0:0)
+        '''
+        self.pattern = pattern
+        self.uptime_type = uptime_type
+        self.last_successful = None # (iteration, monotonic timestamp, uptime in seconds)
+
+    def update(self, iteration: int, message: str, timestamp: float):
+        '''
+        Checks the uptime retrieved in an iteration.
+        :message: the logfile message of the uptime item
+        :timestamp: the monotonic time of the iteration
+        Returns None, or a dictionary describing the crash: iteration, expected_uptime, uptime, last_successful_iteration.
+        '''
+        val = self.pattern.search(message + '\n')
+        if not val:
+            return None # the uptime could not be retrieved in this iteration
+        try:
+            if self.uptime_type == 'timestring':
+                uptime = monitor_utils._timestring_to_seconds_hlp(val.group(0))
+            else:
+                uptime = int(val.group(0)) / 100 # SNMP timeticks
+        except (ValueError, IndexError):
+            return None
+
+        crash = None
+        if self.last_successful:
+            expected_uptime = self.last_successful[2] + (timestamp - self.last_successful[1]) - 1
+            if uptime < expected_uptime:
+                crash = {'iteration': iteration, 'expected_uptime': expected_uptime, 'uptime': uptime,
+                         'last_successful_iteration': self.last_successful[0]}
+        self.last_successful = (iteration, timestamp, uptime)
+        return crash
+
+
+def format_timestamp(timestamp: float) -> str:
+    '''Formats an epoch timestamp the same way the logfile timestamps are parsed: YYYY-MM-DD HH:MM:SS'''
+
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
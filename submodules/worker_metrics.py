@@ -0,0 +1,178 @@
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from time import time
+from dut_health import HEALTHY, STATES
+
+# the upper bounds of the latency histogram buckets, in seconds. The last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class latency_histogram():
+    '''
+        Fixed-bucket histogram of durations, in seconds. An observation is a bisection and two additions,
+        so it can be done for every request without slowing the polling down.
+    '''
+
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self) -> None:
+
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1) # the count of each bucket, not cumulative
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def snapshot(self) -> dict:
+        '''Returns {'count', 'sum', 'buckets': [(upper_bound, cumulative_count), ...]}, the last upper bound being inf.'''
+
+        buckets, cumulative = [], 0
+        for upper_bound, count in zip(LATENCY_BUCKETS + (float('inf'),), self.counts):
+            cumulative += count
+            buckets.append((upper_bound, cumulative))
+        return {'count': cumulative, 'sum': self.sum, 'buckets': buckets}
+
+
+class worker_metrics():
+    '''
+        The self-instrumentation of a polling worker: the latency histogram of the requests of each item (the SNMP GET or
+        the CLI command that retrieved it), the duration histogram of the iterations and counters (item errors,
+        reconnects, retries, ...). The metrics are updated by the worker and read with snapshot() from any thread.
+    '''
+
+    def __init__(self, dut: str, utility: str) -> None:
+
+        self.dut = dut
+        self.utility = utility
+        self.lock = Lock()
+        self.requests = {}    # {item: latency_histogram}
+        self.iterations = latency_histogram()
+        self.counters = {}    # {name: count}
+        self.start_time = time()
+
+    def observe_request(self, items: list, seconds: float) -> None:
+        '''Records the latency of a request, for each of the items it retrieved.'''
+
+        with self.lock:
+            for item in items:
+                histogram = self.requests.get(item)
+                if histogram is None:
+                    histogram = self.requests[item] = latency_histogram()
+                histogram.observe(seconds)
+
+    def observe_iteration(self, seconds: float) -> None:
+
+        with self.lock:
+            self.iterations.observe(seconds)
+
+    def count(self, name: str, increment: int = 1) -> None:
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + increment
+
+    def snapshot(self, missed_iterations: int = 0, health: str = HEALTHY) -> dict:
+        '''
+        Returns the metrics as a dictionary:
+        {'dut', 'utility', 'uptime', 'health', 'missed_iterations', 'counters': {name: count}, 'iterations': histogram,
+         'requests': {item: histogram}}. The histograms are in the format of latency_histogram.snapshot(), the health is
+        the state of the DUT (see dut_health).
+        '''
+        with self.lock:
+            return {'dut': self.dut, 'utility': self.utility, 'uptime': time() - self.start_time, 'health': health,
+                    'missed_iterations': missed_iterations, 'counters': dict(self.counters),
+                    'iterations': self.iterations.snapshot(),
+                    'requests': {item: histogram.snapshot() for item, histogram in self.requests.items()}}
+
+
+def _label_value_hlp(value: str) -> str:
+    '''Helper function. Escapes a label value of the OpenMetrics text format.'''
+
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines_hlp(name: str, labels: str, histogram: dict) -> list:
+    '''Helper function. Returns the _bucket, _count and _sum samples of a histogram snapshot.'''
+
+    lines = [f'{name}_bucket{{{labels},le="{"+Inf" if upper_bound == float("inf") else upper_bound}"}} {count}'
+             for upper_bound, count in histogram['buckets']]
+    lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram["sum"]}')
+    return lines
+
+
+def openmetrics_text(snapshots: list) -> str:
+    '''Formats worker_metrics snapshots in the OpenMetrics text exposition format.'''
+
+    request_lines, iteration_lines, missed_lines, health_lines, counter_lines = [], [], [], [], {}
+    for snapshot in snapshots:
+        labels = f'dut="{_label_value_hlp(snapshot["dut"])}",utility="{_label_value_hlp(snapshot["utility"])}"'
+        for item, histogram in sorted(snapshot['requests'].items()):
+            request_lines += _histogram_lines_hlp('dut_monitor_request_duration_seconds', f'{labels},item="{_label_value_hlp(item)}"', histogram)
+        iteration_lines += _histogram_lines_hlp('dut_monitor_iteration_duration_seconds', labels, snapshot['iterations'])
+        missed_lines.append(f'dut_monitor_missed_iterations_total{{{labels}}} {snapshot["missed_iterations"]}')
+        health_lines += [f'dut_monitor_dut_health{{{labels},dut_monitor_dut_health="{state}"}} {int(snapshot.get("health", HEALTHY) == state)}'
+                         for state in STATES]
+        for name, count in snapshot['counters'].items():
+            counter_lines.setdefault(name, []).append(f'dut_monitor_{name}_total{{{labels}}} {count}')
+
+    lines = ['# TYPE dut_monitor_request_duration_seconds histogram',
+             '# UNIT dut_monitor_request_duration_seconds seconds',
+             '# HELP dut_monitor_request_duration_seconds Duration of the requests (SNMP GET, CLI command) that retrieved an item.']
+    lines += request_lines
+    lines += ['# TYPE dut_monitor_iteration_duration_seconds histogram',
+              '# UNIT dut_monitor_iteration_duration_seconds seconds',
+              '# HELP dut_monitor_iteration_duration_seconds Duration of the polling iterations.']
+    lines += iteration_lines
+    lines += ['# TYPE dut_monitor_missed_iterations counter',
+              '# HELP dut_monitor_missed_iterations Iterations skipped because the previous one overran the interval.']
+    lines += missed_lines
+    lines += ['# TYPE dut_monitor_dut_health stateset',
+              '# HELP dut_monitor_dut_health Health of the DUT: healthy, degraded (unanswered iteration) or down (probed only).']
+    lines += health_lines
+    for name in sorted(counter_lines):
+        lines += [f'# TYPE dut_monitor_{name} counter']
+        lines += counter_lines[name]
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+class metrics_server():
+    '''
+        Minimal HTTP server exposing the metrics in the OpenMetrics text format at /metrics, in a daemon thread.
+        :collect: a callable returning the list of worker_metrics snapshots to expose
+    '''
+
+    CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+    def __init__(self, collect, host: str = '127.0.0.1', port: int = 9464) -> None:
+
+        content_type = self.CONTENT_TYPE
+
+        class handler(BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = openmetrics_text(collect()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass # the requests are not logged to stderr
+
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self.thread = Thread(target=self.server.serve_forever, name='metrics_server', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()